@@ -4,9 +4,28 @@ from . import proto
 from . import constants
 from . import channel
 from . import capability
-from .rticlient import RTIClient, DispatchMode
+from . import wire
+from . import deadreckoning
+from .rticlient import RTIClient, DispatchMode, DropPolicy
+from .lazymessage import LazyMessage
+from .measurementarrays import MeasurementArrays
+from .paralleldispatch import DispatchOrdering, DispatchPriority
 Client = RTIClient
 from .rtiruntimecontrol import RTIRuntimeControl, StepGrant
 RuntimeControl = RTIRuntimeControl
 from .rticommand import RTICommand
 Command = RTICommand
+from .rtipublisher import RTIPublisher
+Publisher = RTIPublisher
+from .rtideadreckoning import RTIDeadReckoningPublisher
+DeadReckoningPublisher = RTIDeadReckoningPublisher
+from .rtientitystore import RTIEntityStore
+EntityStore = RTIEntityStore
+from .rtientitydelta import RTIEntityDeltaPublisher
+EntityDeltaPublisher = RTIEntityDeltaPublisher
+from .rtispatialindex import RTISpatialIndex, AreaOfInterest
+SpatialIndex = RTISpatialIndex
+from .rtipositiontracker import RTIPositionTracker, PositionArrays
+PositionTracker = RTIPositionTracker
+from .asyncrticlient import AsyncRTIClient
+AsyncClient = AsyncRTIClient
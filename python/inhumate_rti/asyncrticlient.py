@@ -0,0 +1,329 @@
+# Asyncio-native variant of RTIClient
+#
+# Example usage:
+# async def main():
+#     rti = AsyncRTIClient(application="Async App")
+#     await rti.connect()
+#     async with rti.subscribe(Channel.position, Proto.EntityPosition) as positions:
+#         async for position in positions:
+#             ...
+#     await rti.publish("hello", message)
+#     response = await rti.execute_command("reset", client_id=other_client_id)
+#     await rti.disconnect()
+
+import asyncio
+from inspect import iscoroutinefunction
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional, Tuple, Type, Union
+from uuid import uuid4
+
+from google.protobuf import message as _message
+
+from . import proto as Proto, channel as Channel
+from .rticlient import RTIClient
+from .measurementarrays import MeasurementArrays, MeasurementArraysBuilder
+from .asyncrtisocketclusterclient import AsyncRTISocketClusterClient
+
+_CLOSED = object()
+
+
+class _AsyncRTIClientCore(RTIClient):
+    """RTIClient running on an AsyncRTISocketClusterClient. Publishing only queues frames
+    on the event loop, so the regular (synchronous) client logic never blocks it."""
+
+    def _create_socket(self, url, main_loop, main_loop_idle_time):
+        return AsyncRTISocketClusterClient(url, self.max_message_size_bytes, self.binary_transport)
+
+    def connect(self):
+        raise RuntimeError("Use 'await AsyncRTIClient.connect()'")
+
+    def wait_until_connected(self):
+        raise RuntimeError("Use 'await AsyncRTIClient.wait_until_connected()'")
+
+
+class AsyncSubscription:
+    """Async iterator over the messages received on a channel. Use as an async context
+    manager, or call close(), to unsubscribe."""
+
+    def __init__(self, rti: "AsyncRTIClient", channel_name: str, max_queue_size: int = 0):
+        self.rti = rti
+        self.channel_name = channel_name
+        self.max_queue_size = max_queue_size
+        self.handler = None
+        self.closed = False
+        self._queue = asyncio.Queue()
+
+    def _put(self, content):
+        if self.closed:
+            return
+        if self.max_queue_size > 0 and self._queue.qsize() >= self.max_queue_size:
+            self._queue.get_nowait()
+            self.rti.emit("error", self.channel_name, Exception("RTI async subscription queue overflow"), None)
+        self._queue.put_nowait(content)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.handler is not None:
+                self.rti.unsubscribe(self.handler)
+            self._queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        content = await self._queue.get()
+        if content is _CLOSED:
+            raise StopAsyncIteration
+        return content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AsyncRTIClient:
+    """Asyncio-native RTI client. Same channel, federation and registration semantics
+    as RTIClient, but without a socket thread: the websocket runs on the event loop,
+    publishing is awaitable, subscriptions can be consumed as async iterators and
+    request/response calls resolve when the response arrives.
+
+    Attributes not defined here (client_id, known_clients, measure() etc) are those of
+    the underlying RTIClient, available as 'client' for use with synchronous helpers."""
+
+    def __init__(self, application: str = "Python", url: Optional[str] = None, **kwargs):
+        self.client = _AsyncRTIClientCore(application=application, url=url, connect=False, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    @property
+    def state(self):
+        return self.client.state
+
+    @state.setter
+    def state(self, state):
+        self.client.state = state
+
+    @property
+    def fast_time_mode(self):
+        return self.client.fast_time_mode
+
+    @fast_time_mode.setter
+    def fast_time_mode(self, fast_time_mode):
+        self.client.fast_time_mode = fast_time_mode
+
+    async def connect(self, timeout: float = 5):
+        if self.client.connected:
+            return
+        self.client._connection_error = None
+        self.client.socket.enable_reconnect = True
+        try:
+            await self.client.socket.connect()
+        except Exception as e:
+            self.client._connection_error = e
+            self.client.emit("error", "connection", e, None)
+            raise Exception(f"Connection failed: {e}") from e
+        await self.wait_until_connected(timeout)
+
+    async def wait_until_connected(self, timeout: float = 5):
+        if self.client.connected:
+            return
+        connected = asyncio.get_running_loop().create_future()
+
+        def on_connect():
+            if not connected.done():
+                connected.set_result(True)
+        self.client.on("connect", on_connect)
+        try:
+            await asyncio.wait_for(connected, timeout)
+        except asyncio.TimeoutError:
+            if self.client._connection_error:
+                raise Exception(f"Connection failed: {self.client._connection_error}")
+            raise Exception("Connection timeout")
+        finally:
+            self.client.off("connect", on_connect)
+
+    async def disconnect(self):
+        self.client.disconnect()
+        await self.client.socket.wait_closed()
+
+    async def drain(self):
+        """Flush batched publishes and wait until all queued frames have been written to the websocket."""
+        self.client.socket.flush()
+        await self.client.socket.drain()
+
+    async def publish(self, channel_name: str, message: _message.Message, register=True) -> None:
+        self.client.publish(channel_name, message, register)
+        await self.client.socket.drain()  # publishes held back by batching stay queued
+
+    async def publish_text(self, channel_name: str, content: str, register=True) -> None:
+        self.client.publish_text(channel_name, content, register)
+        await self.client.socket.drain()  # publishes held back by batching stay queued
+
+    async def publish_json(self, channel_name: str, message: object, register=True) -> None:
+        self.client.publish_json(channel_name, message, register)
+        await self.client.socket.drain()  # publishes held back by batching stay queued
+
+    def subscribe(self, channel_name: str, message_class: Type[_message.Message], handler: Optional[Callable] = None,
+                  register: bool = True, max_queue_size: int = 0, **kwargs):
+        """Subscribe to a protobuf channel. With a handler (plain or coroutine function),
+        works like RTIClient.subscribe (and takes the same keyword arguments).
+        Without one, returns an AsyncSubscription."""
+        return self._subscribe(lambda h: self.client.subscribe(channel_name, message_class, h, register, **kwargs),
+                               channel_name, handler, max_queue_size)
+
+    def subscribe_text(self, channel_name: str, handler: Optional[Callable] = None, register: bool = True,
+                       max_queue_size: int = 0):
+        return self._subscribe(lambda h: self.client.subscribe_text(channel_name, h, register),
+                               channel_name, handler, max_queue_size)
+
+    def subscribe_json(self, channel_name: str, handler: Optional[Callable] = None, register: bool = True,
+                       max_queue_size: int = 0):
+        return self._subscribe(lambda h: self.client.subscribe_json(channel_name, h, register),
+                               channel_name, handler, max_queue_size)
+
+    def _subscribe(self, subscribe, channel_name, handler, max_queue_size):
+        if handler is None:
+            subscription = AsyncSubscription(self, channel_name, max_queue_size)
+            subscription.handler = subscribe(subscription._put)
+            return subscription
+        if iscoroutinefunction(handler):
+            call = RTIClient._bind_handler(handler)
+
+            def handler(channel_name, content):
+                self._create_task(call(channel_name, content))
+        return subscribe(handler)
+
+    def _create_task(self, coroutine):
+        loop = self.client.socket.loop
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            task = loop.create_task(coroutine)
+        else:
+            # e.g. buffered dispatch flushed from another thread
+            task = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.client.emit("error", "async", task.exception(), None)
+
+    def unsubscribe(self, channel_name_or_handler: Union[str, Callable, AsyncSubscription]) -> None:
+        if isinstance(channel_name_or_handler, AsyncSubscription):
+            channel_name_or_handler.close()
+        else:
+            self.client.unsubscribe(channel_name_or_handler)
+
+    async def invoke(self, method: str, data=None, timeout: float = 5):
+        """Call a broker RPC method, returning its result or raising on error."""
+        result = asyncio.get_running_loop().create_future()
+
+        def on_result(data):
+            if not result.done():
+                result.set_result(data)
+
+        def on_error(error):
+            if not result.done():
+                result.set_exception(Exception(error))
+        self.client.invoke(method, data, on_result, on_error)
+        return await asyncio.wait_for(result, timeout)
+
+    async def verify_token(self, token: str, timeout: float = 5):
+        return await self.invoke("verifytoken", token, timeout)
+
+    async def execute_command(self, name: str, client_id: str = None, entity_id: str = None,
+                              transaction_id: str = None, wait: bool = False, timeout: float = 5, **kwargs):
+        """Execute a command, returning the CommandResponse (or None on timeout) when wait is true."""
+        message = Proto.Commands()
+        if wait and not transaction_id:
+            transaction_id = str(uuid4())
+        if transaction_id:
+            message.execute.transaction_id = transaction_id
+        message.execute.name = name
+        for key, value in kwargs.items():
+            message.execute.arguments[key] = str(value)
+        channel = Channel.commands
+        if entity_id:
+            channel += f"/{entity_id}"
+        if client_id:
+            channel = f"@{client_id}:{channel}"
+        if not wait:
+            await self.publish(channel, message)
+            return None
+
+        response = asyncio.get_running_loop().create_future()
+
+        def on_command(msg: Proto.Commands):
+            if msg.HasField("response") and msg.response.transaction_id == transaction_id and not response.done():
+                response.set_result(msg.response)
+        subscription = self.client.subscribe(channel, Proto.Commands, on_command)
+        try:
+            await self.publish(channel, message)
+            return await asyncio.wait_for(response, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.client.unsubscribe(subscription)
+
+    async def fetch_messages(self, channels: Union[str, Iterable[str]], from_time: float = 0, to_time: float = 0,
+                             message_class: Union[Type[_message.Message], Dict[str, Type[_message.Message]], None] = None,
+                             page_size: int = 1000, ids: Optional[Iterable[str]] = None, reverse: bool = False,
+                             per_channel: bool = False, per_id: bool = False, reference: bool = False,
+                             timeout: float = 10) -> AsyncIterator[Tuple[str, float, Union[_message.Message, str]]]:
+        """Like RTIClient.fetch_messages, as an async generator:
+        async for channel_name, time, message in rti.fetch_messages(...)"""
+        bundle = self.client._message_bundle_request(channels, from_time, to_time, page_size, ids, reverse, per_channel, per_id, reference)
+        async for response in self._fetch_bundle_pages(Channel.message_bundle, bundle, timeout):
+            for item in self.client._message_bundle_items(response, message_class, reverse):
+                yield item
+
+    async def fetch_measurement_arrays(self, measures: Union[str, Iterable[str], None] = None, from_time: float = 0, to_time: float = 0,
+                                       resolution: float = 0, clients: Optional[Iterable[str]] = None,
+                                       applications: Optional[Iterable[str]] = None, entities: Optional[Iterable[str]] = None,
+                                       page_size: int = 10000, reverse: bool = False, per_measure: bool = False,
+                                       reference: bool = False, timeout: float = 10) -> Dict[Tuple[str, str, str], MeasurementArrays]:
+        """Like RTIClient.fetch_measurement_arrays"""
+        builder = MeasurementArraysBuilder()
+        bundle = self.client._measurement_bundle_request(measures, from_time, to_time, resolution, clients, applications, entities, page_size, reverse, per_measure, reference)
+        async for response in self._fetch_bundle_pages(Channel.measurement_bundle, bundle, timeout):
+            builder.add(response)
+        return builder.build()
+
+    async def _fetch_bundle_pages(self, channel_name, bundle, timeout):
+        client = self.client
+        response_channel_prefix = f"{channel_name}/{uuid4()}/"
+
+        def request_page(offset):
+            response = asyncio.get_running_loop().create_future()
+            def on_response(message):
+                if not response.done(): response.set_result(message)
+            subscription = client._request_bundle_page(channel_name, bundle, offset, response_channel_prefix, on_response)
+            return offset, response, subscription
+
+        page = request_page(0)
+        try:
+            while page is not None:
+                offset, response, subscription = page
+                try:
+                    result = await asyncio.wait_for(response, timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"No response from recorder for {channel_name} request at offset {offset}")
+                finally:
+                    client.unsubscribe(subscription)
+                    page = None
+                next_offset = client._next_bundle_offset(bundle, result, offset)
+                if next_offset is not None:
+                    page = request_page(next_offset)
+                yield result
+        finally:
+            if page is not None:
+                client.unsubscribe(page[2])
@@ -0,0 +1,129 @@
+# Inhumate RTI python client - asyncio transport
+#
+# Reuses the SocketCluster protocol handling of RTISocketClusterClient, but runs the
+# websocket on an asyncio event loop (using the optional 'websockets' package)
+# instead of a dedicated thread.
+
+import asyncio
+import threading
+
+from .rtisocketclusterclient import RTISocketClusterClient
+
+try:
+    from websockets.asyncio.client import connect as websocket_connect
+    from websockets.exceptions import ConnectionClosed, WebSocketException
+except ImportError:
+    websocket_connect = None
+    ConnectionClosed = WebSocketException = Exception
+
+
+class AsyncWebSocket:
+    """Adapts an asyncio websocket connection to the send()/close() interface used by
+    RTISocketClusterClient. Frames are queued and written in order by a writer task,
+    so send() never blocks and may be called from any thread."""
+
+    def __init__(self, connection, loop):
+        self.connection = connection
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.queue = asyncio.Queue()
+        self.closed = False
+        self.writer = loop.create_task(self._write())
+
+    def send(self, data, opcode=None):
+        if self.closed:
+            raise ConnectionError("Connection is already closed")
+        if threading.get_ident() == self.thread_id:
+            self.queue.put_nowait(data)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, data)
+
+    def close(self, status=1000, reason=""):
+        if threading.get_ident() == self.thread_id:
+            self.loop.create_task(self.connection.close(status, reason))
+        else:
+            asyncio.run_coroutine_threadsafe(self.connection.close(status, reason), self.loop)
+
+    async def drain(self):
+        if not self.closed:
+            await self.queue.join()
+
+    def stop(self):
+        self.closed = True
+        self.writer.cancel()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+
+    async def _write(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                await self.connection.send(data)
+            except ConnectionClosed:
+                pass
+            finally:
+                self.queue.task_done()
+
+
+class AsyncRTISocketClusterClient(RTISocketClusterClient):
+    def __init__(self, url, max_message_size_bytes=16 * 1024 * 1024, binary=False, codec=None):
+        super().__init__(url, None, 0, max_message_size_bytes, binary, codec)
+        self.loop = None
+        self.reader = None
+
+    async def connect(self):
+        if websocket_connect is None:
+            raise ImportError("AsyncRTIClient requires the 'websockets' package (pip install inhumate-rti[async])")
+        self.loop = asyncio.get_running_loop()
+        connection = await websocket_connect(self.url, max_size=None)
+        self.ws = AsyncWebSocket(connection, self.loop)
+        self.reader = self.loop.create_task(self._read(self.ws))
+        self.on_open(self.ws)
+
+    async def _read(self, ws):
+        try:
+            async for message in ws.connection:
+                self.on_message(ws, message)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            self.on_error(ws, e)
+        finally:
+            ws.stop()
+            self.on_close(ws, None, None)
+
+    async def _reconnect(self):
+        while self.enable_reconnect:
+            await asyncio.sleep(self.reconnect_delay)
+            if not self.enable_reconnect:
+                break
+            try:
+                await self.connect()
+                break
+            except (OSError, WebSocketException) as e:
+                self.on_error(None, e)
+
+    def on_close(self, ws, status_code, message):
+        if self.on_disconnected is not None:
+            self.on_disconnected(self)
+        if self.enable_reconnect:
+            self.loop.create_task(self._reconnect())
+
+    async def drain(self):
+        """Wait until the frames sent so far have been written - publishes held back by batching
+        or coalescing are not flushed, call flush() first for that"""
+        if self.ws:
+            await self.ws.drain()
+
+    def connect_thread(self, *args, **kwargs):
+        raise RuntimeError("AsyncRTISocketClusterClient runs on the asyncio event loop, use connect()")
+
+    def disconnect(self):
+        self.enable_reconnect = False
+        if self.ws and not self.ws.closed:
+            self.ws.close()
+
+    async def wait_closed(self):
+        if self.reader:
+            await asyncio.gather(self.reader, return_exceptions=True)
@@ -10,6 +10,7 @@ clients = internal_prefix + "clients"
 scenarios = internal_prefix + "scenarios"
 entity_operation = internal_prefix + "entities"
 entity = internal_prefix + "entity"
+entity_delta = internal_prefix + "entitydelta"
 position = internal_prefix + "position"
 launch_configurations = internal_prefix + "launchconfigurations"
 launch_event = internal_prefix + "launch"
@@ -0,0 +1,117 @@
+# Dead reckoning - extrapolating an EntityPosition from its velocity, acceleration and angular velocity.
+#
+# EntityPosition uses a Unity style coordinate system: x east/right, y up, z north/forward.
+# velocity and acceleration are in the entity's own reference frame (forward, right, up),
+# rotated to world coordinates by euler_rotation if set, otherwise by local_rotation.
+# The orientation is assumed to be constant during the extrapolation, and the position follows
+# p + v t + a t^2 / 2 (like the DIS "FVW" algorithm). euler_rotation is extrapolated by angular_velocity.
+
+import math
+from typing import Tuple
+
+from . import proto as Proto
+
+EARTH_RADIUS = 6378137.0
+METERS_PER_DEGREE = math.radians(1) * EARTH_RADIUS
+
+Vector = Tuple[float, float, float]
+
+
+def euler_axes(roll: float, pitch: float, yaw: float) -> Tuple[Vector, Vector, Vector]:
+    """World (x, y, z) directions of the entity's forward, right and up axes, given euler angles in degrees"""
+    roll, pitch, yaw = math.radians(roll), math.radians(pitch), math.radians(yaw)
+    sin_roll, cos_roll = math.sin(roll), math.cos(roll)
+    sin_pitch, cos_pitch = math.sin(pitch), math.cos(pitch)
+    sin_yaw, cos_yaw = math.sin(yaw), math.cos(yaw)
+    forward = (sin_yaw * cos_pitch, sin_pitch, cos_yaw * cos_pitch)
+    level_right = (cos_yaw, 0.0, -sin_yaw)
+    level_up = (-sin_yaw * sin_pitch, cos_pitch, -cos_yaw * sin_pitch)
+    right = tuple(r * cos_roll - u * sin_roll for r, u in zip(level_right, level_up))
+    up = tuple(u * cos_roll + r * sin_roll for r, u in zip(level_right, level_up))
+    return forward, right, up
+
+
+def rotate(rotation: Proto.EntityPosition.LocalRotation, vector: Vector) -> Vector:
+    """Rotate a vector by a quaternion"""
+    qx, qy, qz, qw = rotation.x, rotation.y, rotation.z, rotation.w
+    vx, vy, vz = vector
+    # v + 2w (q x v) + 2 q x (q x v)
+    cx, cy, cz = qy * vz - qz * vy, qz * vx - qx * vz, qx * vy - qy * vx
+    return (vx + 2 * (qw * cx + qy * cz - qz * cy),
+            vy + 2 * (qw * cy + qz * cx - qx * cz),
+            vz + 2 * (qw * cz + qx * cy - qy * cx))
+
+
+def axes(position: Proto.EntityPosition) -> Tuple[Vector, Vector, Vector]:
+    """World directions of the forward, right and up axes of a position"""
+    if position.HasField("euler_rotation"):
+        euler = position.euler_rotation
+        return euler_axes(euler.roll, euler.pitch, euler.yaw)
+    if position.HasField("local_rotation"):
+        rotation = position.local_rotation
+        return rotate(rotation, (0.0, 0.0, 1.0)), rotate(rotation, (1.0, 0.0, 0.0)), rotate(rotation, (0.0, 1.0, 0.0))
+    return (0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)
+
+
+def displacement(position: Proto.EntityPosition, elapsed: float) -> Vector:
+    """World (x/east, y/up, z/north) displacement in meters after elapsed seconds"""
+    velocity, acceleration = position.velocity, position.acceleration
+    forward = velocity.forward * elapsed + 0.5 * acceleration.forward * elapsed * elapsed
+    right = velocity.right * elapsed + 0.5 * acceleration.right * elapsed * elapsed
+    up = velocity.up * elapsed + 0.5 * acceleration.up * elapsed * elapsed
+    if forward == 0 and right == 0 and up == 0:
+        return (0.0, 0.0, 0.0)
+    forward_axis, right_axis, up_axis = axes(position)
+    return tuple(forward * f + right * r + up * u for f, r, u in zip(forward_axis, right_axis, up_axis))
+
+
+def extrapolate(position: Proto.EntityPosition, elapsed: float) -> Proto.EntityPosition:
+    """A copy of the position, moved elapsed seconds ahead"""
+    result = Proto.EntityPosition()
+    result.CopyFrom(position)
+    if elapsed == 0: return result
+    dx, dy, dz = displacement(position, elapsed)
+    if position.HasField("local"):
+        result.local.x += dx
+        result.local.y += dy
+        result.local.z += dz
+    if position.HasField("geodetic"):
+        geodetic = result.geodetic
+        geodetic.latitude += dz / METERS_PER_DEGREE
+        geodetic.longitude += dx / (METERS_PER_DEGREE * max(math.cos(math.radians(geodetic.latitude)), 1e-6))
+        geodetic.altitude += dy
+    if position.HasField("euler_rotation") and position.HasField("angular_velocity"):
+        angular_velocity = position.angular_velocity
+        euler = result.euler_rotation
+        euler.roll += angular_velocity.roll * elapsed
+        euler.pitch += angular_velocity.pitch * elapsed
+        euler.yaw = (euler.yaw + angular_velocity.yaw * elapsed) % 360
+    return result
+
+
+def position_error(a: Proto.EntityPosition, b: Proto.EntityPosition) -> float:
+    """Distance in meters between two positions, by local coordinates if both have them, otherwise geodetic"""
+    if a.HasField("local") and b.HasField("local"):
+        return math.sqrt((a.local.x - b.local.x) ** 2 + (a.local.y - b.local.y) ** 2 + (a.local.z - b.local.z) ** 2)
+    if a.HasField("geodetic") and b.HasField("geodetic"):
+        north = (a.geodetic.latitude - b.geodetic.latitude) * METERS_PER_DEGREE
+        east = (a.geodetic.longitude - b.geodetic.longitude) * METERS_PER_DEGREE * math.cos(math.radians(a.geodetic.latitude))
+        return math.sqrt(north * north + east * east + (a.geodetic.altitude - b.geodetic.altitude) ** 2)
+    return math.inf if a.HasField("local") or a.HasField("geodetic") or b.HasField("local") or b.HasField("geodetic") else 0.0
+
+
+def _angle_difference(a: float, b: float) -> float:
+    return abs((a - b + 180) % 360 - 180)
+
+
+def orientation_error(a: Proto.EntityPosition, b: Proto.EntityPosition) -> float:
+    """Largest rotation difference in degrees between two positions, by euler angles if both have them, otherwise quaternions"""
+    if a.HasField("euler_rotation") and b.HasField("euler_rotation"):
+        return max(_angle_difference(a.euler_rotation.roll, b.euler_rotation.roll),
+                   _angle_difference(a.euler_rotation.pitch, b.euler_rotation.pitch),
+                   _angle_difference(a.euler_rotation.yaw, b.euler_rotation.yaw))
+    if a.HasField("local_rotation") and b.HasField("local_rotation"):
+        p, q = a.local_rotation, b.local_rotation
+        dot = abs(p.x * q.x + p.y * q.y + p.z * q.z + p.w * q.w)
+        return math.degrees(2 * math.acos(min(dot, 1.0)))
+    return 0.0
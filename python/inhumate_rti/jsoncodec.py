@@ -0,0 +1,47 @@
+# JSON codecs for the SocketCluster envelope (the JSON frames wrapping events and publishes).
+#
+# The envelope is only read by the broker, so it is rendered compactly and without sorting
+# keys. If the optional 'orjson' package is installed, it is used for speed.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONCodec:
+    """Envelope codec using the standard library json module"""
+    name = "json"
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj) -> str:
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        if not isinstance(data, str):
+            data = bytes(data).decode("utf8")
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec:
+    """Envelope codec using orjson (pip install orjson)"""
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires the 'orjson' package")
+
+    def dumps(self, obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf8")
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def default_codec():
+    return OrjsonCodec() if orjson is not None else JSONCodec()
@@ -0,0 +1,62 @@
+# Lazily decoded protobuf message, for subscribers that only look at some of the messages
+# they receive.
+
+from typing import Optional, Type, Union
+
+from google.protobuf import message as _message
+
+from .wire import first_field_id
+
+
+class LazyMessage:
+    """Stands in for a received protobuf message, holding only its raw content (bytes, or base64
+    as received on the JSON transport). The message is parsed on first attribute access, so a
+    handler that returns early - e.g. after checking peek_id() - never pays for decoding.
+
+    Attribute access, HasField(), WhichOneof() etc. are forwarded to the parsed message.
+    Use decode() to get the actual message object, e.g. for isinstance() checks or CopyFrom()."""
+
+    __slots__ = ("_message_class", "_content", "_message")
+
+    def __init__(self, message_class: Type[_message.Message], content: Union[str, bytes]):
+        object.__setattr__(self, "_message_class", message_class)
+        object.__setattr__(self, "_content", content)
+        object.__setattr__(self, "_message", None)
+
+    def peek_id(self) -> str:
+        """The first field of the message if it is a string (the id, for channels with
+        first_field_id set), read from the raw content without parsing the message."""
+        if self._message is not None:
+            field = self._message.DESCRIPTOR.fields_by_number.get(1)
+            value = getattr(self._message, field.name) if field is not None else None
+            return value if isinstance(value, str) else ""
+        return first_field_id(self._content) or ""
+
+    @property
+    def decoded(self) -> bool:
+        return self._message is not None
+
+    def decode(self) -> _message.Message:
+        message = self._message
+        if message is None:
+            from .rticlient import RTIClient
+            message = RTIClient.parse(self._message_class, self._content)
+            object.__setattr__(self, "_message", message)
+        return message
+
+    def __getattr__(self, name):
+        return getattr(self.decode(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.decode(), name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyMessage):
+            other = other.decode()
+        return self.decode() == other
+
+    def __str__(self):
+        return str(self.decode())
+
+    def __repr__(self):
+        return repr(self.decode())
@@ -0,0 +1,88 @@
+# Columnar (NumPy) representation of measurements fetched from the recorder.
+# Requires the optional 'numpy' package (pip install inhumate-rti[numpy]).
+
+from typing import Dict, Tuple
+
+from . import proto as Proto
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class MeasurementArrays:
+    """The measurements of one measure, client and entity, as NumPy arrays with one element
+    per measurement. Raw measurements have value set and the window arrays NaN (count 0),
+    window measurements (with resolution > 0) have value NaN."""
+
+    def __init__(self, measure: Proto.Measure, client_id: str, entity_id: str, time, value, mean, min, max, duration, count):
+        self.measure = measure
+        self.client_id = client_id
+        self.entity_id = entity_id
+        self.time = time
+        self.value = value
+        self.mean = mean
+        self.min = min
+        self.max = max
+        self.duration = duration
+        self.count = count
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return f"MeasurementArrays({self.measure.id!r}, client_id={self.client_id!r}, entity_id={self.entity_id!r}, {len(self)} measurements)"
+
+
+class MeasurementArraysBuilder:
+    """Collects MeasurementBundle responses (e.g. pages) into MeasurementArrays per
+    (measure id, client id, entity id). Each response is converted to arrays as it is added,
+    so only one page at a time is held as protobuf/Python objects."""
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("Measurement arrays require the 'numpy' package (pip install inhumate-rti[numpy])")
+        self._measures = {}
+        self._chunks = {}
+
+    def add(self, response: Proto.MeasurementBundle.Response):
+        nan = float("nan")
+        for measure_measurements in response.measures:
+            key = (measure_measurements.measure.id, measure_measurements.client_id, measure_measurements.entity_id)
+            if key not in self._measures:
+                self._measures[key] = measure_measurements.measure
+                self._chunks[key] = []
+            times, values, means, mins, maxs, durations, counts = [], [], [], [], [], [], []
+            for measurement in measure_measurements.measurements:
+                times.append(measurement.time)
+                if measurement.HasField("window"):
+                    window = measurement.window
+                    values.append(nan)
+                    means.append(window.mean)
+                    mins.append(window.min)
+                    maxs.append(window.max)
+                    durations.append(window.duration)
+                    counts.append(window.count)
+                else:
+                    values.append(measurement.value)
+                    means.append(nan)
+                    mins.append(nan)
+                    maxs.append(nan)
+                    durations.append(nan)
+                    counts.append(0)
+            self._chunks[key].append((
+                np.array(times, dtype=np.float64),
+                np.array(values, dtype=np.float32),
+                np.array(means, dtype=np.float32),
+                np.array(mins, dtype=np.float32),
+                np.array(maxs, dtype=np.float32),
+                np.array(durations, dtype=np.float32),
+                np.array(counts, dtype=np.int32)))
+
+    def build(self) -> Dict[Tuple[str, str, str], MeasurementArrays]:
+        result = {}
+        for key, chunks in self._chunks.items():
+            columns = [chunk[0] if len(chunks) == 1 else np.concatenate(chunk) for chunk in zip(*chunks)]
+            result[key] = MeasurementArrays(self._measures[key], key[1], key[2], *columns)
+        return result
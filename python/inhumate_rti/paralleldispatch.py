@@ -0,0 +1,109 @@
+# Parallel decode/dispatch of received messages on a pool of worker threads ("lanes").
+
+from queue import Queue, Full
+from threading import Thread
+from zlib import crc32
+
+from .wire import first_field_id
+
+
+class DispatchOrdering:
+    """Which messages are guaranteed to be handled in the order they were received"""
+    # all messages on a channel
+    CHANNEL = "channel"
+    # messages with the same first field (id) on a channel, e.g. the positions of one entity.
+    # Messages without an id are ordered per channel.
+    ID = "id"
+
+
+class DispatchPriority:
+    """Priority class of a channel with parallel dispatch. Each class other than DATA has a
+    lane (thread and queue) of its own, so its messages are never queued behind data."""
+    # runtime control - stop, reset, fast-time steps etc.
+    CONTROL = "control"
+    # RTI bookkeeping - clients, channels, measures
+    SYSTEM = "system"
+    # everything else, spread over the data lanes
+    DATA = "data"
+
+
+class ParallelDispatcher:
+    """Runs decoding and handlers off the socket thread. Each message is assigned to one of
+    a fixed number of lanes by hashing its channel (or channel and id), and each lane is
+    served by one thread, so messages with the same key are handled in order.
+
+    Lane queues are bounded: when a lane has max_queue_size messages waiting, submit()
+    blocks the socket thread until the lane catches up, which in turn makes the broker
+    connection back up instead of letting memory grow without bound. As the socket thread
+    can't read control messages or answer pings meanwhile, it waits at most max_queue_wait
+    seconds (None for no limit); then the message is dropped, counted in overflows and
+    on_overflow(channel_name) called. Priority lanes (see DispatchPriority) are unbounded,
+    so control messages never make the socket thread wait."""
+
+    def __init__(self, deliver, workers=4, ordering=DispatchOrdering.CHANNEL, max_queue_size=1000,
+                 max_queue_wait=0.1, on_overflow=None):
+        if workers < 1: raise ValueError("Parallel dispatch needs at least one worker")
+        self.deliver = deliver
+        self.ordering = ordering
+        self.max_queue_wait = max_queue_wait
+        self.on_overflow = on_overflow
+        self.overflows = {}
+        self.lanes = [Queue(max_queue_size) for _ in range(workers)]
+        self.priority_lanes = {DispatchPriority.CONTROL: Queue(), DispatchPriority.SYSTEM: Queue()}
+        self.threads = []
+        for name, lane in list(enumerate(self.lanes)) + list(self.priority_lanes.items()):
+            thread = Thread(target=self._run, args=(lane,), name=f"rti-dispatch-{name}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, channel_name, content, listeners, priority=DispatchPriority.DATA, has_id=False):
+        """has_id tells that content is a protobuf message with an id as first field
+        (a channel with first_field_id set), to order by with DispatchOrdering.ID"""
+        lane = self.priority_lanes.get(priority)
+        if lane is None:
+            key = channel_name
+            if has_id and self.ordering == DispatchOrdering.ID:
+                try:
+                    message_id = first_field_id(content)
+                except ValueError:  # not base64 after all - order per channel
+                    message_id = None
+                if message_id:
+                    key = channel_name + "\0" + message_id
+            lane = self.lanes[crc32(key.encode("utf8")) % len(self.lanes)]
+            try:
+                lane.put((channel_name, content, listeners), timeout=self.max_queue_wait)
+            except Full:
+                self.overflows[channel_name] = self.overflows.get(channel_name, 0) + 1
+                if self.on_overflow is not None:
+                    self.on_overflow(channel_name)
+            return
+        lane.put((channel_name, content, listeners))
+
+    @property
+    def queue_depth(self):
+        return sum(lane.qsize() for lane in self._all_lanes())
+
+    def _all_lanes(self):
+        return self.lanes + list(self.priority_lanes.values())
+
+    def join(self):
+        """Wait until all submitted messages have been handled"""
+        for lane in self._all_lanes():
+            lane.join()
+
+    def stop(self):
+        for lane in self._all_lanes():
+            lane.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self, lane):
+        while True:
+            item = lane.get()
+            try:
+                if item is None:
+                    return
+                self.deliver(*item)
+            finally:
+                lane.task_done()
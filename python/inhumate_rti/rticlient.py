@@ -2,8 +2,17 @@ from .rtisocketclusterclient import RTISocketClusterClient
 from emitter import Emitter
 
 from uuid import uuid4
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+from collections import deque
+from queue import Queue, Empty
+import heapq
+import itertools
 from . import proto as Proto, constants as Constants, channel as Channel, __version__
+from .wire import first_field_id
+from .lazymessage import LazyMessage
+from .paralleldispatch import ParallelDispatcher, DispatchOrdering, DispatchPriority
+from .rtipublisher import RTIPublisher
+from .measurementarrays import MeasurementArrays, MeasurementArraysBuilder
 import os
 from google.protobuf import message as _message
 import base64
@@ -14,12 +23,66 @@ import json
 import re
 import sys
 from inspect import signature
-from typing import List, Optional, Set, Type, Union, Callable
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type, Union, Callable
 
 
 class DispatchMode:
     IMMEDIATE = "immediate"
     BUFFERED = "buffered"
+    # like BUFFERED, but on state channels only the latest buffered message per channel (per
+    # channel and id for channels with first_field_id) is kept until flush_buffers().
+    # Messages on other channels are buffered like BUFFERED, as each of them matters.
+    CONFLATED = "conflated"
+
+
+class DropPolicy:
+    """What to do when a buffered message arrives and the buffer is at max_buffer_depth"""
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # wait (at most buffer_block_timeout seconds, then drop oldest) for flush_buffers() on another thread
+    BLOCK = "block"
+
+
+class _Listener:
+    """Subscription entry: the handle returned to the user (used to unsubscribe), its dispatch
+    mode, a pre-bound call(channel_name, content) so no reflection is needed per message, and
+    the protobuf message class to decode content into (None for text subscriptions).
+    accepts, if set, is a predicate on the first field (id) of the raw message - messages it
+    rejects are skipped before being buffered or decoded."""
+    __slots__ = ("handler", "dispatch", "call", "message_class", "lazy", "accepts")
+
+    def __init__(self, handler, dispatch, call, message_class=None, lazy=False, accepts=None):
+        self.handler = handler
+        self.dispatch = dispatch
+        self.call = call
+        self.message_class = message_class
+        self.lazy = lazy
+        self.accepts = accepts
+
+
+class _MeasurementAccumulator:
+    """Running count, sum, min and max of the values measured for one measure and entity
+    since they were last collected, so measure() is O(1) and collecting doesn't depend on
+    the number of values."""
+    __slots__ = ("measure_id", "entity_id", "count", "total", "minimum", "maximum", "last_collect")
+
+    def __init__(self, measure_id, entity_id):
+        self.measure_id = measure_id
+        self.entity_id = entity_id
+        self.last_collect = None
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = -float("inf")
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.minimum: self.minimum = value
+        if value > self.maximum: self.maximum = value
 
 
 class RTIClient(Emitter):
@@ -62,7 +125,9 @@ class RTIClient(Emitter):
                  role: Optional[str] = None, full_name: Optional[str] = None, capabilities: Optional[Set[str]] = None,
                  password: Optional[str] = None, incognito: bool = False, connect: bool = True,
                  wait: bool = False, main_loop: Callable = None, main_loop_idle_time: float = 0.01,
-                 max_message_size_bytes: int = 16 * 1024 * 1024):
+                 max_message_size_bytes: int = 16 * 1024 * 1024, binary_transport: bool = False,
+                 publish_batch_delay: float = 0, publish_batch_bytes: int = 64 * 1024,
+                 coalesce_state_publishes: bool = False):
         super().__init__()
         
         self.on(Emitter.ERROR, lambda exc_info: self.emit("error", "connection", exc_info[1], exc_info[0]))
@@ -76,9 +141,28 @@ class RTIClient(Emitter):
         self.known_measures = {}
         self.default_dispatch_mode = DispatchMode.IMMEDIATE
         self.max_buffer_depth = 10000
+        self.buffer_drop_policy = DropPolicy.DROP_OLDEST
+        self.buffer_block_timeout = 1.0
+        # parse each received message once and hand the same (read-only!) object to all immediate listeners on the channel
+        self.share_decoded_messages = True
+        self._parallel_dispatcher = None
+        # priority class per channel with parallel dispatch (also applies to the client's own channels, @<client id>:<channel>)
+        self.channel_priorities = {
+            Channel.runtime_control: DispatchPriority.CONTROL,
+            Channel.fast_time_control: DispatchPriority.CONTROL,
+            Channel.launch_control: DispatchPriority.CONTROL,
+            Channel.recorder_control: DispatchPriority.CONTROL,
+            Channel.clients: DispatchPriority.SYSTEM,
+            Channel.channels: DispatchPriority.SYSTEM,
+            Channel.measures: DispatchPriority.SYSTEM,
+        }
         self.max_message_size_bytes = max_message_size_bytes
-        self._message_buffer = []
+        self.binary_transport = binary_transport
+        self._message_buffer = deque()
+        self._conflated = {}
+        self._buffer_overflows = {}
         self._buffer_lock = Lock()
+        self._buffer_space = Condition(self._buffer_lock)
 
         self._state = Proto.UNKNOWN
         self.first_connected = False
@@ -155,7 +239,7 @@ class RTIClient(Emitter):
             auth_token['federation'] = self.federation
         self._auth_token_data = auth_token
 
-        socket = RTISocketClusterClient(url, main_loop, main_loop_idle_time, self.max_message_size_bytes)
+        socket = self._create_socket(url, main_loop, main_loop_idle_time)
 
         def on_clients(message: Proto.Clients):
             if message.HasField("request_clients") and not self.incognito:
@@ -200,13 +284,26 @@ class RTIClient(Emitter):
         socket.on("fail", self.__on_fail)
         socket.on("broker-version", self.__on_broker_version)
         socket.on("ping", self.__on_ping)
+        if publish_batch_delay > 0:
+            socket.set_batching(publish_batch_delay, publish_batch_bytes)
+        if coalesce_state_publishes:
+            socket.set_coalescing(True)
         self.socket = socket
         self.thread = None
         self.subscribe_lock = Lock()
         self.collect_measurements_thread = None
         self.collect_lock = Lock()
         self.collect_queue = {}
-        self.last_collect = {}
+        # min-heap of (deadline, sequence, key) - when to collect the accumulator of a measure and entity,
+        # or (with key None) publish the pending measurements
+        self._collect_schedule = []
+        self._collect_sequence = itertools.count()
+        self._collect_condition = Condition(self.collect_lock)
+        # send the measurements due at the same time together, as batch frames. Measurements without
+        # interval are then also held for up to measurement_batch_delay instead of being published right away.
+        self.batch_measurements = False
+        self.measurement_batch_delay = 0.1
+        self._pending_measurements = []
 
         self.subscribe(Channel.clients, Proto.Clients, on_clients, dispatch=DispatchMode.IMMEDIATE)
         self.subscribe(Channel.channels, Proto.Channels, on_channels, dispatch=DispatchMode.IMMEDIATE)
@@ -218,6 +315,9 @@ class RTIClient(Emitter):
             if wait:
                 self.wait_until_connected()
 
+    def _create_socket(self, url, main_loop, main_loop_idle_time):
+        return RTISocketClusterClient(url, main_loop, main_loop_idle_time, self.max_message_size_bytes, self.binary_transport)
+
     def __on_connect(self, socket):
         # self.connected and emit "connect" event is done in __on_set_auth (after client handshake)
         self._connection_error = None
@@ -299,34 +399,144 @@ class RTIClient(Emitter):
     def buffer_depth(self):
         with self._buffer_lock: return len(self._message_buffer)
 
-    def _buffer_message(self, message):
+    @property
+    def buffer_overflows(self):
+        """Number of buffered messages dropped due to max_buffer_depth, per channel"""
+        with self._buffer_lock: return dict(self._buffer_overflows)
+
+    def _buffer_message(self, listener, channel_name, content, conflate=False):
+        key = None
+        if conflate:
+            channel = self.known_channels.get(channel_name)
+            if channel is not None and channel.state:
+                key = (listener, channel_name)
+                # ids can only be peeked from protobuf messages - conflate anything else per channel
+                if channel.first_field_id and listener.message_class is not None:
+                    try:
+                        key = (listener, channel_name, first_field_id(content))
+                    except ValueError:  # not base64 after all
+                        pass
         with self._buffer_lock:
+            if key is not None:
+                entry = self._conflated.get(key)
+                if entry is not None:
+                    entry[2] = content
+                    return
             if self.max_buffer_depth <= 0:
-                overflow = True
+                overflow = channel_name
             else:
-                overflow = len(self._message_buffer) >= self.max_buffer_depth
-                if overflow:
-                    self._message_buffer.pop(0)
-                self._message_buffer.append(message)
-        if overflow:
+                if self.buffer_drop_policy == DropPolicy.BLOCK and len(self._message_buffer) >= self.max_buffer_depth:
+                    self._buffer_space.wait_for(lambda: len(self._message_buffer) < self.max_buffer_depth, self.buffer_block_timeout)
+                overflow = None
+                if len(self._message_buffer) >= self.max_buffer_depth:
+                    if self.buffer_drop_policy == DropPolicy.DROP_NEWEST:
+                        overflow = channel_name
+                    else:
+                        dropped = self._message_buffer.popleft()
+                        if dropped[3] is not None:
+                            del self._conflated[dropped[3]]
+                        overflow = dropped[1]
+                if overflow is None or self.buffer_drop_policy != DropPolicy.DROP_NEWEST:
+                    entry = [listener, channel_name, content, key]
+                    self._message_buffer.append(entry)
+                    if key is not None:
+                        self._conflated[key] = entry
+            if overflow is not None:
+                self._buffer_overflows[overflow] = self._buffer_overflows.get(overflow, 0) + 1
+        if overflow is not None:
             self.emit("error", "buffer", Exception("RTI buffered dispatch overflow"), None)
 
     def flush_buffers(self):
         with self._buffer_lock:
-            messages = list(self._message_buffer)
-            self._message_buffer.clear()
-        for handler, channel_name, content in messages:
-            self._call_handler(handler, channel_name, content)
-
-    def _call_handler(self, handler, channel_name, content):
+            messages = self._message_buffer
+            self._message_buffer = deque()
+            self._conflated = {}
+            self._buffer_space.notify_all()
+        for listener, channel_name, content, key in messages:
+            self._deliver(listener, channel_name, content)
+
+    def _deliver(self, listener, channel_name, content, decoded=None):
+        # decoded, if given, caches the decoded content per (lazy, message class) for the listeners of one message
         try:
-            if len(signature(handler).parameters) < 2:
-                handler(content)
+            key = (listener.lazy, listener.message_class)
+            if decoded is not None and key in decoded:
+                content = decoded[key]
             else:
-                handler(channel_name, content)
+                raw = content
+                if listener.lazy:
+                    content = LazyMessage(listener.message_class, raw)
+                elif listener.message_class is not None:
+                    content = self.parse(listener.message_class, raw)
+                elif not isinstance(raw, str):
+                    # protobuf payload received over the binary transport, text subscribers get base64
+                    content = base64.b64encode(raw).decode("utf8")
+                if decoded is not None:
+                    decoded[key] = content
+            listener.call(channel_name, content)
         except Exception as e:
             self.emit("error", channel_name, e, traceback.format_exc())
 
+    def _deliver_all(self, channel_name, content, listeners):
+        decoded = {} if self.share_decoded_messages and len(listeners) > 1 else None
+        for listener in listeners:
+            self._deliver(listener, channel_name, content, decoded)
+
+    def _channel_priority(self, channel_name):
+        priority = self.channel_priorities.get(channel_name)
+        if priority is None and channel_name.startswith("@"):
+            priority = self.channel_priorities.get(channel_name.partition(":")[2])
+        return priority if priority is not None else DispatchPriority.DATA
+
+    def _has_message_ids(self, channel_name, listeners):
+        # ids can only be peeked from protobuf messages on channels registered with first_field_id
+        channel = self.known_channels.get(channel_name)
+        if channel is None or not channel.first_field_id:
+            return False
+        return any(listener.message_class is not None for listener in listeners)
+
+    def enable_parallel_dispatch(self, workers: int = 4, ordering: str = DispatchOrdering.CHANNEL, max_queue_size: int = 1000,
+                                 max_queue_wait: Optional[float] = 0.1):
+        """Decode messages and run immediate handlers on a pool of worker threads instead of the
+        socket thread, so a slow handler only holds up messages that must be handled after it.
+        Messages are handled in order per channel (or per channel and id, see DispatchOrdering).
+        When a worker falls max_queue_size messages behind, receiving waits for it to catch up -
+        for at most max_queue_wait seconds, so that control messages and pings are not held up
+        for long, after which the message is dropped (see dispatch_overflows) and an error emitted.
+        Channels in channel_priorities get lanes of their own (see DispatchPriority), so control
+        messages are not held up by data. Pings are always answered on the socket thread."""
+        self.disable_parallel_dispatch()
+        self._parallel_dispatcher = ParallelDispatcher(self._deliver_all, workers, ordering, max_queue_size,
+                                                       max_queue_wait, self._dispatch_overflow)
+
+    def _dispatch_overflow(self, channel_name):
+        self.emit("error", "dispatch", Exception(f"RTI parallel dispatch overflow on {channel_name}"), None)
+
+    @property
+    def dispatch_overflows(self):
+        """Number of messages dropped because a parallel dispatch lane stayed full, per channel"""
+        dispatcher = self._parallel_dispatcher
+        return dict(dispatcher.overflows) if dispatcher is not None else {}
+
+    def disable_parallel_dispatch(self):
+        """Handle the messages already queued for the workers, then go back to dispatching on the socket thread"""
+        dispatcher = self._parallel_dispatcher
+        if dispatcher is not None:
+            self._parallel_dispatcher = None
+            dispatcher.stop()
+
+    def wait_dispatched(self):
+        """With parallel dispatch, wait until all messages received so far have been handled"""
+        dispatcher = self._parallel_dispatcher
+        if dispatcher is not None:
+            dispatcher.join()
+
+    @staticmethod
+    def _bind_handler(handler):
+        # Resolve the calling convention (content) or (channel_name, content) once, at subscribe time
+        if len(signature(handler).parameters) < 2:
+            return lambda channel_name, content: handler(content)
+        return handler
+
     def verify_token(self, token: str, handler: Callable[[dict], None]):
         self.invoke("verifytoken", token, handler)
         
@@ -344,30 +554,45 @@ class RTIClient(Emitter):
                 handler(data)
         self.socket.transmit(method, data, invoke_handler)
 
-    def subscribe(self, channel_name: str, message_class: Type[_message.Message], handler: Callable, register: bool = True, dispatch=None):
-        def handle_message(content):
-            message = self.parse(message_class, content)
-            if len(signature(handler).parameters) < 2:
-                handler(message)
-            else:
-                handler(channel_name, message)
-        return self.subscribe_text(channel_name, handle_message, register, str(message_class), dispatch=dispatch)
+    def subscribe(self, channel_name: str, message_class: Type[_message.Message], handler: Callable, register: bool = True, dispatch=None, lazy: bool = False,
+                  ids: Union[Set[str], Callable[[str], bool], None] = None):
+        """Subscribe to a channel of protobuf messages. With lazy=True, the handler gets a LazyMessage
+        that is only parsed when accessed (peek_id() reads the id without parsing).
+        ids filters on the first field of the message (e.g. the entity id), read without parsing:
+        either a set of ids (which may be updated after subscribing) or a predicate.
+        Listeners on the same channel and message class share the parsed message, so handlers should
+        not modify it (copy it first, or set share_decoded_messages = False)."""
+        call = self._bind_handler(handler)
+        def subscription(channel_name, message):  # unique handle for unsubscribe()
+            call(channel_name, message)
+        accepts = None
+        if callable(ids):
+            accepts = ids
+        elif ids is not None:
+            if not isinstance(ids, (set, frozenset)): ids = set(ids)
+            accepts = ids.__contains__
+        self._add_listener(channel_name, _Listener(subscription, dispatch, call, message_class, lazy, accepts), register, str(message_class))
+        return subscription
 
     @classmethod
     def parse(cls, message_class, content):
         message = message_class()
-        message.ParseFromString(base64.b64decode(content))
+        if isinstance(content, str):
+            content = base64.b64decode(content)
+        message.ParseFromString(content)
         return message
 
     def subscribe_json(self, channel_name: str, handler: Union[Callable[[str, dict], None], Callable[[dict], None]], register=True, dispatch=None):
-        def handle_message(content):
-            if len(signature(handler).parameters) < 2:
-                handler(json.loads(content))
-            else:
-                handler(channel_name, json.loads(content))
+        call = self._bind_handler(handler)
+        def handle_message(channel_name, content):
+            call(channel_name, json.loads(content))
         return self.subscribe_text(channel_name, handle_message, register, "json", dispatch=dispatch)
 
     def subscribe_text(self, channel_name: str, handler: Union[Callable[[str, str], None], Callable[[str], None]], register: bool = True, data_type: str = "text", dispatch=None):
+        self._add_listener(channel_name, _Listener(handler, dispatch, self._bind_handler(handler)), register, data_type)
+        return handler
+
+    def _add_listener(self, channel_name: str, listener: _Listener, register: bool, data_type: str):
         if not channel_name: raise ValueError("Cannot subscribe with undefined/empty channel name")
         socket_channel_name = channel_name
         if self.federation:
@@ -380,20 +605,36 @@ class RTIClient(Emitter):
                 self._register_channel_usage(channel_name, False, data_type)
 
             def handle_message(in_channel_name, content):
-                listeners = []
                 with self.subscribe_lock:
-                    for entry in self.subscriptions[socket_channel_name]:
-                        listeners.append(entry)
-                for listener, mode in listeners:
-                    effective_mode = mode if mode is not None else self.default_dispatch_mode
+                    listeners = tuple(self.subscriptions[socket_channel_name])
+                dispatcher = self._parallel_dispatcher
+                decoded = {} if self.share_decoded_messages and len(listeners) > 1 else None
+                immediate = [] if dispatcher is not None else None
+                message_id = None
+                for listener in listeners:
+                    if listener.accepts is not None:
+                        if message_id is None:
+                            try:
+                                message_id = first_field_id(content) or ""
+                            except ValueError:  # not base64 after all - no id to accept
+                                message_id = ""
+                        if not listener.accepts(message_id):
+                            continue
+                    effective_mode = listener.dispatch if listener.dispatch is not None else self.default_dispatch_mode
                     if effective_mode == DispatchMode.BUFFERED:
-                        self._buffer_message((listener, channel_name, content))
+                        self._buffer_message(listener, channel_name, content)
+                    elif effective_mode == DispatchMode.CONFLATED:
+                        self._buffer_message(listener, channel_name, content, conflate=True)
+                    elif immediate is not None:
+                        immediate.append(listener)
                     else:
-                        self._call_handler(listener, channel_name, content)
+                        self._deliver(listener, channel_name, content, decoded)
+                if immediate:
+                    dispatcher.submit(channel_name, content, immediate, self._channel_priority(channel_name),
+                                      dispatcher.ordering == DispatchOrdering.ID and self._has_message_ids(channel_name, immediate))
             self.socket.on_channel(socket_channel_name, handle_message)
 
-        with self.subscribe_lock: self.subscriptions[socket_channel_name].append((handler, dispatch))
-        return handler
+        with self.subscribe_lock: self.subscriptions[socket_channel_name].append(listener)
 
     def unsubscribe(self, channel_name_or_handler: Union[str, Callable[[str], None]]) -> None:
         with self.subscribe_lock:
@@ -407,7 +648,7 @@ class RTIClient(Emitter):
                 for channel_name in self.subscriptions:
                     entry_to_remove = None
                     for entry in self.subscriptions[channel_name]:
-                        if entry[0] == channel_name_or_handler:
+                        if entry.handler == channel_name_or_handler:
                             entry_to_remove = entry
                             break
                     if entry_to_remove is not None:
@@ -420,8 +661,10 @@ class RTIClient(Emitter):
     def publish(self, channel_name: str, message: _message.Message, register = True) -> None:
         if type(message) is str: return self.publish_text(channel_name, message, register)
         if register: self._register_channel_usage(channel_name, True, data_type=str(type(message)))
-        content = base64.b64encode(message.SerializeToString()).decode("utf8")
-        self._do_publish(channel_name, content)
+        if self.socket.binary:
+            self._do_publish(channel_name, message.SerializeToString(), message)
+        else:
+            self._do_publish(channel_name, base64.b64encode(message.SerializeToString()).decode("utf8"), message)
 
     def publish_text(self, channel_name: str, content: str, register = True) -> None:
         if register: self._register_channel_usage(channel_name, True, data_type="text")
@@ -431,14 +674,54 @@ class RTIClient(Emitter):
         if register: self._register_channel_usage(channel_name, True, data_type="json")
         self._do_publish(channel_name, json.dumps(message))
 
-    def _do_publish(self, channel_name: str, content: str) -> None:
+    def publisher(self, channel_name: str, message_class: Optional[Type[_message.Message]] = None, register: bool = True) -> RTIPublisher:
+        """A publisher for one channel, with its send(message) doing only per-message work.
+        Without message_class, it publishes text."""
+        return RTIPublisher(self, channel_name, message_class, register)
+
+    def _coalesce_key(self, channel_name: str, message: Optional[_message.Message]):
+        # Latest-value-wins key for state channels: per channel, or per channel and id (first field)
+        channel = self.known_channels.get(channel_name)
+        if channel is None or not channel.state:
+            return None
+        if channel.first_field_id and message is not None:
+            field = message.DESCRIPTOR.fields_by_number.get(1)
+            if field is not None:
+                return (channel_name, getattr(message, field.name))
+        return channel_name
+
+    def _do_publish(self, channel_name: str, content: Union[str, bytes], message: Optional[_message.Message] = None) -> None:
         if not channel_name: raise ValueError("Cannot publish with undefined/empty channel name")
         if not self.first_connected:
             print("RTI can't publish before connected - message dropped", file=sys.stderr)
             return
+        coalesce_key = self._coalesce_key(channel_name, message) if self.socket.coalesce else None
         if self.federation and not channel_name.startswith("@"):
             channel_name = "//" + self.federation + "/" + channel_name
-        self.socket.publish(channel_name, content)
+        if isinstance(content, bytes):
+            self.socket.publish_binary(channel_name, content, coalesce_key=coalesce_key)
+        else:
+            self.socket.publish(channel_name, content, coalesce_key=coalesce_key)
+
+    def set_publish_batching(self, max_delay: float, max_bytes: int = 64 * 1024) -> None:
+        """Collect outgoing publishes for up to max_delay seconds (or max_bytes) and send them
+        as fewer, larger websocket frames. max_delay <= 0 sends every publish immediately."""
+        self.socket.set_batching(max_delay, max_bytes)
+
+    def set_publish_coalescing(self, enabled: bool) -> None:
+        """Queue publishes and, for channels registered as state channels, keep only the latest
+        pending message per channel (per channel and id if the channel has first_field_id set),
+        so a congested link only carries current state."""
+        self.socket.set_coalescing(enabled)
+
+    @property
+    def coalesced_publishes(self) -> int:
+        """Number of pending publishes replaced by newer ones due to publish coalescing."""
+        return self.socket.coalesced_count
+
+    def flush(self) -> None:
+        """Send any publishes held back by publish batching or coalescing."""
+        self.socket.flush()
 
     def publish_error(self, error_message: str, runtime_state: Proto.RuntimeState = None) -> None:
         message = Proto.RuntimeControl()
@@ -610,15 +893,15 @@ class RTIClient(Emitter):
         if measure.id not in self.used_measures:
             self.register_measure(measure)
         if measure.interval > 1e-5:
-            if not self.collect_measurements_thread:
-                self.collect_measurements_thread = Thread(
-                    target=self._collect_measurements_thread_func)
-                self.collect_measurements_thread.daemon = True
-                self.collect_measurements_thread.start()
+            self._start_collect_measurements_thread()
             with self.collect_lock:
-                key = measure.id + ("|" + entity_id if entity_id else "")
-                if key not in self.collect_queue: self.collect_queue[key] = []
-                self.collect_queue[key].append(value)
+                key = (measure.id, entity_id)
+                accumulator = self.collect_queue.get(key)
+                if accumulator is None:
+                    accumulator = self.collect_queue[key] = _MeasurementAccumulator(measure.id, entity_id)
+                    accumulator.last_collect = time.time()
+                    self._schedule_collect(key, accumulator.last_collect, measure.interval)
+                accumulator.add(value)
         else:
             measurement = Proto.Measurement()
             measurement.measure_id = measure.id
@@ -626,48 +909,102 @@ class RTIClient(Emitter):
             measurement.entity_id = entity_id
             measurement.value = value
             channel = measure.channel if measure.channel else Channel.measurement
-            if self.connected:
+            if self.batch_measurements:
+                self._start_collect_measurements_thread()
+                with self.collect_lock:
+                    if not self._pending_measurements:
+                        self._schedule_collect(None, time.time(), self.measurement_batch_delay)
+                    self._pending_measurements.append((channel, measurement))
+            elif self.connected:
                 self.publish(channel, measurement, False)
 
+    def _start_collect_measurements_thread(self):
+        if not self.collect_measurements_thread:
+            self.collect_measurements_thread = Thread(
+                target=self._collect_measurements_thread_func)
+            self.collect_measurements_thread.daemon = True
+            self.collect_measurements_thread.start()
+
+    def _schedule_collect(self, key, last_collect, interval):
+        # called with collect_lock held. interval is in scaled (measurement) time - while time is
+        # stopped (scale <= 0), the entry is checked again after the unscaled interval
+        if key is not None and self.measurement_interval_time_scale > 0:
+            interval /= self.measurement_interval_time_scale
+        entry = (last_collect + interval, next(self._collect_sequence), key)
+        heapq.heappush(self._collect_schedule, entry)
+        if self._collect_schedule[0] is entry:
+            self._collect_condition.notify()
+
     def _collect_measurements_thread_func(self):
-        while self.connected:
-            time.sleep(0.1)
+        # Sleeps until the earliest deadline in the schedule (or until one is added), and keeps
+        # running through disconnects - measurements keep accumulating until connected again.
+        while True:
             with self.collect_lock:
-                for key, values in self.collect_queue.items():
-                    measure_id = key.split("|")[0]
-                    entity_id = key.split("|")[1] if "|" in key else ""
-                    if key not in self.last_collect: 
-                        self.last_collect[key] = time.time()
-                    else:
-                        measure = self.known_measures.get(measure_id)
-                        if measure and (time.time() - self.last_collect[key]) * self.measurement_interval_time_scale > measure.interval:
-                            channel = measure.channel if measure.channel else Channel.measurement
-                            measurement = Proto.Measurement()
-                            measurement.measure_id = measure.id
-                            measurement.client_id = self.client_id
-                            measurement.entity_id = entity_id
-                            if len(values) == 1:
-                                measurement.value = values.pop()
-                                self.publish(channel, measurement, False)
-                            elif len(values) > 1:
-                                window = Proto.Measurement.Window()
-                                window.max = -float("inf")
-                                window.min = float("inf")
-                                while len(values) > 0:
-                                    value = values.pop()
-                                    window.count += 1
-                                    window.mean += value
-                                    if value > window.max:
-                                        window.max = value
-                                    if value < window.min:
-                                        window.min = value
-                                if window.count > 0:
-                                    window.mean /= window.count
-                                window.duration = (
-                                    time.time() - self.last_collect[key]) * self.measurement_interval_time_scale
-                                measurement.window.CopyFrom(window)
-                                self.publish(channel, measurement, False)
-                            self.last_collect[key] = time.time()
+                while True:
+                    now = time.time()
+                    if self._collect_schedule and self._collect_schedule[0][0] <= now:
+                        break
+                    self._collect_condition.wait(self._collect_schedule[0][0] - now if self._collect_schedule else None)
+            try:
+                self._collect_measurements(now)
+            except Exception as e:
+                self.emit("error", Channel.measurement, e, traceback.format_exc())
+
+    def _collect_measurements(self, now):
+        # Take out the due accumulated values under the lock, publish outside it
+        due = []
+        pending = []
+        connected = self.connected
+        with self.collect_lock:
+            schedule = self._collect_schedule
+            while schedule and schedule[0][0] <= now:
+                _, _, key = heapq.heappop(schedule)
+                if key is None:
+                    if connected: pending = self._pending_measurements
+                    self._pending_measurements = []
+                    continue
+                accumulator = self.collect_queue.get(key)
+                measure = self.known_measures.get(key[0])
+                if accumulator is None or measure is None or measure.interval <= 1e-5:
+                    self.collect_queue.pop(key, None)
+                    continue
+                if self.measurement_interval_time_scale <= 0:
+                    self._schedule_collect(key, now, measure.interval)  # time stopped, keep accumulating
+                    continue
+                if accumulator.count == 0:
+                    accumulator.last_collect = now
+                elif connected:
+                    duration = (now - accumulator.last_collect) * self.measurement_interval_time_scale
+                    due.append((measure, accumulator.entity_id, accumulator.count, accumulator.total,
+                                accumulator.minimum, accumulator.maximum, duration))
+                    accumulator.reset()
+                    accumulator.last_collect = now
+                self._schedule_collect(key, now, measure.interval)
+        if not pending and not due:
+            return
+        if self.batch_measurements:
+            with self.socket.batch():
+                self._publish_measurements(pending, due)
+        else:
+            self._publish_measurements(pending, due)
+
+    def _publish_measurements(self, pending, due):
+        for channel, measurement in pending:
+            self.publish(channel, measurement, False)
+        for measure, entity_id, count, total, minimum, maximum, duration in due:
+            measurement = Proto.Measurement()
+            measurement.measure_id = measure.id
+            measurement.client_id = self.client_id
+            measurement.entity_id = entity_id
+            if count == 1:
+                measurement.value = total
+            else:
+                measurement.window.count = count
+                measurement.window.mean = total / count
+                measurement.window.min = minimum
+                measurement.window.max = maximum
+                measurement.window.duration = duration
+            self.publish(measure.channel if measure.channel else Channel.measurement, measurement, False)
 
     def execute_command(self, name: str, client_id: str = None, entity_id: str = None, transaction_id: str = None, wait: bool = False, timeout: float = 5, **kwargs):
         message = Proto.Commands()
@@ -700,3 +1037,133 @@ class RTIClient(Emitter):
             return response
         else:
             self.publish(channel, message)
+
+    def fetch_messages(self, channels: Union[str, Iterable[str]], from_time: float = 0, to_time: float = 0,
+                       message_class: Union[Type[_message.Message], Dict[str, Type[_message.Message]], None] = None,
+                       page_size: int = 1000, ids: Optional[Iterable[str]] = None, reverse: bool = False,
+                       per_channel: bool = False, per_id: bool = False, reference: bool = False,
+                       timeout: float = 10) -> Iterator[Tuple[str, float, Union[_message.Message, str]]]:
+        """Fetch recorded messages from the recorder, as a generator of (channel name, time, content) in
+        time order (within each page). Content is decoded if message_class is given - a message class, or a
+        dict of message class per channel - and otherwise left as received (base64 for protobuf channels).
+
+        Messages are requested page_size at a time, and the next page is requested as soon as a page
+        arrives, so it is on its way while the current one is consumed. With per_channel or per_id (i.e.
+        the latest page_size messages per channel or id), a single page is fetched.
+
+        Responses are received on the socket thread, so this must not be used from a message handler,
+        or from the main loop when the client is created with one."""
+        bundle = self._message_bundle_request(channels, from_time, to_time, page_size, ids, reverse, per_channel, per_id, reference)
+        for response in self._fetch_bundle_pages(Channel.message_bundle, bundle, timeout):
+            yield from self._message_bundle_items(response, message_class, reverse)
+
+    def fetch_measurement_arrays(self, measures: Union[str, Iterable[str], None] = None, from_time: float = 0, to_time: float = 0,
+                                 resolution: float = 0, clients: Optional[Iterable[str]] = None,
+                                 applications: Optional[Iterable[str]] = None, entities: Optional[Iterable[str]] = None,
+                                 page_size: int = 10000, reverse: bool = False, per_measure: bool = False,
+                                 reference: bool = False, timeout: float = 10) -> Dict[Tuple[str, str, str], MeasurementArrays]:
+        """Fetch recorded measurements from the recorder into NumPy arrays (requires numpy), as a dict of
+        MeasurementArrays per (measure id, client id, entity id). With resolution > 0, the recorder returns
+        windows of that duration (mean, min, max, count) instead of raw values.
+        Measurements are fetched in pages of page_size, pipelined like fetch_messages()."""
+        builder = MeasurementArraysBuilder()
+        bundle = self._measurement_bundle_request(measures, from_time, to_time, resolution, clients, applications, entities, page_size, reverse, per_measure, reference)
+        for response in self._fetch_bundle_pages(Channel.measurement_bundle, bundle, timeout):
+            builder.add(response)
+        return builder.build()
+
+    @staticmethod
+    def _measurement_bundle_request(measures, from_time, to_time, resolution, clients, applications, entities, page_size, reverse, per_measure, reference):
+        bundle = Proto.MeasurementBundle()
+        request = bundle.request
+        if measures: request.measures.extend([measures] if isinstance(measures, str) else measures)
+        if clients: request.clients.extend(clients)
+        if applications: request.applications.extend(applications)
+        if entities: request.entities.extend(entities)
+        request.from_time = from_time
+        request.to_time = to_time
+        request.resolution = resolution
+        request.limit = page_size
+        request.reverse = reverse
+        request.per_measure = per_measure
+        request.reference = reference
+        return bundle
+
+    def _fetch_bundle_pages(self, channel_name, bundle, timeout):
+        # Yields the responses to a MessageBundle or MeasurementBundle request, page by page.
+        # The next page is requested before the current one is yielded.
+        response_channel_prefix = f"{channel_name}/{uuid4()}/"
+
+        def request_page(offset):
+            responses = Queue()
+            subscription = self._request_bundle_page(channel_name, bundle, offset, response_channel_prefix, responses.put)
+            return offset, responses, subscription
+
+        page = request_page(0)
+        try:
+            while page is not None:
+                offset, responses, subscription = page
+                try:
+                    response = responses.get(timeout=timeout)
+                except Empty:
+                    raise TimeoutError(f"No response from recorder for {channel_name} request at offset {offset}")
+                finally:
+                    self.unsubscribe(subscription)
+                    page = None
+                next_offset = self._next_bundle_offset(bundle, response, offset)
+                if next_offset is not None:
+                    page = request_page(next_offset)
+                yield response
+        finally:
+            if page is not None:
+                self.unsubscribe(page[2])
+
+    @staticmethod
+    def _message_bundle_request(channels, from_time, to_time, page_size, ids, reverse, per_channel, per_id, reference):
+        if isinstance(channels, str): channels = [channels]
+        bundle = Proto.MessageBundle()
+        request = bundle.request
+        request.channels.extend(channels)
+        request.from_time = from_time
+        request.to_time = to_time
+        request.limit = page_size
+        request.reverse = reverse
+        request.per_channel = per_channel
+        request.per_id = per_id
+        request.reference = reference
+        if ids: request.ids.extend(ids)
+        return bundle
+
+    def _request_bundle_page(self, channel_name, bundle, offset, response_channel_prefix, on_response):
+        # Each page is answered on a channel of its own, so pipelined responses can't be mixed up
+        def on_bundle(message):
+            if message.HasField("response"):
+                on_response(message.response)
+        bundle.request.offset = offset
+        bundle.request.response_channel = response_channel_prefix + str(offset)
+        subscription = self.subscribe(bundle.request.response_channel, type(bundle), on_bundle, register=False, dispatch=DispatchMode.IMMEDIATE)
+        self.publish(channel_name, bundle)
+        return subscription
+
+    @staticmethod
+    def _next_bundle_offset(bundle, response, offset):
+        request = bundle.request
+        if isinstance(bundle, Proto.MeasurementBundle):
+            if request.per_measure:
+                return None
+            count = sum(len(measure.measurements) for measure in response.measures)
+        else:
+            if request.per_channel or request.per_id:
+                return None
+            count = sum(len(channel.messages) for channel in response.channels)
+        next_offset = offset + request.limit
+        if count < request.limit or (response.total_count and next_offset >= response.total_count):
+            return None
+        return next_offset
+
+    def _message_bundle_items(self, response, message_class, reverse):
+        def channel_items(channel):
+            decode_class = message_class.get(channel.name) if isinstance(message_class, dict) else message_class
+            for message in channel.messages:
+                yield channel.name, message.time, self.parse(decode_class, message.content) if decode_class else message.content
+        return heapq.merge(*[channel_items(channel) for channel in response.channels], key=lambda item: item[1], reverse=reverse)
@@ -0,0 +1,65 @@
+# Dead reckoning publisher, for publishing positions only when receivers' extrapolation would be off
+
+# Example usage:
+# publisher = RTIDeadReckoningPublisher(rti, position_threshold=0.5, orientation_threshold=2)
+# while running:
+#     position.local.x, position.velocity.forward = ...
+#     publisher.update(position)
+
+import time
+from typing import Dict, Optional, Tuple
+
+from . import RTIClient, proto as Proto, channel as Channel
+from .deadreckoning import extrapolate, position_error, orientation_error
+
+
+class RTIDeadReckoningPublisher:
+    """Publishes positions on the position channel only when the position extrapolated from the
+    last published one (by its velocity, acceleration and angular velocity) is off by more than
+    position_threshold meters or orientation_threshold degrees, or max_interval seconds have passed
+    (so late joiners and receivers that lost a message catch up). Counts published and suppressed updates."""
+
+    def __init__(self, rti: RTIClient, position_threshold: float = 1.0, orientation_threshold: float = 3.0,
+                 max_interval: float = 5.0, channel_name: str = Channel.position):
+        self.rti = rti
+        self.position_threshold = position_threshold
+        self.orientation_threshold = orientation_threshold
+        self.max_interval = max_interval
+        self.published = 0
+        self.suppressed = 0
+        self._publisher = rti.publisher(channel_name, Proto.EntityPosition)
+        self._last: Dict[str, Tuple[float, Proto.EntityPosition]] = {}
+
+    def update(self, position: Proto.EntityPosition, now: Optional[float] = None, force: bool = False) -> bool:
+        """Publish the position if needed. Returns True if it was published."""
+        if now is None: now = time.time()
+        last = self._last.get(position.id)
+        if not force and last is not None and not self._needs_update(position, now - last[0], last[1]):
+            self.suppressed += 1
+            return False
+        self._publisher.send(position)
+        sent = Proto.EntityPosition()
+        sent.CopyFrom(position)
+        self._last[position.id] = (now, sent)
+        self.published += 1
+        return True
+
+    def _needs_update(self, position: Proto.EntityPosition, elapsed: float, last: Proto.EntityPosition) -> bool:
+        if elapsed >= self.max_interval or elapsed < 0:
+            return True
+        predicted = extrapolate(last, elapsed)
+        return (position_error(predicted, position) > self.position_threshold or
+                orientation_error(predicted, position) > self.orientation_threshold)
+
+    def predicted(self, entity_id: str, now: Optional[float] = None) -> Optional[Proto.EntityPosition]:
+        """The position receivers extrapolate from the last published one"""
+        last = self._last.get(entity_id)
+        if last is None: return None
+        return extrapolate(last[1], (time.time() if now is None else now) - last[0])
+
+    def remove(self, entity_id: str):
+        """Forget an entity, e.g. when it is deleted, so the next update of the id is published"""
+        self._last.pop(entity_id, None)
+
+    def reset(self):
+        self._last.clear()
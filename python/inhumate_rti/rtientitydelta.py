@@ -0,0 +1,182 @@
+# Delta encoded entity updates, for publishing entities that change a few fields at a time
+
+# Example usage:
+# publisher = RTIEntityDeltaPublisher(rti)
+# while running:
+#     entity.disabled = ...
+#     publisher.publish(entity)
+# and on the receiving side:
+# entities = RTIEntityStore(rti, deltas=True)
+#
+# Messages on the entity delta channel are Entity messages of two kinds:
+# - keyframes, with every field present on the wire (default values explicitly encoded)
+# - deltas, with only the fields that differ from the last keyframe of the entity
+# so receivers tell them apart, and see fields changed to their default value, by the field
+# numbers present (wire.field_numbers) - proto3 has no field presence of its own. Deltas are
+# cumulative since the keyframe, so a receiver only needs the latest keyframe and delta.
+
+import base64
+import time
+from typing import Dict, Optional, Set, Tuple, Union
+
+from google.protobuf.descriptor import FieldDescriptor
+
+from . import RTIClient, proto as Proto, channel as Channel
+from .wire import field_numbers, encode_default
+
+_ENTITY_FIELDS = Proto.Entity.DESCRIPTOR.fields
+_ENTITY_FIELD_NUMBERS = frozenset(field.number for field in _ENTITY_FIELDS)
+_ENTITY_FIELDS_BY_NUMBER = Proto.Entity.DESCRIPTOR.fields_by_number
+_MESSAGE_TYPE = FieldDescriptor.TYPE_MESSAGE
+
+
+def _is_set(entity: Proto.Entity, field) -> bool:
+    if field.type == _MESSAGE_TYPE:
+        return entity.HasField(field.name)
+    return getattr(entity, field.name) != field.default_value
+
+
+def encode_keyframe(entity: Proto.Entity) -> bytes:
+    """The entity serialized with all fields present"""
+    data = entity.SerializeToString()
+    defaults = [encode_default(field) for field in _ENTITY_FIELDS if not _is_set(entity, field)]
+    return data + b"".join(defaults) if defaults else data
+
+
+def encode_delta(entity: Proto.Entity, keyframe: Proto.Entity) -> bytes:
+    """The id and the fields of entity that differ from keyframe, serialized"""
+    delta = Proto.Entity()
+    defaults = []
+    for field in _ENTITY_FIELDS:
+        name = field.name
+        if field.type == _MESSAGE_TYPE:
+            if entity.HasField(name) == keyframe.HasField(name) and getattr(entity, name) == getattr(keyframe, name):
+                continue
+            if entity.HasField(name):
+                getattr(delta, name).CopyFrom(getattr(entity, name))
+            else:
+                defaults.append(encode_default(field))  # an empty message clears the field
+        else:
+            value = getattr(entity, name)
+            if value == getattr(keyframe, name) and field.number != 1:
+                continue
+            if value != field.default_value:
+                setattr(delta, name, value)
+            else:
+                defaults.append(encode_default(field))
+    return delta.SerializeToString() + b"".join(defaults)
+
+
+def decode(content: Union[str, bytes]) -> Tuple[Proto.Entity, Set[int]]:
+    """An entity from the delta channel (keyframe or delta), and the field numbers present"""
+    data = base64.b64decode(content) if isinstance(content, str) else bytes(content)
+    return Proto.Entity.FromString(data), field_numbers(data)
+
+
+def is_keyframe(fields: Set[int]) -> bool:
+    return fields.issuperset(_ENTITY_FIELD_NUMBERS)
+
+
+def apply_delta(keyframe: Proto.Entity, delta: Proto.Entity, fields: Set[int]) -> Proto.Entity:
+    """A new entity: the keyframe with the fields present in the delta replaced"""
+    entity = Proto.Entity()
+    entity.CopyFrom(keyframe)
+    for number in fields:
+        field = _ENTITY_FIELDS_BY_NUMBER.get(number)
+        if field is None: continue
+        name = field.name
+        if field.type == _MESSAGE_TYPE:
+            value = getattr(delta, name)
+            if value.ByteSize() == 0:
+                entity.ClearField(name)
+            else:
+                getattr(entity, name).CopyFrom(value)
+        else:
+            setattr(entity, name, getattr(delta, name))
+    return entity
+
+
+class RTIEntityDeltaPublisher:
+    """Publishes entities on the entity delta channel as keyframes and deltas against them.
+    A keyframe is sent for an entity's first publish, every keyframe_interval seconds, when a delta
+    would be at least half the size of a keyframe, and for all entities when someone requests an
+    entity update (EntityOperation request_update, e.g. a late joining RTIEntityStore).
+    Publishing an unchanged entity sends nothing. With legacy_keyframes, keyframes and deleted
+    entities are also published as plain entities on the entity channel, for receivers without
+    delta support (which then only see the entity state as of the latest keyframe)."""
+
+    def __init__(self, rti: RTIClient, keyframe_interval: float = 30.0, legacy_keyframes: bool = True, subscribe: bool = True):
+        self.rti = rti
+        self.keyframe_interval = keyframe_interval
+        self.legacy_keyframes = legacy_keyframes
+        self.keyframes_published = 0
+        self.deltas_published = 0
+        self._publisher = rti.publisher(Channel.entity_delta, Proto.Entity)
+        self._entity_publisher = rti.publisher(Channel.entity, Proto.Entity) if legacy_keyframes else None
+        self._keyframes: Dict[str, Tuple[float, Proto.Entity, int]] = {}  # time, entity and size of the latest keyframes
+        self._last: Dict[str, Proto.Entity] = {}
+        self.subscribed = False
+        if subscribe: self.subscribe()
+
+    def subscribe(self):
+        if not self.subscribed:
+            self._operation_subscription = self.rti.subscribe(Channel.entity_operation, Proto.EntityOperation, self._on_operation)
+            self.subscribed = True
+
+    def unsubscribe(self):
+        if self.subscribed:
+            self.rti.unsubscribe(self._operation_subscription)
+            self.subscribed = False
+
+    def _on_operation(self, operation: Proto.EntityOperation):
+        if operation.HasField("request_update"):
+            self.publish_keyframes()
+
+    def publish(self, entity: Proto.Entity, now: Optional[float] = None) -> bool:
+        """Publish the entity as a keyframe or delta. Returns False if nothing changed since the last publish."""
+        if now is None: now = time.time()
+        if entity.deleted:
+            self._keyframes.pop(entity.id, None)
+            self._last.pop(entity.id, None)
+            self._send_keyframe(entity)
+            return True
+        last = self._last.get(entity.id)
+        if last is not None and last == entity:
+            return False
+        keyframe = self._keyframes.get(entity.id)
+        if keyframe is not None and now - keyframe[0] < self.keyframe_interval:
+            delta = encode_delta(entity, keyframe[1])
+            if len(delta) * 2 < keyframe[2]:
+                self._publisher.send_serialized(delta)
+                self.deltas_published += 1
+                self._remember(self._last, entity)
+                return True
+        size = self._send_keyframe(entity)
+        self._keyframes[entity.id] = (now, self._remember(self._last, entity), size)
+        return True
+
+    def publish_keyframes(self, now: Optional[float] = None):
+        """Publish the latest state of all entities as keyframes"""
+        if now is None: now = time.time()
+        for entity_id, entity in list(self._last.items()):
+            self._keyframes[entity_id] = (now, entity, self._send_keyframe(entity))
+
+    def remove(self, entity_id: str):
+        """Forget an entity without publishing it as deleted"""
+        self._keyframes.pop(entity_id, None)
+        self._last.pop(entity_id, None)
+
+    @staticmethod
+    def _remember(entities: Dict[str, Proto.Entity], entity: Proto.Entity) -> Proto.Entity:
+        copy = Proto.Entity()
+        copy.CopyFrom(entity)
+        entities[entity.id] = copy
+        return copy
+
+    def _send_keyframe(self, entity: Proto.Entity) -> int:
+        data = encode_keyframe(entity)
+        self._publisher.send_serialized(data)
+        if self._entity_publisher is not None:
+            self._entity_publisher.send(entity)
+        self.keyframes_published += 1
+        return len(data)
@@ -0,0 +1,247 @@
+# Local store of the shared entities, fed from the entity and position channels
+
+# Example usage:
+# entities = RTIEntityStore(rti)
+# ...
+# for entity in entities.find(domain=RTI.proto.AIR, affiliation=RTI.proto.FRIENDLY):
+#     print(entity.id, entity.position.geodetic.latitude)
+
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Union
+
+from . import RTIClient, proto as Proto, channel as Channel
+from .rtientitydelta import decode as decode_delta, is_keyframe, apply_delta
+
+_INDEXED_FIELDS = ("owner_client_id", "category", "domain", "affiliation", "part_of_entity_id")
+
+
+class RTIEntityStore:
+    """Keeps the live set of entities published on the entity channel, with the latest position
+    from the position channel merged into entity.position. Deleted entities are removed,
+    disabled entities are kept (find() skips them unless include_disabled=True).
+    Entities are indexed by owner client, category, domain, affiliation and part_of_entity_id,
+    so lookups on those cost the size of the result rather than a scan of all entities.
+    The stored messages are owned by the store - copy them before modifying.
+    With deltas=True, it also follows the entity delta channel (see RTIEntityDeltaPublisher),
+    merging deltas into the latest keyframe of the entity. A delta for an entity without a keyframe
+    (i.e. joined after it) is dropped and an entity update requested, at most every update_request_interval seconds."""
+
+    def __init__(self, rti: RTIClient, subscribe=True, request_update=True, deltas=False):
+        self.rti = rti
+        self.entities: Dict[str, Proto.Entity] = {}
+        self.positions: Dict[str, Proto.EntityPosition] = {}
+        self.disabled = set()
+        self.subscribed = False
+        self.deltas = deltas
+        self.missing_keyframes = 0
+        self.update_request_interval = 1.0
+        self._request_update = request_update
+        self._keyframes: Dict[str, Proto.Entity] = {}
+        self._last_update_request = None
+        self._indexes = {field: {} for field in _INDEXED_FIELDS}
+        self._lock = threading.RLock()
+        if subscribe: self.subscribe()
+
+    def on_entity(self, entity: Proto.Entity):
+        """Called after an entity has been added or updated. Override to add custom behavior."""
+        pass
+
+    def on_deleted(self, entity: Proto.Entity):
+        """Called after an entity has been removed from the store. Override to add custom behavior."""
+        pass
+
+    def on_position(self, entity_id: str, position: Proto.EntityPosition):
+        """Called after a position has been stored (and merged into its entity, if known)."""
+        pass
+
+    def subscribe(self):
+        if not self.subscribed:
+            self._entity_subscription = self.rti.subscribe(Channel.entity, Proto.Entity, self._on_entity_message)
+            self._position_subscription = self.rti.subscribe(Channel.position, Proto.EntityPosition, self._on_position_message)
+            if self.deltas:
+                # raw content, to see which fields are present on the wire
+                self._delta_subscription = self.rti.subscribe_text(Channel.entity_delta, self._on_delta_message, data_type=str(Proto.Entity))
+            self.subscribed = True
+            if self._request_update:
+                # ask the owners to publish their entities, so a late joiner gets the current set
+                if self.rti.connected:
+                    self.request_update()
+                else:
+                    self.rti.once("connect", self.request_update)
+
+    def unsubscribe(self):
+        if self.subscribed:
+            self.rti.unsubscribe(self._entity_subscription)
+            self.rti.unsubscribe(self._position_subscription)
+            if self.deltas:
+                self.rti.unsubscribe(self._delta_subscription)
+            self.subscribed = False
+
+    def request_update(self):
+        self._last_update_request = time.time()
+        message = Proto.EntityOperation()
+        message.request_update.SetInParent()
+        self.rti.publish(Channel.entity_operation, message)
+
+    def _on_entity_message(self, message: Proto.Entity):
+        if not message.id: return
+        if message.deleted:
+            self.remove(message.id)
+        elif self.deltas:
+            # a delta publisher's keyframes also come here - don't let a late copy undo the deltas since
+            if self._keyframes.get(message.id) == message: return
+            keyframe = Proto.Entity()
+            keyframe.CopyFrom(message)
+            self._keyframes[message.id] = keyframe
+            self.update(message)
+        else:
+            self.update(message)
+
+    def _on_delta_message(self, content: Union[str, bytes]):
+        delta, fields = decode_delta(content)
+        if not delta.id: return
+        if delta.deleted:
+            self.remove(delta.id)
+        elif is_keyframe(fields):
+            # keyframes encode unset message fields as empty ones - leave those unset,
+            # so the position from the position channel is kept and the legacy copy matches
+            keyframe = apply_delta(Proto.Entity(), delta, fields)
+            self._keyframes[delta.id] = keyframe
+            self.update(keyframe)
+        else:
+            keyframe = self._keyframes.get(delta.id)
+            if keyframe is None:
+                self.missing_keyframes += 1
+                if self.rti.connected and (self._last_update_request is None or
+                                           time.time() - self._last_update_request >= self.update_request_interval):
+                    self.request_update()
+                return
+            entity = apply_delta(keyframe, delta, fields)
+            if Proto.Entity.POSITION_FIELD_NUMBER not in fields:
+                entity.ClearField("position")  # keep the position from the position channel
+            self.update(entity)
+
+    def _on_position_message(self, message: Proto.EntityPosition):
+        if not message.id: return
+        self.update_position(message)
+
+    def update(self, message: Proto.Entity) -> Proto.Entity:
+        """Add or replace an entity. The message is copied. If it has no position,
+        the last known position of the entity is kept."""
+        entity = Proto.Entity()
+        entity.CopyFrom(message)
+        with self._lock:
+            previous = self.entities.get(entity.id)
+            if previous is not None:
+                self._unindex(previous)
+            if not entity.HasField("position"):
+                position = self.positions.get(entity.id)
+                if position is not None:
+                    entity.position.CopyFrom(position)
+            else:
+                self.positions[entity.id] = entity.position
+            self.entities[entity.id] = entity
+            if entity.disabled:
+                self.disabled.add(entity.id)
+            else:
+                self.disabled.discard(entity.id)
+            self._index(entity)
+        self.on_entity(entity)
+        return entity
+
+    def update_position(self, message: Proto.EntityPosition):
+        with self._lock:
+            entity = self.entities.get(message.id)
+            if entity is not None:
+                entity.position.CopyFrom(message)
+                self.positions[message.id] = entity.position
+            else:
+                position = Proto.EntityPosition()
+                position.CopyFrom(message)
+                self.positions[message.id] = position
+        self.on_position(message.id, self.positions[message.id])
+
+    def remove(self, entity_id: str) -> Optional[Proto.Entity]:
+        with self._lock:
+            self.positions.pop(entity_id, None)
+            self._keyframes.pop(entity_id, None)
+            self.disabled.discard(entity_id)
+            entity = self.entities.pop(entity_id, None)
+            if entity is not None:
+                self._unindex(entity)
+        if entity is not None:
+            self.on_deleted(entity)
+        return entity
+
+    def clear(self):
+        with self._lock:
+            self.entities.clear()
+            self.positions.clear()
+            self._keyframes.clear()
+            self.disabled.clear()
+            for index in self._indexes.values():
+                index.clear()
+
+    def _index(self, entity: Proto.Entity):
+        for field, index in self._indexes.items():
+            key = getattr(entity, field)
+            ids = index.get(key)
+            if ids is None:
+                ids = index[key] = set()
+            ids.add(entity.id)
+
+    def _unindex(self, entity: Proto.Entity):
+        for field, index in self._indexes.items():
+            key = getattr(entity, field)
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(entity.id)
+                if not ids: del index[key]
+
+    def get(self, entity_id: str) -> Optional[Proto.Entity]:
+        return self.entities.get(entity_id)
+
+    def __getitem__(self, entity_id: str) -> Proto.Entity:
+        return self.entities[entity_id]
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self.entities
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def __iter__(self) -> Iterator[Proto.Entity]:
+        with self._lock:
+            return iter(list(self.entities.values()))
+
+    def find_ids(self, include_disabled=False, **criteria) -> set:
+        """Ids of the entities matching all criteria, given as indexed field=value, e.g.
+        find_ids(domain=Proto.AIR, affiliation=Proto.FRIENDLY). Without criteria, all entities."""
+        for field in criteria:
+            if field not in self._indexes:
+                raise ValueError(f"Entities are not indexed by {field}, use one of {', '.join(_INDEXED_FIELDS)}")
+        with self._lock:
+            if criteria:
+                matches = sorted((self._indexes[field].get(value, ()) for field, value in criteria.items()), key=len)
+                ids = set(matches[0])
+                for other in matches[1:]:
+                    if not ids: break
+                    ids.intersection_update(other)
+            else:
+                ids = set(self.entities)
+            if not include_disabled:
+                ids.difference_update(self.disabled)
+        return ids
+
+    def find(self, include_disabled=False, **criteria) -> List[Proto.Entity]:
+        """Entities matching all criteria (see find_ids)"""
+        ids = self.find_ids(include_disabled, **criteria)
+        with self._lock:
+            return [self.entities[entity_id] for entity_id in ids if entity_id in self.entities]
+
+    def owned_by(self, client_id: str, include_disabled=True) -> List[Proto.Entity]:
+        return self.find(include_disabled, owner_client_id=client_id)
+
+    def parts_of(self, entity_id: str, include_disabled=True) -> List[Proto.Entity]:
+        return self.find(include_disabled, part_of_entity_id=entity_id)
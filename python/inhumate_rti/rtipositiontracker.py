@@ -0,0 +1,171 @@
+# Tracks the latest position of all entities, for sampling them at any time by dead reckoning.
+# Requires the optional 'numpy' package (pip install inhumate-rti[numpy]).
+
+# Example usage:
+# tracker = RTIPositionTracker(rti)
+# while rendering:
+#     positions = tracker.positions_at()
+#     draw(positions.ids, positions.local)
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from . import RTIClient, proto as Proto, channel as Channel
+from .deadreckoning import axes, METERS_PER_DEGREE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# columns of the state array
+_TIME = 0
+_LOCAL = slice(1, 4)
+_GEODETIC = slice(4, 7)  # latitude, longitude, altitude
+_EULER = slice(7, 10)  # roll, pitch, yaw
+_VELOCITY = slice(10, 13)  # world x, y, z
+_ACCELERATION = slice(13, 16)
+_ANGULAR_VELOCITY = slice(16, 19)
+_SAMPLE = slice(0, 10)  # time, local, geodetic and euler of the latest update
+_PREVIOUS = slice(19, 29)  # ... and of the update before it
+_PREVIOUS_TIME = 19
+_PREVIOUS_LOCAL = slice(20, 23)
+_PREVIOUS_GEODETIC = slice(23, 26)
+_PREVIOUS_EULER = slice(26, 29)
+_COLUMNS = 29
+
+
+class PositionArrays:
+    """Positions of the tracked entities at one time, with one row per entity id.
+    local is (x, y, z), geodetic (latitude, longitude, altitude) and euler (roll, pitch, yaw),
+    NaN where the received positions had no such coordinates."""
+
+    def __init__(self, time: float, ids: List[str], local, geodetic, euler):
+        self.time = time
+        self.ids = ids
+        self.local = local
+        self.geodetic = geodetic
+        self.euler = euler
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"PositionArrays(time={self.time}, {len(self)} entities)"
+
+
+class RTIPositionTracker:
+    """Keeps the latest position received on the position channel of each entity, with its velocity,
+    acceleration and angular velocity rotated to world coordinates, in NumPy arrays. positions_at(t)
+    extrapolates all entities to time t at once (like deadreckoning.extrapolate, vectorized), so a display
+    or sensor can sample at its own frame rate. Extrapolation is limited to max_extrapolation seconds
+    past the latest update of an entity. For a time before the latest update, the position is interpolated
+    from the update before it (or is that update's, if earlier still) - never extrapolated backwards.
+    Times are time.time() of the receiving client."""
+
+    def __init__(self, rti: Optional[RTIClient] = None, max_extrapolation: float = 5.0, subscribe: bool = True):
+        if np is None:
+            raise ImportError("The position tracker requires the 'numpy' package (pip install inhumate-rti[numpy])")
+        self.rti = rti
+        self.max_extrapolation = max_extrapolation
+        self.subscribed = False
+        self._state = np.empty((64, _COLUMNS), dtype=np.float64)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if rti is not None and subscribe: self.subscribe()
+
+    def subscribe(self):
+        if not self.subscribed:
+            self._position_subscription = self.rti.subscribe(Channel.position, Proto.EntityPosition, self._on_position)
+            self._entity_subscription = self.rti.subscribe(Channel.entity, Proto.Entity, self._on_entity)
+            self.subscribed = True
+
+    def unsubscribe(self):
+        if self.subscribed:
+            self.rti.unsubscribe(self._position_subscription)
+            self.rti.unsubscribe(self._entity_subscription)
+            self.subscribed = False
+
+    def _on_position(self, position: Proto.EntityPosition):
+        if position.id: self.update(position)
+
+    def _on_entity(self, entity: Proto.Entity):
+        if entity.deleted:
+            self.remove(entity.id)
+
+    def update(self, position: Proto.EntityPosition, received: Optional[float] = None):
+        """Track a position, as received at time received (default now)"""
+        nan = float("nan")
+        row = [nan] * _PREVIOUS.start
+        row[_TIME] = time.time() if received is None else received
+        if position.HasField("local"):
+            row[_LOCAL] = (position.local.x, position.local.y, position.local.z)
+        if position.HasField("geodetic"):
+            row[_GEODETIC] = (position.geodetic.latitude, position.geodetic.longitude, position.geodetic.altitude)
+        if position.HasField("euler_rotation"):
+            row[_EULER] = (position.euler_rotation.roll, position.euler_rotation.pitch, position.euler_rotation.yaw)
+        velocity, acceleration, angular_velocity = position.velocity, position.acceleration, position.angular_velocity
+        forward, right, up = axes(position)
+        row[_VELOCITY] = [velocity.forward * f + velocity.right * r + velocity.up * u for f, r, u in zip(forward, right, up)]
+        row[_ACCELERATION] = [acceleration.forward * f + acceleration.right * r + acceleration.up * u for f, r, u in zip(forward, right, up)]
+        row[_ANGULAR_VELOCITY] = (angular_velocity.roll, angular_velocity.pitch, angular_velocity.yaw)
+        with self._lock:
+            index = self._rows.get(position.id)
+            if index is None:
+                index = len(self._ids)
+                if index == len(self._state):
+                    self._state = np.concatenate((self._state, np.empty_like(self._state)))
+                self._ids.append(position.id)
+                self._rows[position.id] = index
+                self._state[index, _PREVIOUS] = nan
+            else:
+                self._state[index, _PREVIOUS] = self._state[index, _SAMPLE]
+            self._state[index, :_PREVIOUS.start] = row
+
+    def remove(self, entity_id: str):
+        with self._lock:
+            index = self._rows.pop(entity_id, None)
+            if index is None: return
+            last = len(self._ids) - 1
+            if index != last:
+                # move the last entity into the freed row, to keep the state contiguous
+                self._state[index] = self._state[last]
+                self._ids[index] = self._ids[last]
+                self._rows[self._ids[index]] = index
+            self._ids.pop()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._rows
+
+    def positions_at(self, t: Optional[float] = None) -> PositionArrays:
+        """Positions of all tracked entities at time t (default now), extrapolated from the latest update
+        or interpolated between the latest two"""
+        if t is None: t = time.time()
+        with self._lock:
+            state = self._state[:len(self._ids)].copy()
+            ids = list(self._ids)
+        elapsed = np.clip(t - state[:, _TIME], 0, self.max_extrapolation)[:, None]
+        displacement = state[:, _VELOCITY] * elapsed + 0.5 * state[:, _ACCELERATION] * (elapsed * elapsed)
+        local = state[:, _LOCAL] + displacement
+        geodetic = state[:, _GEODETIC]
+        geodetic[:, 0] += displacement[:, 2] / METERS_PER_DEGREE
+        geodetic[:, 1] += displacement[:, 0] / (METERS_PER_DEGREE * np.maximum(np.cos(np.radians(geodetic[:, 0])), 1e-6))
+        geodetic[:, 2] += displacement[:, 1]
+        euler = state[:, _EULER] + state[:, _ANGULAR_VELOCITY] * elapsed
+        earlier = (t < state[:, _TIME]) & (state[:, _PREVIOUS_TIME] < state[:, _TIME])  # False for NaN
+        if earlier.any():
+            previous, latest = state[earlier, _PREVIOUS_TIME], state[earlier, _TIME]
+            fraction = np.clip((t - previous) / (latest - previous), 0, 1)[:, None]
+            for result, column, previous_column in ((local, _LOCAL, _PREVIOUS_LOCAL), (geodetic, _GEODETIC, _PREVIOUS_GEODETIC)):
+                start = state[earlier, previous_column]
+                result[earlier] = start + (state[earlier, column] - start) * fraction
+            start = state[earlier, _PREVIOUS_EULER]
+            turn = (state[earlier, _EULER] - start + 180) % 360 - 180  # the short way around
+            euler[earlier] = start + turn * fraction
+        euler[:, 2] %= 360
+        return PositionArrays(t, ids, local, geodetic, euler)
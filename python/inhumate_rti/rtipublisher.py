@@ -0,0 +1,63 @@
+# Prepared publisher, for sending many messages on one channel
+
+# Example usage:
+# publisher = rti.publisher(RTI.channel.position, RTI.proto.EntityPosition)
+# while running:
+#     publisher.send(position)
+
+import base64
+import sys
+from typing import Optional, Type, Union
+
+from google.protobuf import message as _message
+
+
+class RTIPublisher:
+    """Publishes on one channel, with everything that does not depend on the message - channel
+    registration, federated channel name and the start of the publish frame - done once,
+    when the publisher is created. message_class None publishes text."""
+
+    def __init__(self, rti, channel_name: str, message_class: Optional[Type[_message.Message]] = None, register: bool = True):
+        if not channel_name: raise ValueError("Cannot publish with undefined/empty channel name")
+        self.rti = rti
+        self.channel_name = channel_name
+        self.message_class = message_class
+        if register:
+            rti._register_channel_usage(channel_name, True, data_type=str(message_class) if message_class is not None else "text")
+        socket_channel_name = channel_name
+        if rti.federation and not channel_name.startswith("@"):
+            socket_channel_name = "//" + rti.federation + "/" + channel_name
+        self.socket_channel_name = socket_channel_name
+        self._prefix = rti.socket.publish_prefix(socket_channel_name)
+        self._binary_prefix = rti.socket.binary_publish_prefix(socket_channel_name)
+
+    def send(self, message: Union[_message.Message, str]) -> None:
+        rti = self.rti
+        if not rti.first_connected:
+            print("RTI can't publish before connected - message dropped", file=sys.stderr)
+            return
+        socket = rti.socket
+        if self.message_class is None:
+            coalesce_key = rti._coalesce_key(self.channel_name, None) if socket.coalesce else None
+            socket.publish_prepared(self._prefix, socket.codec.dumps(message), coalesce_key)
+            return
+        coalesce_key = rti._coalesce_key(self.channel_name, message) if socket.coalesce else None
+        if socket.binary:
+            socket.publish_binary_prepared(self._binary_prefix, message.SerializeToString(), coalesce_key)
+        else:
+            # base64 needs no JSON escaping
+            socket.publish_prepared(self._prefix, '"' + base64.b64encode(message.SerializeToString()).decode("ascii") + '"', coalesce_key)
+
+    def send_serialized(self, data: bytes, message: Optional[_message.Message] = None) -> None:
+        """Publish an already serialized message, e.g. with fields encoded by hand.
+        message, if given, is only used for publish coalescing on state channels."""
+        rti = self.rti
+        if not rti.first_connected:
+            print("RTI can't publish before connected - message dropped", file=sys.stderr)
+            return
+        socket = rti.socket
+        coalesce_key = rti._coalesce_key(self.channel_name, message) if socket.coalesce else None
+        if socket.binary:
+            socket.publish_binary_prepared(self._binary_prefix, data, coalesce_key)
+        else:
+            socket.publish_prepared(self._prefix, '"' + base64.b64encode(data).decode("ascii") + '"', coalesce_key)
@@ -25,7 +25,7 @@ class StepGrant:
 
 class RTIRuntimeControl:
 
-    def __init__(self, rti: RTIClient, subscribe=True, fast_time=False, step_fn=None):
+    def __init__(self, rti: RTIClient, subscribe=True, fast_time=False, step_fn=None, fast_time_dispatch=DispatchMode.BUFFERED):
         self.rti = rti
         rti.capabilities.add(Capability.runtime_control)
         rti.capabilities.add(Capability.scenario)
@@ -41,6 +41,7 @@ class RTIRuntimeControl:
         self._fast_time_enabled = fast_time or step_fn is not None
         self._fast_time_run_id = None
         self._fast_time_controller_client_id = None
+        self._fast_time_dispatch = fast_time_dispatch
         self._grant_queue = Queue()
 
         if self._fast_time_enabled:
@@ -118,6 +119,8 @@ class RTIRuntimeControl:
             if reason:
                 msg.step_complete.reason = reason
         self.rti.publish(Channel.fast_time_control, msg)
+        # with publish batching, make sure the step's output goes out before the controller moves on
+        self.rti.flush()
 
     def reset(self):
         message = Proto.RuntimeControl()
@@ -241,7 +244,7 @@ class RTIRuntimeControl:
                 self._reset_fast_time()
         elif message.HasField("step_grant") and message.step_grant.run_id == self._fast_time_run_id:
             grant = StepGrant(message.step_grant, self._fast_time_run_id)
-            self.rti.default_dispatch_mode = DispatchMode.BUFFERED  # switch to BUFFERED on first step
+            self.rti.default_dispatch_mode = self._fast_time_dispatch  # switch to BUFFERED (or CONFLATED) on first step
             self.rti.flush_buffers()  # dispatch messages buffered since last step
             if self._step_fn:
                 try:
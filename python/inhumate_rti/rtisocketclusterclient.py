@@ -8,14 +8,28 @@
 #   https://github.com/ramazanpolat/socketcc
 
 
-import json
-from threading import Timer, Thread
+import struct
+from threading import Timer, Thread, Condition, Lock, local
+from contextlib import contextmanager
 from typing import Callable, Any
 from enum import Enum, auto
 import websocket
 import select
 import time
 
+from .jsoncodec import default_codec
+
+
+# Binary transport: when negotiated in the handshake, protobuf channel payloads are sent
+# as binary websocket frames instead of base64 strings in #publish JSON envelopes.
+# Frame layout: frame type (1 byte), channel name length (uint16, big-endian),
+# channel name (utf-8), raw payload.
+BINARY_PROTOCOL_VERSION = 1
+BINARY_PUBLISH = 1
+BINARY_BATCH = 2
+_binary_header = struct.Struct(">BH")
+_binary_batch_length = struct.Struct(">I")
+
 
 class EventEnum(Enum):
     PUBLISH = auto()
@@ -86,8 +100,10 @@ class MainLoopDispatcher:
         self.main_loop()
 
 class RTISocketClusterClient:
-    def __init__(self, url, main_loop, idle_time, max_message_size_bytes=16 * 1024 * 1024):
+    def __init__(self, url, main_loop, idle_time, max_message_size_bytes=16 * 1024 * 1024, binary=False, codec=None):
         self.url = url
+        self.codec = codec if codec is not None else default_codec()
+        self._publish_prefixes = {}
         self.main_loop = main_loop
         self.idle_time = idle_time
         self.max_message_size_bytes = max_message_size_bytes
@@ -103,6 +119,20 @@ class RTISocketClusterClient:
         self.ws = None
         self.on_connected = self.on_disconnected = self.on_connect_error = self.on_set_auth = self.on_auth = self.on_remove_auth = None
         self.ever_connected = False
+        self.binary_requested = binary
+        self.binary = False
+        self.batch_max_delay = 0
+        self.batch_max_bytes = 0
+        self.coalesce = False
+        self.coalesced_count = 0
+        self._batch = []
+        self._batch_keys = {}
+        self._batch_bytes = 0
+        self._batch_time = 0
+        self._batch_condition = Condition()
+        self._batch_thread = None
+        self._flush_lock = Lock()
+        self._local = local()
 
     @staticmethod
     def parse2(rid, event) -> EventEnum:
@@ -151,38 +181,194 @@ class RTISocketClusterClient:
         emit_obj = {"event": event, "data": obj}
         if ack:
             emit_obj['cid'] = self.get_and_increment()
-        self.ws.send(json.dumps(emit_obj, sort_keys=True))
+        self.ws.send(self.codec.dumps(emit_obj))
         if ack:
             self.acks[self.count] = [event, ack]
-        # logging.info("Emit data is " + json.dumps(emit_obj, sort_keys=True))
 
     def sub(self, channel):
         sub_obj = {"event": "#subscribe", "data": {"channel": channel}, "cid": self.get_and_increment()}
-        self.ws.send(json.dumps(sub_obj, sort_keys=True))
+        self.ws.send(self.codec.dumps(sub_obj))
 
     def subscribe(self, channel, ack=None):
         obj = {"channel": channel}
         sub_obj = {"event": "#subscribe", "data": obj, "cid": self.get_and_increment()}
-        self.ws.send(json.dumps(sub_obj, sort_keys=True))
+        self.ws.send(self.codec.dumps(sub_obj))
         if channel not in self.channels: self.channels.append(channel)
         if ack:
             self.acks[self.count] = [channel, ack]
 
     def unsubscribe(self, channel, ack=None):
         sub_obj = {"event": "#unsubscribe", "data": channel, "cid": self.get_and_increment()}
-        self.ws.send(json.dumps(sub_obj, sort_keys=True))
+        self.ws.send(self.codec.dumps(sub_obj))
         if channel in self.channels: self.channels.remove(channel)
+        self.map.pop(channel, None)
         if ack:
             self.acks[self.count] = [channel, ack]
 
-    def publish(self, channel, data, ack=None):
-        if not self.ws or not self.ever_connected: 
+    def publish(self, channel, data, ack=None, coalesce_key=None):
+        self.publish_prepared(self.publish_prefix(channel), self.codec.dumps(data), coalesce_key, ack, channel)
+
+    def publish_prefix(self, channel):
+        """The static start of a #publish frame for a channel, rendered once per channel"""
+        prefix = self._publish_prefixes.get(channel)
+        if prefix is None:
+            if len(self._publish_prefixes) >= 10000:
+                self._publish_prefixes.clear()
+            prefix = '{"event":"#publish","data":{"channel":' + self.codec.dumps(channel) + ',"data":'
+            self._publish_prefixes[channel] = prefix
+        return prefix
+
+    def publish_prepared(self, prefix, encoded_data, coalesce_key=None, ack=None, ack_channel=None):
+        """Publish with a prefix from publish_prefix() and data already encoded as JSON"""
+        if not self.ws or not self.ever_connected:
             raise Exception("Cannot publish before connected")
-        obj = {"channel": channel, "data": data}
-        pub_obj = {"event": "#publish", "data": obj, "cid": self.get_and_increment()}
-        self.ws.send(json.dumps(pub_obj, sort_keys=True))
+        cid = self.get_and_increment()
         if ack:
-            self.acks[self.count] = [channel, ack]
+            self.acks[cid] = [ack_channel, ack]
+        frame = prefix + encoded_data + '},"cid":' + str(cid) + "}"
+        if self.batch_max_delay > 0 or self.coalesce:
+            self._queue_frame(frame, coalesce_key)
+        elif getattr(self._local, "frames", None) is not None:
+            self._local.frames.append(frame)
+        else:
+            self.ws.send(frame)
+
+    def publish_binary(self, channel, payload, coalesce_key=None):
+        self.publish_binary_prepared(self.binary_publish_prefix(channel), payload, coalesce_key)
+
+    @staticmethod
+    def binary_publish_prefix(channel):
+        """The header of a binary publish frame for a channel"""
+        channel_bytes = channel.encode("utf8")
+        return _binary_header.pack(BINARY_PUBLISH, len(channel_bytes)) + channel_bytes
+
+    def publish_binary_prepared(self, prefix, payload, coalesce_key=None):
+        if not self.ws or not self.ever_connected:
+            raise Exception("Cannot publish before connected")
+        if not self.binary:
+            raise Exception("Binary transport not negotiated with broker")
+        frame = prefix + payload
+        if self.batch_max_delay > 0 or self.coalesce:
+            self._queue_frame(frame, coalesce_key)
+        elif getattr(self._local, "frames", None) is not None:
+            self._local.frames.append(frame)
+        else:
+            self.ws.send(frame, websocket.ABNF.OPCODE_BINARY)
+
+    def set_batching(self, max_delay, max_bytes=64 * 1024):
+        """Queue outgoing publishes and send them as batch frames - a JSON array of events, as
+        understood by SocketCluster servers, or a binary batch frame - at most max_delay seconds
+        after the first one was queued, or as soon as max_bytes are pending.
+        max_delay <= 0 disables batching."""
+        self.flush()
+        self.batch_max_bytes = max_bytes
+        self.batch_max_delay = max_delay
+        self._start_send_queue()
+
+    def set_coalescing(self, enabled):
+        """Send publishes through a queue drained by a sender thread. A publish with a coalesce
+        key replaces a pending (not yet sent) publish with the same key, so when the link is
+        congested only the latest state per key waits to be sent."""
+        self.flush()
+        self.coalesce = enabled
+        self._start_send_queue()
+
+    def _start_send_queue(self):
+        if (self.batch_max_delay > 0 or self.coalesce) and self._batch_thread is None:
+            self._batch_thread = Thread(target=self._batch_thread_func)
+            self._batch_thread.daemon = True
+            self._batch_thread.start()
+        else:
+            with self._batch_condition:
+                self._batch_condition.notify()
+
+    def _queue_frame(self, frame, coalesce_key=None):
+        with self._batch_condition:
+            if coalesce_key is not None:
+                index = self._batch_keys.get(coalesce_key)
+                if index is not None:
+                    self._batch_bytes += len(frame) - len(self._batch[index])
+                    self._batch[index] = frame
+                    self.coalesced_count += 1
+                    return
+                self._batch_keys[coalesce_key] = len(self._batch)
+            if not self._batch:
+                self._batch_time = time.time()
+                self._batch_condition.notify()
+            self._batch.append(frame)
+            self._batch_bytes += len(frame)
+            # coalescing only (no batch delay): the sender thread drains the queue, never the publisher
+            full = self.batch_max_delay > 0 and self._batch_bytes >= self.batch_max_bytes
+        if full:
+            self.flush()
+
+    def _batch_thread_func(self):
+        while True:
+            with self._batch_condition:
+                while not self._batch:
+                    self._batch_condition.wait()
+                remaining = self._batch_time + self.batch_max_delay - time.time()
+                if remaining > 0:
+                    self._batch_condition.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                self._protocol_error(e)
+
+    def flush(self):
+        """Send all queued publishes now."""
+        with self._flush_lock:
+            with self._batch_condition:
+                frames = self._batch
+                self._batch = []
+                self._batch_keys = {}
+                self._batch_bytes = 0
+            if self.batch_max_delay <= 0:
+                for frame in frames:
+                    self._send_batch([frame])
+                return
+            self._send_batches(frames)
+
+    @contextmanager
+    def batch(self):
+        """Collect the publishes made by the current thread within the block, and send them
+        as batch frames at the end of it (unless batching or coalescing queues them anyway)."""
+        if getattr(self._local, "frames", None) is not None:
+            yield  # already batching
+            return
+        self._local.frames = []
+        try:
+            yield
+        finally:
+            frames = self._local.frames
+            self._local.frames = None
+            if frames:
+                with self._flush_lock:
+                    self._send_batches(frames)
+
+    def _send_batches(self, frames):
+        # consecutive frames of the same kind (text/binary) go out as one batch frame
+        start = 0
+        for end in range(1, len(frames) + 1):
+            if end == len(frames) or type(frames[end]) is not type(frames[start]):
+                self._send_batch(frames[start:end])
+                start = end
+
+    def _send_batch(self, frames):
+        if isinstance(frames[0], bytes):
+            if len(frames) == 1:
+                self.ws.send(frames[0], websocket.ABNF.OPCODE_BINARY)
+            else:
+                parts = [_binary_header.pack(BINARY_BATCH, 0)]
+                for frame in frames:
+                    parts.append(_binary_batch_length.pack(len(frame)))
+                    parts.append(frame)
+                self.ws.send(b"".join(parts), websocket.ABNF.OPCODE_BINARY)
+        elif len(frames) == 1:
+            self.ws.send(frames[0])
+        else:
+            self.ws.send("[" + ",".join(frames) + "]")
 
     def subscribe_channels(self):
         for channel in self.channels:
@@ -190,10 +376,11 @@ class RTISocketClusterClient:
 
     def ack(self, cid):
         ws = self.ws
+        codec = self.codec
 
         def message_ack(error, data):
             ack_object = {"error": error, "data": data, "rid": cid}
-            ws.send(json.dumps(ack_object, sort_keys=True))
+            ws.send(codec.dumps(ack_object))
 
         return message_ack
 
@@ -205,14 +392,29 @@ class RTISocketClusterClient:
         if self.on_connect_error is not None:
             self.on_connect_error(self, error)
 
-    def _message_size(self, message):
-        if isinstance(message, bytes):
-            return len(message)
-        return len(str(message).encode("utf8"))
-
-    def on_message(self, ws, message):
+    def _exceeds_max_size(self, message):
+        if isinstance(message, str):
+            # utf-8 takes 1 to 4 bytes per character, so only encode when the bounds don't decide
+            if len(message) > self.max_message_size_bytes:
+                return True
+            if len(message) * 4 <= self.max_message_size_bytes or message.isascii():
+                return False
+            return len(message.encode("utf8")) > self.max_message_size_bytes
+        return len(message) > self.max_message_size_bytes
+
+    def on_data(self, ws, data, opcode, fin):
+        # websocket-client callback, with text frames as raw (not validated or decoded) utf-8
+        # bytes, which are parsed as such
+        if opcode == websocket.ABNF.OPCODE_TEXT:
+            self.on_message(ws, data, True)
+        elif opcode == websocket.ABNF.OPCODE_BINARY:
+            self.on_message(ws, data)
+
+    def on_message(self, ws, message, text=False):
+        """Handle a received frame: a str (text frame), bytes (binary frame) or, with text=True,
+        the raw bytes of a text frame"""
         try:
-            if self.max_message_size_bytes > 0 and self._message_size(message) > self.max_message_size_bytes:
+            if self.max_message_size_bytes > 0 and self._exceeds_max_size(message):
                 self._protocol_error(Exception("RTI message exceeded maximum size"))
                 try:
                     ws.close(status=1009, reason="RTI message exceeded maximum size")
@@ -220,67 +422,118 @@ class RTISocketClusterClient:
                     ws.close()
                 return
 
-            if message == "#1":
+            if isinstance(message, str):
+                if message == "#1":
+                    self.ws.send("#2")
+                    return
+                elif message == "":
+                    self.ws.send("")
+                    return
+            elif not text:
+                self._on_binary_message(memoryview(message))
+                return
+            elif message == b"#1":
                 self.ws.send("#2")
                 return
-            elif message == "":
+            elif message == b"":
                 self.ws.send("")
                 return
 
-            main_obj = json.loads(message)
-            if not isinstance(main_obj, dict):
-                raise ValueError("RTI protocol message must be a JSON object")
-
-            data_obj = main_obj.get("data", {})
-            rid = main_obj.get("rid", "")
-            cid = main_obj.get("cid", "")
-            event = main_obj.get("event", "")
-
-            result = self.parse2(rid, event)
-            if result == EventEnum.AUTHENTICATED:
-                if self.on_auth is not None:
-                    if not isinstance(data_obj, dict):
-                        raise ValueError("RTI authentication response data must be a JSON object")
-                    self.id = data_obj.get("id", "")
-                    self.on_auth(self, data_obj.get("isAuthenticated", False))
-                self.subscribe_channels()
-            elif result == EventEnum.PUBLISH:
-                if not isinstance(data_obj, dict) or "channel" not in data_obj or "data" not in data_obj:
-                    raise ValueError("RTI publish message missing channel or data")
-                self.execute(data_obj["channel"], data_obj["data"])
-            elif result == EventEnum.REMOVE_AUTH_TOKEN:
-                self.auth_token = None
-                if self.on_remove_auth is not None:
-                    self.on_remove_auth(self)
-            elif result == EventEnum.SET_AUTH_TOKEN:
-                if self.on_set_auth is not None:
-                    if not isinstance(data_obj, dict) or "token" not in data_obj:
-                        raise ValueError("RTI set-auth-token message missing token")
-                    self.on_set_auth(self, data_obj["token"])
-            elif result == EventEnum.EVENT_CID:
-                if self.has_event_ack(event):
-                    self.execute_ack(event, data_obj, self.ack(cid))
-                else:
-                    self.execute(event, data_obj)
+            main_obj = self.codec.loads(message)
+            if isinstance(main_obj, list):
+                # batch of events
+                for packet in main_obj:
+                    try:
+                        self._on_packet(packet)
+                    except Exception as e:
+                        self._protocol_error(e)
             else:
-                if rid in self.acks:
-                    tup = self.acks.pop(rid)
-                    if tup is not None:
-                        ack = tup[1]
-                        ack(tup[0], main_obj.get("error"), main_obj.get("data"))
+                self._on_packet(main_obj)
         except Exception as e:
             self._protocol_error(e)
 
+    def _on_packet(self, main_obj):
+        if not isinstance(main_obj, dict):
+            raise ValueError("RTI protocol message must be a JSON object")
+
+        data_obj = main_obj.get("data", {})
+        rid = main_obj.get("rid", "")
+        cid = main_obj.get("cid", "")
+        event = main_obj.get("event", "")
+
+        result = self.parse2(rid, event)
+        if result == EventEnum.AUTHENTICATED:
+            if isinstance(data_obj, dict):
+                self.binary = bool(self.binary_requested and data_obj.get("binary"))
+            if self.on_auth is not None:
+                if not isinstance(data_obj, dict):
+                    raise ValueError("RTI authentication response data must be a JSON object")
+                self.id = data_obj.get("id", "")
+                self.on_auth(self, data_obj.get("isAuthenticated", False))
+            self.subscribe_channels()
+        elif result == EventEnum.PUBLISH:
+            if not isinstance(data_obj, dict) or "channel" not in data_obj or "data" not in data_obj:
+                raise ValueError("RTI publish message missing channel or data")
+            self.execute(data_obj["channel"], data_obj["data"])
+        elif result == EventEnum.REMOVE_AUTH_TOKEN:
+            self.auth_token = None
+            if self.on_remove_auth is not None:
+                self.on_remove_auth(self)
+        elif result == EventEnum.SET_AUTH_TOKEN:
+            if self.on_set_auth is not None:
+                if not isinstance(data_obj, dict) or "token" not in data_obj:
+                    raise ValueError("RTI set-auth-token message missing token")
+                self.on_set_auth(self, data_obj["token"])
+        elif result == EventEnum.EVENT_CID:
+            if self.has_event_ack(event):
+                self.execute_ack(event, data_obj, self.ack(cid))
+            else:
+                self.execute(event, data_obj)
+        else:
+            if rid in self.acks:
+                tup = self.acks.pop(rid)
+                if tup is not None:
+                    ack = tup[1]
+                    ack(tup[0], main_obj.get("error"), main_obj.get("data"))
+
+    def _on_binary_message(self, message):
+        if len(message) < _binary_header.size:
+            raise ValueError("RTI binary message too short")
+        frame_type, channel_length = _binary_header.unpack_from(message)
+        if frame_type == BINARY_BATCH:
+            position = _binary_header.size
+            while position < len(message):
+                if position + _binary_batch_length.size > len(message):
+                    raise ValueError("RTI binary batch truncated")
+                length, = _binary_batch_length.unpack_from(message, position)
+                position += _binary_batch_length.size
+                if position + length > len(message):
+                    raise ValueError("RTI binary batch truncated")
+                self._on_binary_message(message[position:position + length])  # memoryview slice, no copy
+                position += length
+            return
+        if frame_type != BINARY_PUBLISH:
+            raise ValueError(f"RTI binary message has unknown type {frame_type}")
+        payload_start = _binary_header.size + channel_length
+        if len(message) < payload_start:
+            raise ValueError("RTI binary message truncated")
+        channel = bytes(message[_binary_header.size:payload_start]).decode("utf8")
+        # payload is a memoryview into the received frame, parsed without copying
+        self.execute(channel, message[payload_start:])
+
     def on_open(self, ws):
         self.reset_count()
         self.ever_connected = True
-        
+        self.binary = False
+
         if self.on_connected is not None:
             self.on_connected(self)
 
         obj = {"authToken": self.auth_token}
+        if self.binary_requested:
+            obj["binary"] = BINARY_PROTOCOL_VERSION
         handshake_obj = {"event": "#handshake", "data": obj, "cid": self.get_and_increment()}
-        self.ws.send(json.dumps(handshake_obj, sort_keys=True))
+        self.ws.send(self.codec.dumps(handshake_obj))
 
     def on_close(self, ws, status_code, message):
         if self.on_disconnected is not None:
@@ -314,13 +567,13 @@ class RTISocketClusterClient:
             # reconnect will be handled by dispatcher
             return
         try:
-            self.ws = websocket.WebSocketApp(self.url, on_message=self.on_message, on_error=self.on_error, on_close=self.on_close)
+            self.ws = websocket.WebSocketApp(self.url, on_data=self.on_data, on_error=self.on_error, on_close=self.on_close)
             self.ws.on_open = self.on_open
             if not self.ever_connected and self.main_loop:
                 dispatcher = MainLoopDispatcher(self.ws, self.main_loop, self.idle_time)
                 while not dispatcher.done:
                     try:
-                        self.ws.run_forever(sslopt=sslopt, http_proxy_host=http_proxy_host, http_proxy_port=http_proxy_port, dispatcher=dispatcher)
+                        self.ws.run_forever(sslopt=sslopt, http_proxy_host=http_proxy_host, http_proxy_port=http_proxy_port, dispatcher=dispatcher, skip_utf8_validation=True)
                     except websocket.WebSocketException as e:
                         if "already opened" in str(e):
                             self.ws.close()
@@ -334,7 +587,7 @@ class RTISocketClusterClient:
                     else:
                         dispatcher.delay(self.reconnect_delay)
             else:
-                self.ws.run_forever(sslopt=sslopt, http_proxy_host=http_proxy_host, http_proxy_port=http_proxy_port)
+                self.ws.run_forever(sslopt=sslopt, http_proxy_host=http_proxy_host, http_proxy_port=http_proxy_port, skip_utf8_validation=True)
         except (KeyboardInterrupt, SystemExit):
             raise
 
@@ -358,6 +611,10 @@ class RTISocketClusterClient:
 
     def disconnect(self):
         self.enable_reconnect = False
+        try:
+            self.flush()
+        except Exception as e:
+            self._protocol_error(e)
         self.ws.close()
 
     emit_ack = transmit
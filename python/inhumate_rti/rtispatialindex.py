@@ -0,0 +1,258 @@
+# Spatial index of entity positions, fed from the position channel.
+# Requires the optional 'numpy' package (pip install inhumate-rti[numpy]).
+
+# Example usage:
+# index = RTISpatialIndex(rti, cell_size=1000)
+# ...
+# nearby = index.within_radius("entity1", 5000)
+# area = index.subscribe_area((0, 0), 2000, lambda position: print(position.id))
+# area.move((100, 50))
+
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from . import RTIClient, proto as Proto, channel as Channel
+from .deadreckoning import METERS_PER_DEGREE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Point = Union[Tuple[float, float], str, Proto.EntityPosition]
+
+
+class AreaOfInterest:
+    """A circular region of an RTISpatialIndex. The handler is called with the position updates of
+    entities inside the region. Move it with move(), remove it with RTISpatialIndex.unsubscribe_area()."""
+
+    def __init__(self, index: "RTISpatialIndex", center: Tuple[float, float], radius: float, handler: Callable):
+        self.index = index
+        self.center = center
+        self.radius = radius
+        self.handler = handler
+
+    def move(self, center: Point, radius: Optional[float] = None):
+        self.center = self.index.point(center)
+        if radius is not None:
+            self.radius = radius
+
+    def contains(self, x: float, z: float) -> bool:
+        return (x - self.center[0]) ** 2 + (z - self.center[1]) ** 2 <= self.radius * self.radius
+
+    def entity_ids(self) -> List[str]:
+        """The entities currently inside the region"""
+        return self.index.within_radius(self.center, self.radius)
+
+
+class RTISpatialIndex:
+    """Uniform grid over the horizontal positions of entities, with the coordinates in a NumPy
+    array so that queries only compute distances for the entities in the grid cells that overlap
+    the query region, vectorized.
+
+    Coordinates are horizontal (x, z) in meters: local.x (east) and local.z (north) of the positions,
+    or with geodetic=True the longitude/latitude projected onto a plane tangent at origin
+    (latitude, longitude) - default the first position received. The projection is equirectangular,
+    so distances are accurate to well under a percent within a few hundred kilometers of the origin.
+    Query centers can be given as (x, z), an entity id or an EntityPosition."""
+
+    def __init__(self, rti: Optional[RTIClient] = None, cell_size: float = 1000, geodetic: bool = False,
+                 origin: Optional[Tuple[float, float]] = None, subscribe: bool = True):
+        if np is None:
+            raise ImportError("The spatial index requires the 'numpy' package (pip install inhumate-rti[numpy])")
+        if cell_size <= 0: raise ValueError("cell_size must be positive")
+        self.rti = rti
+        self.cell_size = float(cell_size)
+        self.geodetic = geodetic
+        self.origin = None
+        if origin is not None: self.set_origin(*origin)
+        self.subscribed = False
+        self.areas: List[AreaOfInterest] = []
+        self._coordinates = np.empty((64, 2), dtype=np.float64)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._cell_of: List[Tuple[int, int]] = []
+        self._cells: Dict[Tuple[int, int], set] = {}
+        self._lock = threading.RLock()
+        if rti is not None and subscribe: self.subscribe()
+
+    def subscribe(self):
+        if not self.subscribed:
+            self._position_subscription = self.rti.subscribe(Channel.position, Proto.EntityPosition, self.update)
+            self._entity_subscription = self.rti.subscribe(Channel.entity, Proto.Entity, self._on_entity)
+            self.subscribed = True
+
+    def unsubscribe(self):
+        if self.subscribed:
+            self.rti.unsubscribe(self._position_subscription)
+            self.rti.unsubscribe(self._entity_subscription)
+            self.subscribed = False
+
+    def _on_entity(self, entity: Proto.Entity):
+        if entity.deleted:
+            self.remove(entity.id)
+
+    def set_origin(self, latitude: float, longitude: float):
+        self.origin = (latitude, longitude)
+        self._meters_per_degree_latitude = METERS_PER_DEGREE
+        self._meters_per_degree_longitude = self._meters_per_degree_latitude * math.cos(math.radians(latitude))
+
+    def project(self, position: Proto.EntityPosition) -> Optional[Tuple[float, float]]:
+        """Index coordinates of a position, or None if it lacks the used (local/geodetic) coordinates"""
+        if self.geodetic:
+            if not position.HasField("geodetic"): return None
+            geodetic = position.geodetic
+            if self.origin is None: self.set_origin(geodetic.latitude, geodetic.longitude)
+            return ((geodetic.longitude - self.origin[1]) * self._meters_per_degree_longitude,
+                    (geodetic.latitude - self.origin[0]) * self._meters_per_degree_latitude)
+        if not position.HasField("local"): return None
+        return (position.local.x, position.local.z)
+
+    def point(self, center: Point) -> Tuple[float, float]:
+        if isinstance(center, str):
+            row = self._rows.get(center)
+            if row is None: raise KeyError(f"Entity {center} is not in the spatial index")
+            return tuple(self._coordinates[row])
+        if isinstance(center, Proto.EntityPosition):
+            point = self.project(center)
+            if point is None: raise ValueError("Position has no coordinates to index")
+            return point
+        return (float(center[0]), float(center[1]))
+
+    def update(self, position: Proto.EntityPosition):
+        if not position.id: return
+        point = self.project(position)
+        if point is None: return
+        self.set(position.id, point[0], point[1])
+        for area in tuple(self.areas):
+            if area.contains(point[0], point[1]):
+                area.handler(position)
+
+    def set(self, entity_id: str, x: float, z: float):
+        cell = (math.floor(x / self.cell_size), math.floor(z / self.cell_size))
+        with self._lock:
+            row = self._rows.get(entity_id)
+            if row is None:
+                row = len(self._ids)
+                if row == len(self._coordinates):
+                    self._coordinates = np.concatenate((self._coordinates, np.empty_like(self._coordinates)))
+                self._ids.append(entity_id)
+                self._cell_of.append(cell)
+                self._rows[entity_id] = row
+                self._cells.setdefault(cell, set()).add(row)
+            elif self._cell_of[row] != cell:
+                self._remove_from_cell(row)
+                self._cell_of[row] = cell
+                self._cells.setdefault(cell, set()).add(row)
+            self._coordinates[row] = (x, z)
+
+    def remove(self, entity_id: str):
+        with self._lock:
+            row = self._rows.pop(entity_id, None)
+            if row is None: return
+            self._remove_from_cell(row)
+            last = len(self._ids) - 1
+            if row != last:
+                # move the last entity into the freed row, to keep the coordinates contiguous
+                moved_cell = self._cell_of[last]
+                rows = self._cells[moved_cell]
+                rows.discard(last)
+                rows.add(row)
+                self._ids[row] = self._ids[last]
+                self._cell_of[row] = moved_cell
+                self._coordinates[row] = self._coordinates[last]
+                self._rows[self._ids[row]] = row
+            self._ids.pop()
+            self._cell_of.pop()
+
+    def _remove_from_cell(self, row: int):
+        cell = self._cell_of[row]
+        rows = self._cells[cell]
+        rows.discard(row)
+        if not rows: del self._cells[cell]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._rows
+
+    def coordinates(self, entity_id: str) -> Optional[Tuple[float, float]]:
+        row = self._rows.get(entity_id)
+        return None if row is None else tuple(self._coordinates[row])
+
+    def _candidate_rows(self, min_x: float, min_z: float, max_x: float, max_z: float):
+        """Rows in the grid cells overlapping the box - all rows if that would mean visiting more cells than there are"""
+        count = len(self._ids)
+        min_cell_x, max_cell_x = math.floor(min_x / self.cell_size), math.floor(max_x / self.cell_size)
+        min_cell_z, max_cell_z = math.floor(min_z / self.cell_size), math.floor(max_z / self.cell_size)
+        if (max_cell_x - min_cell_x + 1) * (max_cell_z - min_cell_z + 1) >= len(self._cells):
+            return np.arange(count)
+        rows = []
+        cells = self._cells
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_z in range(min_cell_z, max_cell_z + 1):
+                cell = cells.get((cell_x, cell_z))
+                if cell: rows.extend(cell)
+        return np.array(rows, dtype=np.intp)
+
+    def _within_radius(self, x: float, z: float, radius: float):
+        rows = self._candidate_rows(x - radius, z - radius, x + radius, z + radius)
+        offsets = self._coordinates[rows] - (x, z)
+        distances = np.einsum("ij,ij->i", offsets, offsets)
+        inside = distances <= radius * radius
+        return rows[inside], distances[inside]
+
+    def within_radius(self, center: Point, radius: float) -> List[str]:
+        """Ids of the entities within radius meters (horizontally) of center"""
+        with self._lock:
+            x, z = self.point(center)
+            rows, _ = self._within_radius(x, z, radius)
+            ids = self._ids
+            return [ids[row] for row in rows]
+
+    def within_box(self, min_x: float, min_z: float, max_x: float, max_z: float) -> List[str]:
+        """Ids of the entities inside the box, in index coordinates"""
+        with self._lock:
+            rows = self._candidate_rows(min_x, min_z, max_x, max_z)
+            coordinates = self._coordinates[rows]
+            inside = ((coordinates[:, 0] >= min_x) & (coordinates[:, 0] <= max_x) &
+                      (coordinates[:, 1] >= min_z) & (coordinates[:, 1] <= max_z))
+            ids = self._ids
+            return [ids[row] for row in rows[inside]]
+
+    def nearest(self, center: Point, k: int = 1, max_distance: float = math.inf) -> List[str]:
+        """Ids of the k entities nearest to center, nearest first. An entity id as center is excluded."""
+        with self._lock:
+            exclude = self._rows.get(center) if isinstance(center, str) else None
+            x, z = self.point(center)
+            wanted = k + (exclude is not None)
+            count = len(self._ids)
+            if count == 0 or k <= 0: return []
+            # widen the search radius until it holds enough entities - anything outside is farther away
+            radius = min(self.cell_size, max_distance)
+            while True:
+                rows, distances = self._within_radius(x, z, radius)
+                if len(rows) >= wanted or len(rows) == count or radius >= max_distance:
+                    break
+                radius = min(radius * 2, max_distance)
+            if exclude is not None:
+                keep = rows != exclude
+                rows, distances = rows[keep], distances[keep]
+            if len(rows) > k:
+                nearest = np.argpartition(distances, k - 1)[:k]
+                rows, distances = rows[nearest], distances[nearest]
+            ids = self._ids
+            return [ids[row] for row in rows[np.argsort(distances, kind="stable")]]
+
+    def subscribe_area(self, center: Point, radius: float, handler: Callable[[Proto.EntityPosition], None]) -> AreaOfInterest:
+        """Call handler with the position updates of entities inside the circular region.
+        The region can be moved with AreaOfInterest.move()."""
+        area = AreaOfInterest(self, self.point(center), radius, handler)
+        self.areas.append(area)
+        return area
+
+    def unsubscribe_area(self, area: AreaOfInterest):
+        if area in self.areas:
+            self.areas.remove(area)
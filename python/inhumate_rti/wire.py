@@ -0,0 +1,105 @@
+# Minimal protobuf wire format helpers, used to look at a message without parsing it,
+# and to encode what proto3 serialization leaves out.
+
+import base64
+from typing import Optional, Set, Union
+
+from google.protobuf.descriptor import FieldDescriptor
+
+_FIRST_FIELD_STRING_TAG = 0x0A  # field number 1, wire type 2 (length-delimited)
+
+
+def _varint(data, position):
+    result = 0
+    shift = 0
+    while position < len(data) and shift < 64:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+    return None, position
+
+
+def first_field_id(content: Union[str, bytes, bytearray, memoryview]) -> Optional[str]:
+    """Returns the value of field number 1 of a serialized message, if it is a string -
+    the id of messages on channels with first_field_id set - without parsing the message.
+    content is either raw bytes or base64 (as received on the JSON transport), in which case
+    only the needed prefix is decoded. Returns None if the field is not present (i.e. empty)."""
+    if isinstance(content, str):
+        # tag (1 byte) + length varint (at most 5 bytes) fit in 8 base64 characters
+        head = base64.b64decode(content[:8])
+        if not head or head[0] != _FIRST_FIELD_STRING_TAG:
+            return None
+        length, position = _varint(head, 1)
+        if length is None:
+            return None
+        end = position + length
+        data = base64.b64decode(content[:min(len(content), (end + 2) // 3 * 4)])
+    else:
+        data = content
+        if not data or data[0] != _FIRST_FIELD_STRING_TAG:
+            return None
+        length, position = _varint(data, 1)
+        if length is None:
+            return None
+        end = position + length
+    if end > len(data):
+        return None
+    return bytes(data[position:end]).decode("utf8", errors="replace")
+
+
+def _encode_varint(value: int) -> bytes:
+    result = bytearray()
+    while value > 0x7F:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def field_numbers(data: Union[bytes, bytearray, memoryview]) -> Set[int]:
+    """The numbers of the top-level fields present in a serialized message. Unlike the parsed
+    message, this tells a proto3 field explicitly encoded with its default value from an absent one."""
+    numbers = set()
+    position = 0
+    while position < len(data):
+        tag, position = _varint(data, position)
+        if tag is None:
+            raise ValueError("Truncated protobuf message")
+        wire_type = tag & 7
+        if wire_type == 0:
+            _, position = _varint(data, position)
+        elif wire_type == 1:
+            position += 8
+        elif wire_type == 2:
+            length, position = _varint(data, position)
+            if length is None:
+                raise ValueError("Truncated protobuf message")
+            position += length
+        elif wire_type == 5:
+            position += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        if position > len(data):
+            raise ValueError("Truncated protobuf message")
+        numbers.add(tag >> 3)
+    return numbers
+
+
+_FIXED64_TYPES = (FieldDescriptor.TYPE_DOUBLE, FieldDescriptor.TYPE_FIXED64, FieldDescriptor.TYPE_SFIXED64)
+_FIXED32_TYPES = (FieldDescriptor.TYPE_FLOAT, FieldDescriptor.TYPE_FIXED32, FieldDescriptor.TYPE_SFIXED32)
+_LENGTH_DELIMITED_TYPES = (FieldDescriptor.TYPE_STRING, FieldDescriptor.TYPE_BYTES, FieldDescriptor.TYPE_MESSAGE)
+
+
+def encode_default(field: FieldDescriptor) -> bytes:
+    """A singular field explicitly encoded with its default (zero/empty) value - which serializing a
+    proto3 message leaves out - so that the receiver can see, with field_numbers(), that it was set"""
+    if field.type in _FIXED64_TYPES:
+        return _encode_varint(field.number << 3 | 1) + bytes(8)
+    if field.type in _FIXED32_TYPES:
+        return _encode_varint(field.number << 3 | 5) + bytes(4)
+    if field.type in _LENGTH_DELIMITED_TYPES:
+        return _encode_varint(field.number << 3 | 2) + b"\x00"
+    return _encode_varint(field.number << 3) + b"\x00"
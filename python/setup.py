@@ -25,6 +25,11 @@ setup(
         'emitter.py',
         'websocket-client >= 1.4.0, <= 1.8.0',
     ],
+    extras_require={
+        'async': ['websockets >= 13.0'],
+        'fast': ['orjson'],
+        'numpy': ['numpy'],
+    },
     entry_points = {
         "console_scripts": [ "protoscribe=inhumate_rti.protoscribe:main" ]
     },
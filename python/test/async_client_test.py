@@ -0,0 +1,152 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import asyncio
+import base64
+import unittest
+import inhumate_rti as RTI
+from standin_broker import StandinBroker
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.broker = StandinBroker().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+
+    def run_async(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+    async def _connected_client(self, application="python_async_test", **kwargs):
+        rti = RTI.AsyncClient(application=application, url=self.broker.url, **kwargs)
+        await rti.connect()
+        return rti
+
+    def test_connect_disconnect(self):
+        async def run():
+            rti = await self._connected_client()
+            self.assertTrue(rti.connected)
+            await rti.disconnect()
+            self.assertFalse(rti.connected)
+        self.run_async(run())
+
+    def test_connect_failure_raises(self):
+        async def run():
+            rti = RTI.AsyncClient(application="python_async_test", url="ws://127.0.0.1:1/")
+            with self.assertRaisesRegex(Exception, "Connection failed"):
+                await rti.connect()
+        self.run_async(run())
+
+    def test_publish_async_iterator_subscription(self):
+        async def run():
+            rti = await self._connected_client()
+            async with rti.subscribe("async-test", RTI.proto.RuntimeControl) as subscription:
+                message = RTI.proto.RuntimeControl()
+                message.load_scenario.name = "foo"
+                await rti.publish("async-test", message)
+                received = await subscription.__anext__()
+                self.assertEqual("foo", received.load_scenario.name)
+            self.assertTrue(subscription.closed)
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_coroutine_handler(self):
+        async def run():
+            rti = await self._connected_client()
+            received = asyncio.get_running_loop().create_future()
+
+            async def on_text(channel, content):
+                received.set_result((channel, content))
+            rti.subscribe_text("async-text-test", on_text)
+            await rti.publish_text("async-text-test", "hello")
+            self.assertEqual(("async-text-test", "hello"), await received)
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_federation_prefixes_socket_channel(self):
+        async def run():
+            rti = await self._connected_client(federation="fed")
+            async with rti.subscribe_json("async-json-test") as subscription:
+                await rti.publish_json("async-json-test", {"foo": 42})
+                self.assertEqual({"foo": 42}, await subscription.__anext__())
+            self.assertIn("//fed/async-json-test", self.broker.subscribers)
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_publish_leaves_batched_publishes_queued_until_drain(self):
+        async def run():
+            rti = await self._connected_client(publish_batch_delay=10)
+            async with rti.subscribe_text("async-batch-test") as subscription:
+                await rti.publish_text("async-batch-test", "one")
+                await rti.publish_text("async-batch-test", "two")
+                self.assertGreaterEqual(len(rti.client.socket._batch), 2)  # with the channel registrations
+                await rti.drain()
+                self.assertEqual(0, len(rti.client.socket._batch))
+                self.assertEqual("one", await subscription.__anext__())
+                self.assertEqual("two", await subscription.__anext__())
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_execute_command_resolves_on_response(self):
+        async def run():
+            rti = await self._connected_client()
+            other = await self._connected_client("python_async_test_commands")
+
+            def on_command(channel, message):
+                if message.HasField("execute"):
+                    response = RTI.proto.Commands()
+                    response.response.transaction_id = message.execute.transaction_id
+                    response.response.message = message.execute.arguments["foo"]
+                    other.client.publish(channel, response)
+            other.subscribe(other.own_channel_prefix + RTI.channel.commands, RTI.proto.Commands, on_command)
+            await other.drain()
+
+            response = await rti.execute_command("test", client_id=other.client_id, wait=True, foo="bar")
+            self.assertIsNotNone(response)
+            self.assertEqual("bar", response.message)
+            await rti.disconnect()
+            await other.disconnect()
+        self.run_async(run())
+
+    def test_execute_command_timeout_returns_none(self):
+        async def run():
+            rti = await self._connected_client()
+            self.assertIsNone(await rti.execute_command("nobody-listens", wait=True, timeout=0.2))
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_invoke_error_raises(self):
+        async def run():
+            rti = await self._connected_client()
+            with self.assertRaisesRegex(Exception, "Unknown event"):
+                await rti.invoke("nonexistent", None)
+            await rti.disconnect()
+        self.run_async(run())
+
+    def test_fetch_messages_pages_through_recorder_responses(self):
+        async def run():
+            rti = await self._connected_client()
+            recorder = await self._connected_client("python_async_test_recorder")
+            recorded = [RTI.proto.Entity(id=f"entity{index}") for index in range(5)]
+
+            def on_bundle(message):
+                if message.HasField("request"):
+                    request = message.request
+                    response = RTI.proto.MessageBundle()
+                    response.response.total_count = len(recorded)
+                    channel = response.response.channels.add(name=RTI.channel.entity)
+                    for index, entity in enumerate(recorded[request.offset:request.offset + request.limit]):
+                        channel.messages.add(time=request.offset + index, content=base64.b64encode(entity.SerializeToString()).decode("utf8"))
+                    recorder.client.publish(request.response_channel, response)
+            recorder.subscribe(RTI.channel.message_bundle, RTI.proto.MessageBundle, on_bundle)
+            await recorder.drain()
+
+            fetched = [(time, entity.id) async for _, time, entity in rti.fetch_messages(RTI.channel.entity, message_class=RTI.proto.Entity, page_size=2)]
+            self.assertEqual([(index, f"entity{index}") for index in range(5)], fetched)
+            await rti.disconnect()
+            await recorder.disconnect()
+        self.run_async(run())
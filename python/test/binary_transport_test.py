@@ -0,0 +1,99 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import base64
+import time
+import unittest
+import inhumate_rti as RTI
+from standin_broker import StandinBroker
+
+
+def wait_for(condition, timeout=2.0):
+    count = 0
+    while count < int(timeout * 100) and not condition():
+        count += 1
+        time.sleep(0.01)
+
+
+class BinaryTransportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.broker = StandinBroker(binary=True).start()
+        cls.legacy_broker = StandinBroker().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+        cls.legacy_broker.stop()
+
+    def _client(self, broker, binary_transport=True):
+        rti = RTI.Client(application="python_binary_test", url=broker.url, binary_transport=binary_transport)
+        rti.wait_until_connected()
+        self.addCleanup(rti.disconnect)
+        return rti
+
+    def _entity(self, entity_id):
+        entity = RTI.proto.Entity()
+        entity.id = entity_id
+        entity.title = "binary"
+        return entity
+
+    def test_binary_transport_negotiated(self):
+        rti = self._client(self.broker)
+        self.assertTrue(rti.socket.binary)
+        received = []
+        rti.subscribe("binary-test", RTI.proto.Entity, lambda message: received.append(message))
+        time.sleep(0.1)
+        rti.publish("binary-test", self._entity("foo"))
+        wait_for(lambda: received)
+        self.assertEqual("foo", received[0].id)
+        self.assertTrue(any(packet.get("binary") and packet["channel"] == "binary-test" for packet in self.broker.received))
+
+    def test_falls_back_to_json_when_broker_does_not_support_binary(self):
+        rti = self._client(self.legacy_broker)
+        self.assertFalse(rti.socket.binary)
+        received = []
+        rti.subscribe("fallback-test", RTI.proto.Entity, lambda message: received.append(message))
+        time.sleep(0.1)
+        rti.publish("fallback-test", self._entity("bar"))
+        wait_for(lambda: received)
+        self.assertEqual("bar", received[0].id)
+
+    def test_not_requested_by_default(self):
+        rti = self._client(self.broker, binary_transport=False)
+        self.assertFalse(rti.socket.binary)
+
+    def test_json_subscriber_receives_binary_publish(self):
+        publisher = self._client(self.broker)
+        subscriber = self._client(self.broker, binary_transport=False)
+        received = []
+        subscriber.subscribe("mixed-binary-test", RTI.proto.Entity, lambda message: received.append(message))
+        time.sleep(0.1)
+        publisher.publish("mixed-binary-test", self._entity("baz"))
+        wait_for(lambda: received)
+        self.assertEqual("baz", received[0].id)
+
+    def test_text_subscriber_receives_base64_content(self):
+        rti = self._client(self.broker)
+        received = []
+        rti.subscribe_text("binary-text-test", lambda content: received.append(content))
+        time.sleep(0.1)
+        entity = self._entity("qux")
+        rti.publish("binary-text-test", entity)
+        wait_for(lambda: received)
+        self.assertEqual(base64.b64encode(entity.SerializeToString()).decode("utf8"), received[0])
+
+    def test_batched_binary_publishes_are_delivered_in_order(self):
+        rti = self._client(self.broker)
+        received = []
+        rti.subscribe("binary-batch-test", RTI.proto.Entity, lambda message: received.append(message.id))
+        time.sleep(0.1)
+        rti.set_publish_batching(10)
+        for i in range(5):
+            rti.publish("binary-batch-test", self._entity(str(i)))
+        time.sleep(0.1)
+        self.assertEqual([], received)
+        rti.flush()
+        wait_for(lambda: len(received) >= 5)
+        self.assertEqual(["0", "1", "2", "3", "4"], received)
@@ -0,0 +1,98 @@
+# Micro-benchmarks for the SocketCluster envelope: building #publish frames and parsing
+# incoming ones, with the legacy rendering and each available JSON codec. No broker needed.
+#
+#   python test/codec_benchmark.py
+
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import base64
+import json
+import time
+import inhumate_rti as RTI
+from inhumate_rti.jsoncodec import JSONCodec, OrjsonCodec, orjson
+
+from socketcluster_protocol_test import connected_client
+
+COUNT = 50000
+
+
+def payload():
+    position = RTI.proto.EntityPosition()
+    position.id = "entity1"
+    position.local.x = 1
+    position.local.y = 2
+    position.local.z = 3
+    return base64.b64encode(position.SerializeToString()).decode("utf8")
+
+
+def report(label, elapsed, count=COUNT):
+    print(f"{label:<40} {count / elapsed:>10.0f} msg/s  {elapsed / count * 1e6:>6.2f} us/msg")
+    return elapsed
+
+
+def codecs():
+    return [JSONCodec()] + ([OrjsonCodec()] if orjson is not None else [])
+
+
+def benchmark_publish():
+    print("Publish: building and sending #publish frames")
+    data = payload()
+
+    client = connected_client()
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        # what publish used to do
+        obj = {"channel": RTI.channel.position, "data": data}
+        client.ws.send(json.dumps({"event": "#publish", "data": obj, "cid": client.get_and_increment()}, sort_keys=True))
+    baseline = report("json.dumps(sort_keys=True) per frame", time.perf_counter() - start)
+
+    for codec in codecs():
+        client = connected_client(codec=codec)
+        start = time.perf_counter()
+        for _ in range(COUNT):
+            client.publish(RTI.channel.position, data)
+        elapsed = report(f"{codec.name}, pre-rendered prefix", time.perf_counter() - start)
+        print(f"speedup {baseline / elapsed:.2f}x")
+    print()
+
+
+def benchmark_receive():
+    print("Receive: parsing #publish frames and dispatching to a channel")
+    frame = json.dumps({"event": "#publish", "data": {"channel": RTI.channel.position, "data": payload()}})
+    results = []
+    for codec in codecs():
+        client = connected_client(codec=codec)
+        client.on_channel(RTI.channel.position, lambda channel, data: None)
+        start = time.perf_counter()
+        for _ in range(COUNT):
+            client.on_message(client.ws, frame)
+        results.append(report(codec.name, time.perf_counter() - start))
+    if len(results) > 1:
+        print(f"speedup {results[0] / results[1]:.2f}x")
+    print()
+
+
+def benchmark_prepared_publisher():
+    print("RTIClient.publish vs prepared publisher (protobuf message)")
+    from dispatch_test import make_client
+    message = RTI.proto.EntityPosition(id="entity1")
+    rti = make_client(connected=True)
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        rti.publish(RTI.channel.position, message)
+    before = report("rti.publish()", time.perf_counter() - start)
+    rti = make_client(connected=True)
+    publisher = rti.publisher(RTI.channel.position, RTI.proto.EntityPosition)
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        publisher.send(message)
+    after = report("publisher.send()", time.perf_counter() - start)
+    print(f"speedup {before / after:.2f}x")
+    print()
+
+
+if __name__ == "__main__":
+    benchmark_publish()
+    benchmark_receive()
+    benchmark_prepared_publisher()
@@ -0,0 +1,75 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import math
+import pytest
+import inhumate_rti as RTI
+from inhumate_rti.deadreckoning import extrapolate, position_error
+
+from dispatch_test import make_client
+from publish_test import sent_publishes, decode_positions
+
+
+def moving(entity_id, yaw=0.0, forward=0.0, x=0.0, z=0.0):
+    position = RTI.proto.EntityPosition(id=entity_id)
+    position.local.x = x
+    position.local.z = z
+    position.euler_rotation.yaw = yaw
+    position.velocity.forward = forward
+    return position
+
+
+def test_velocity_is_rotated_by_heading():
+    east = extrapolate(moving("a", yaw=90, forward=10), 2)
+    assert (east.local.x, east.local.z) == pytest.approx((20, 0), abs=1e-4)
+    north = extrapolate(moving("a", yaw=0, forward=10), 2)
+    assert (north.local.x, north.local.z) == pytest.approx((0, 20), abs=1e-4)
+
+
+def test_acceleration_and_climb_with_quaternion_rotation():
+    position = RTI.proto.EntityPosition(id="a")
+    position.local.SetInParent()
+    # 90 degrees about y (up): forward is east
+    position.local_rotation.y = math.sin(math.pi / 4)
+    position.local_rotation.w = math.cos(math.pi / 4)
+    position.velocity.up = 1
+    position.acceleration.forward = 2
+    result = extrapolate(position, 3)
+    assert (result.local.x, result.local.y, result.local.z) == pytest.approx((9, 3, 0), abs=1e-4)
+
+
+def test_geodetic_position_and_heading_are_extrapolated():
+    position = RTI.proto.EntityPosition(id="a")
+    position.geodetic.latitude = 0
+    position.velocity.forward = 100
+    position.euler_rotation.yaw = 350
+    position.angular_velocity.yaw = 5
+    result = extrapolate(position, 10)
+    assert result.geodetic.latitude * RTI.deadreckoning.METERS_PER_DEGREE == pytest.approx(1000 * math.cos(math.radians(10)), rel=1e-4)
+    assert result.euler_rotation.yaw == pytest.approx(40)
+    assert position_error(position, result) == pytest.approx(1000, rel=1e-4)
+
+
+def test_publisher_suppresses_predictable_positions():
+    rti = make_client(connected=True)
+    publisher = RTI.DeadReckoningPublisher(rti, position_threshold=1, max_interval=5)
+    for step in range(40):
+        time = step * 0.1
+        assert publisher.update(moving("a", forward=10, z=10 * time), now=time) == (step == 0)
+    # a turn is published at once, moving faster than the velocity says once it is off by more than a meter
+    assert publisher.update(moving("a", yaw=90, forward=10, x=1, z=40), now=4.1)
+    assert not publisher.update(moving("a", yaw=90, forward=10, x=1.5, z=40), now=4.2)
+    assert publisher.update(moving("a", yaw=90, forward=10, x=5, z=40), now=4.3)
+    # on course, but max_interval has passed
+    assert publisher.update(moving("a", yaw=90, forward=10, x=56, z=40), now=9.4)
+    assert (publisher.published, publisher.suppressed) == (4, 40)
+    positions = decode_positions(sent_publishes(rti))
+    assert [(channel, position.local.x) for channel, position in positions] == [(RTI.channel.position, x) for x in [0, 1, 5, 56]]
+
+
+def test_publisher_publishes_on_orientation_change():
+    rti = make_client(connected=True)
+    publisher = RTI.DeadReckoningPublisher(rti, orientation_threshold=3)
+    assert publisher.update(moving("a", yaw=0), now=0)
+    assert not publisher.update(moving("a", yaw=359), now=1)
+    assert publisher.update(moving("a", yaw=5), now=2)
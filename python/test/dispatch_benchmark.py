@@ -0,0 +1,79 @@
+# Micro-benchmarks for the client's receive/dispatch path. No broker needed:
+# frames are fed straight into the socket client's on_message.
+#
+#   python test/dispatch_benchmark.py
+
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import json
+import time
+from inspect import signature
+import inhumate_rti as RTI
+
+from dispatch_test import make_client, encode
+
+COUNT = 20000
+
+
+def position_frame(channel_name, entity_id="entity1"):
+    position = RTI.proto.EntityPosition()
+    position.id = entity_id
+    position.local.x = 1
+    position.local.y = 2
+    position.local.z = 3
+    return json.dumps({"event": "#publish", "data": {"channel": channel_name, "data": encode(position)}})
+
+
+def run(label, rti, frame, count=COUNT):
+    ws = rti.socket.ws
+    start = time.perf_counter()
+    for _ in range(count):
+        rti.socket.on_message(ws, frame)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<50} {count / elapsed:>10.0f} msg/s  {elapsed / count * 1e6:>6.2f} us/msg")
+    return elapsed
+
+
+def benchmark_handler_arity():
+    print("Handler arity resolution (protobuf subscription, one listener)")
+    frame = position_frame(RTI.channel.position)
+
+    # What dispatch used to cost: signature() of both the listener wrapper and the user callback, per message
+    legacy = make_client()
+    def on_position(message): pass
+    def legacy_wrapper(content):
+        message = legacy.parse(RTI.proto.EntityPosition, content)
+        if len(signature(on_position).parameters) < 2: on_position(message)
+        else: on_position(RTI.channel.position, message)
+    legacy.subscribe_text(RTI.channel.position, lambda channel, content:
+                          legacy_wrapper(content) if len(signature(legacy_wrapper).parameters) < 2 else legacy_wrapper(channel, content))
+    before = run("signature() per message", legacy, frame)
+
+    rti = make_client()
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, on_position)
+    after = run("resolved at subscribe time", rti, frame)
+    print(f"speedup {before / after:.2f}x")
+    print()
+
+
+def benchmark_listener_scaling():
+    print("Listeners on one channel (protobuf subscriptions, same message class)")
+    frame = position_frame(RTI.channel.position)
+    def on_position(message): pass
+    for listeners in [1, 2, 4, 8]:
+        results = []
+        for shared in [False, True]:
+            rti = make_client()
+            rti.share_decoded_messages = shared
+            for _ in range(listeners):
+                rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, on_position)
+            label = f"{listeners} listeners, {'shared decode' if shared else 'decode per listener'}"
+            results.append(run(label, rti, frame))
+        print(f"speedup {results[0] / results[1]:.2f}x")
+    print()
+
+
+if __name__ == "__main__":
+    benchmark_handler_arity()
+    benchmark_listener_scaling()
@@ -0,0 +1,363 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import base64
+import json
+import inhumate_rti as RTI
+from inhumate_rti import rticlient
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message, opcode=None):
+        self.sent.append(message)
+
+    def close(self, status=None, reason=None):
+        pass
+
+
+def make_client(connected=False, **kwargs):
+    rti = RTI.Client(application="python_dispatch_test", connect=False, **kwargs)
+    rti.socket.ws = FakeWebSocket()
+    if connected:
+        rti.socket.ever_connected = True
+        rti.first_connected = rti.connected = True
+    return rti
+
+
+def deliver(rti, channel_name, content):
+    frame = json.dumps({"event": "#publish", "data": {"channel": channel_name, "data": content}})
+    rti.socket.on_message(rti.socket.ws, frame)
+
+
+def encode(message):
+    return base64.b64encode(message.SerializeToString()).decode("utf8")
+
+
+def test_handlers_with_and_without_channel_argument_are_called():
+    rti = make_client()
+    received = []
+    rti.subscribe_text("text", lambda content: received.append(content))
+    rti.subscribe_text("text", lambda channel, content: received.append((channel, content)))
+    deliver(rti, "text", "hello")
+    assert received == ["hello", ("text", "hello")]
+
+
+def test_handler_signature_is_not_inspected_per_message(monkeypatch):
+    rti = make_client()
+    received = []
+    rti.subscribe("entity", RTI.proto.Entity, lambda message: received.append(message.id))
+    calls = []
+    original = rticlient.signature
+    monkeypatch.setattr(rticlient, "signature", lambda handler: calls.append(handler) or original(handler))
+    entity = RTI.proto.Entity()
+    entity.id = "foo"
+    for _ in range(10):
+        deliver(rti, "entity", encode(entity))
+    assert received == ["foo"] * 10
+    assert calls == []
+
+
+def position(entity_id, x):
+    message = RTI.proto.EntityPosition()
+    message.id = entity_id
+    message.local.x = x
+    return message
+
+
+def register_channel(rti, name, first_field_id):
+    channel = RTI.proto.Channel()
+    channel.name = name
+    channel.state = True
+    channel.first_field_id = first_field_id
+    rti.register_channel(channel)
+
+
+def test_first_field_id_from_bytes_and_base64():
+    from inhumate_rti.wire import first_field_id
+    message = position("entity-1", 42)
+    assert first_field_id(message.SerializeToString()) == "entity-1"
+    assert first_field_id(encode(message)) == "entity-1"
+    long_id = "x" * 300
+    assert first_field_id(encode(position(long_id, 1))) == long_id
+    assert first_field_id(encode(position("", 1))) is None
+    assert first_field_id(encode(RTI.proto.Measurement(value=1))) is None
+
+
+def test_conflated_dispatch_keeps_latest_message_per_id():
+    rti = make_client()
+    register_channel(rti, RTI.channel.position, True)
+    received = []
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, lambda message: received.append((message.id, message.local.x)),
+                  dispatch=RTI.DispatchMode.CONFLATED)
+    for x in range(3):
+        deliver(rti, RTI.channel.position, encode(position("a", x)))
+        deliver(rti, RTI.channel.position, encode(position("b", x)))
+    assert received == []
+    assert rti.buffer_depth == 2
+    rti.flush_buffers()
+    assert received == [("a", 2), ("b", 2)]
+    assert rti.buffer_depth == 0
+
+
+def test_conflated_dispatch_keeps_latest_message_per_channel_without_first_field_id():
+    rti = make_client()
+    register_channel(rti, "conflated", False)
+    received = []
+    rti.subscribe_text("conflated", lambda content: received.append(content), dispatch=RTI.DispatchMode.CONFLATED)
+    rti.subscribe_text("buffered", lambda content: received.append(content), dispatch=RTI.DispatchMode.BUFFERED)
+    for content in ["one", "two", "three"]:
+        deliver(rti, "conflated", content)
+        deliver(rti, "buffered", content)
+    rti.flush_buffers()
+    assert received == ["three", "one", "two", "three"]
+
+
+def test_conflated_dispatch_buffers_every_message_on_event_channels():
+    rti = make_client()
+    rti.default_dispatch_mode = RTI.DispatchMode.CONFLATED
+    received = []
+    rti.subscribe_text("events", lambda content: received.append(content))
+    for content in ["one", "two", "three"]:
+        deliver(rti, "events", content)
+    rti.flush_buffers()
+    assert received == ["one", "two", "three"]
+
+
+def test_conflated_json_on_first_field_id_channel_is_conflated_per_channel():
+    rti = make_client()
+    register_channel(rti, "json_state", True)
+    received, errors = [], []
+    rti.on("error", lambda channel, error, details: errors.append((channel, error)))
+    rti.subscribe_json("json_state", lambda data: received.append(("conflated", data["id"])), dispatch=RTI.DispatchMode.CONFLATED)
+    rti.subscribe_json("json_state", lambda data: received.append(("immediate", data["id"])), dispatch=RTI.DispatchMode.IMMEDIATE)
+    for entity_id in ["x", "y"]:
+        deliver(rti, "json_state", json.dumps({"id": entity_id}))
+    assert received == [("immediate", "x"), ("immediate", "y")]
+    rti.flush_buffers()
+    assert received[2:] == [("conflated", "y")]
+    assert errors == []
+
+
+def test_buffer_overflow_drops_oldest_and_counts_per_channel():
+    rti = make_client()
+    rti.max_buffer_depth = 2
+    received = []
+    rti.subscribe_text("overflow", lambda content: received.append(content), dispatch=RTI.DispatchMode.BUFFERED)
+    for content in ["one", "two", "three", "four"]:
+        deliver(rti, "overflow", content)
+    assert rti.buffer_depth == 2
+    assert rti.buffer_overflows == {"overflow": 2}
+    rti.flush_buffers()
+    assert received == ["three", "four"]
+
+
+def test_buffer_overflow_drop_newest_keeps_oldest():
+    rti = make_client()
+    rti.max_buffer_depth = 2
+    rti.buffer_drop_policy = RTI.DropPolicy.DROP_NEWEST
+    received = []
+    rti.subscribe_text("overflow", lambda content: received.append(content), dispatch=RTI.DispatchMode.BUFFERED)
+    for content in ["one", "two", "three", "four"]:
+        deliver(rti, "overflow", content)
+    assert rti.buffer_overflows == {"overflow": 2}
+    rti.flush_buffers()
+    assert received == ["one", "two"]
+
+
+def test_buffer_overflow_block_waits_for_flush_on_other_thread():
+    import threading
+    import time
+    rti = make_client()
+    rti.max_buffer_depth = 1
+    rti.buffer_drop_policy = RTI.DropPolicy.BLOCK
+    received = []
+    rti.subscribe_text("overflow", lambda content: received.append(content), dispatch=RTI.DispatchMode.BUFFERED)
+    deliver(rti, "overflow", "one")
+    threading.Timer(0.1, rti.flush_buffers).start()
+    start = time.time()
+    deliver(rti, "overflow", "two")
+    assert time.time() - start >= 0.05
+    assert received == ["one"]
+    assert rti.buffer_overflows == {}
+    rti.flush_buffers()
+    assert received == ["one", "two"]
+
+
+def test_lazy_subscription_parses_on_first_access_only():
+    rti = make_client()
+    received = []
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, lambda message: received.append(message), lazy=True)
+    deliver(rti, RTI.channel.position, encode(position("a", 1)))
+    deliver(rti, RTI.channel.position, encode(position("b", 2)))
+    assert [message.peek_id() for message in received] == ["a", "b"]
+    assert not any(message.decoded for message in received)
+    assert received[1].local.x == 2
+    assert received[1].decoded and not received[0].decoded
+    assert received[1].decode() == position("b", 2)
+    assert received[1].peek_id() == "b"
+
+
+def test_lazy_message_from_binary_content():
+    message = RTI.LazyMessage(RTI.proto.EntityPosition, position("a", 3).SerializeToString())
+    assert message.peek_id() == "a"
+    assert message.HasField("local")
+    assert message == position("a", 3)
+
+
+def test_listeners_on_a_channel_share_the_parsed_message(monkeypatch):
+    rti = make_client()
+    received = []
+    for _ in range(3):
+        rti.subscribe(RTI.channel.entity, RTI.proto.Entity, lambda message: received.append(message))
+    rti.subscribe_text(RTI.channel.entity, lambda content: received.append(content))
+    parses = []
+    original = rti.parse
+    monkeypatch.setattr(rti, "parse", lambda message_class, content: parses.append(content) or original(message_class, content))
+    entity = RTI.proto.Entity(id="foo")
+    deliver(rti, RTI.channel.entity, encode(entity))
+    assert len(parses) == 1
+    assert received[0] is received[1] is received[2]
+    assert received[0] == entity and received[3] == encode(entity)
+
+    rti.share_decoded_messages = False
+    deliver(rti, RTI.channel.entity, encode(entity))
+    assert len(parses) == 4
+    assert received[4] is not received[5]
+
+
+def test_id_filter_skips_other_entities_before_decoding(monkeypatch):
+    rti = make_client()
+    followed = {"a"}
+    received = []
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, lambda message: received.append(message.id), ids=followed)
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, lambda message: received.append("*" + message.id),
+                  ids=lambda entity_id: entity_id.startswith("c"))
+    parses = []
+    original = rti.parse
+    monkeypatch.setattr(rti, "parse", lambda message_class, content: parses.append(content) or original(message_class, content))
+    for entity_id in ["a", "b", "c"]:
+        deliver(rti, RTI.channel.position, encode(position(entity_id, 1)))
+    followed.add("b")
+    deliver(rti, RTI.channel.position, encode(position("b", 2)))
+    assert received == ["a", "*c", "b"]
+    assert len(parses) == 3
+
+
+def test_id_filter_skips_messages_without_id_for_that_listener_only():
+    rti = make_client()
+    received, errors = [], []
+    rti.on("error", lambda channel, error, details: errors.append((channel, error)))
+    rti.subscribe("mixed", RTI.proto.EntityPosition, lambda message: received.append(("filtered", message.id)), ids={"a"})
+    rti.subscribe_json("mixed", lambda data: received.append(("json", data["id"])))
+    deliver(rti, "mixed", json.dumps({"id": "a"}))
+    assert received == [("json", "a")]
+    assert errors == []
+
+
+def test_parallel_dispatch_preserves_order_per_id_and_isolates_slow_handlers():
+    import threading
+    import time
+    rti = make_client()
+    rti.enable_parallel_dispatch(workers=4, ordering=RTI.DispatchOrdering.ID)
+    register_channel(rti, RTI.channel.position, True)
+    release = threading.Event()
+    received = {}
+    def on_position(message):
+        if message.id == "slow": release.wait(5)
+        received.setdefault(message.id, []).append(message.local.x)
+    rti.subscribe(RTI.channel.position, RTI.proto.EntityPosition, on_position)
+    entity_ids = ["slow"] + [f"entity{i}" for i in range(20)]
+    for x in range(10):
+        for entity_id in entity_ids:
+            deliver(rti, RTI.channel.position, encode(position(entity_id, x)))
+    # entities in other lanes than "slow" are handled while it is stuck
+    deadline = time.time() + 5
+    while len(received) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(received) >= 10 and "slow" not in received
+    release.set()
+    rti.wait_dispatched()
+    assert sorted(received) == sorted(entity_ids)
+    assert all(xs == list(range(10)) for xs in received.values())
+    rti.disable_parallel_dispatch()
+
+
+def test_parallel_dispatch_by_id_orders_json_and_text_channels_per_channel():
+    rti = make_client()
+    rti.enable_parallel_dispatch(workers=4, ordering=RTI.DispatchOrdering.ID)
+    errors = []
+    rti.on("error", lambda *args: errors.append(args))
+    received_json, received_text = [], []
+    rti.subscribe_json("json", lambda content: received_json.append(content["x"]))
+    rti.subscribe_text("text", lambda content: received_text.append(content))
+    for x in range(5):
+        deliver(rti, "json", json.dumps({"x": x}))
+    deliver(rti, "text", "not base64!")
+    rti.wait_dispatched()
+    assert received_json == [0, 1, 2, 3, 4] and received_text == ["not base64!"]
+    assert errors == []
+    rti.disable_parallel_dispatch()
+
+
+def test_parallel_dispatch_blocks_receiving_when_a_lane_is_full():
+    import threading
+    rti = make_client()
+    rti.enable_parallel_dispatch(workers=1, max_queue_size=1, max_queue_wait=None)
+    release = threading.Event()
+    received = []
+    rti.subscribe_text("slow", lambda content: release.wait(5) and received.append(content))
+    receiver = threading.Thread(target=lambda: [deliver(rti, "slow", str(i)) for i in range(5)])
+    receiver.start()
+    receiver.join(0.2)
+    assert receiver.is_alive()
+    release.set()
+    receiver.join(5)
+    rti.wait_dispatched()
+    assert received == ["0", "1", "2", "3", "4"]
+    rti.disable_parallel_dispatch()
+
+
+def test_saturated_data_lane_holds_up_control_messages_at_most_max_queue_wait():
+    import threading
+    import time
+    rti = make_client()
+    rti.enable_parallel_dispatch(workers=1, max_queue_size=1, max_queue_wait=0.05)
+    errors = []
+    rti.on("error", lambda channel, error, trace: errors.append(channel))
+    release = threading.Event()
+    rti.subscribe_text("data", lambda content: release.wait(5))
+    control = threading.Event()
+    rti.subscribe(RTI.channel.runtime_control, RTI.proto.RuntimeControl, lambda message: control.set())
+    start = time.time()
+    for i in range(5):
+        deliver(rti, "data", str(i))
+    deliver(rti, RTI.channel.runtime_control, encode(RTI.proto.RuntimeControl(set_time_scale=RTI.proto.RuntimeControl.SetTimeScale(time_scale=2))))
+    assert control.wait(2)
+    assert time.time() - start < 0.5
+    # one message is being handled, one waits in the lane, the rest overflowed
+    assert rti.dispatch_overflows == {"data": 3}
+    assert errors == ["dispatch"] * 3
+    release.set()
+    rti.disable_parallel_dispatch()
+
+
+def test_parallel_dispatch_handles_control_channels_ahead_of_slow_data():
+    import threading
+    rti = make_client()
+    rti.enable_parallel_dispatch(workers=1)
+    release = threading.Event()
+    received = []
+    rti.subscribe_text("data", lambda content: release.wait(5) and received.append(content))
+    control = threading.Event()
+    rti.subscribe(RTI.channel.runtime_control, RTI.proto.RuntimeControl, lambda message: control.set())
+    for i in range(3):
+        deliver(rti, "data", str(i))
+    deliver(rti, RTI.channel.runtime_control, encode(RTI.proto.RuntimeControl(set_time_scale=RTI.proto.RuntimeControl.SetTimeScale(time_scale=2))))
+    assert control.wait(2)
+    assert received == []
+    release.set()
+    rti.disable_parallel_dispatch()
+    assert received == ["0", "1", "2"]
@@ -0,0 +1,162 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import json
+import inhumate_rti as RTI
+from inhumate_rti.rtientitydelta import encode_keyframe, encode_delta, decode, is_keyframe, apply_delta
+from inhumate_rti.wire import field_numbers
+
+from dispatch_test import make_client, deliver, encode
+
+
+def full_entity(entity_id):
+    entity = RTI.proto.Entity(id=entity_id, owner_client_id="simulator", type="vehicle/truck", title="Truck 1",
+                              symbol="SFGPEVCT----", category=RTI.proto.VEHICLE, domain=RTI.proto.LAND)
+    entity.dimensions.length = 8
+    entity.dimensions.width = 2.5
+    entity.color.red = 200
+    entity.position.local.x = 1
+    return entity
+
+
+def relay(source, destination, channels=None):
+    """Deliver what source has published (since the last relay) to destination"""
+    frames = source.socket.ws.sent
+    for frame in frames[getattr(source, "_relayed", 0):]:
+        packet = json.loads(frame)
+        if packet.get("event") == "#publish" and (channels is None or packet["data"]["channel"] in channels):
+            deliver(destination, packet["data"]["channel"], packet["data"]["data"])
+    source._relayed = len(frames)
+
+
+def test_keyframe_and_delta_encode_fields_set_to_default():
+    entity = full_entity("a")
+    keyframe = encode_keyframe(entity)
+    assert is_keyframe(field_numbers(keyframe))
+    assert RTI.proto.Entity.FromString(keyframe) == entity
+
+    changed = full_entity("a")
+    changed.title = ""
+    changed.disabled = True
+    changed.ClearField("color")
+    delta, fields = decode(encode_delta(changed, entity))
+    assert fields == {1, 9, 10, 11}
+    assert not is_keyframe(fields)
+    assert apply_delta(entity, delta, fields) == changed
+
+
+def test_store_merges_deltas_published_against_keyframe():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client)
+    store = RTI.EntityStore(receiver, deltas=True)
+    entity = full_entity("a")
+    assert publisher.publish(entity, now=0)
+    entity.disabled = True
+    assert publisher.publish(entity, now=1)
+    assert not publisher.publish(entity, now=2)
+    relay(publisher_client, receiver)
+    assert store["a"].disabled and store["a"].title == "Truck 1"
+    assert store.find_ids(domain=RTI.proto.LAND) == set()
+
+    entity.disabled = False
+    entity.title = "Truck 2"
+    publisher.publish(entity, now=3)
+    relay(publisher_client, receiver)
+    assert (store["a"].disabled, store["a"].title) == (False, "Truck 2")
+    assert (publisher.keyframes_published, publisher.deltas_published) == (1, 2)
+
+
+def test_lost_delta_is_covered_by_next_one():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client)
+    store = RTI.EntityStore(receiver, deltas=True)
+    entity = full_entity("a")
+    publisher.publish(entity, now=0)
+    relay(publisher_client, receiver)
+    entity.title = "Lost"
+    publisher.publish(entity, now=1)
+    relay(publisher_client, receiver, channels=[])  # lost
+    entity.disabled = True
+    publisher.publish(entity, now=2)
+    relay(publisher_client, receiver)
+    assert (store["a"].title, store["a"].disabled) == ("Lost", True)
+
+
+def test_deltas_keep_position_from_position_channel():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client)
+    store = RTI.EntityStore(receiver, deltas=True)
+    entity = full_entity("a")
+    publisher.publish(entity, now=0)
+    relay(publisher_client, receiver)
+    position = RTI.proto.EntityPosition(id="a")
+    position.local.x = 42
+    deliver(receiver, RTI.channel.position, encode(position))
+    entity.disabled = True
+    publisher.publish(entity, now=1)
+    relay(publisher_client, receiver)
+    assert store["a"].disabled and store["a"].position.local.x == 42
+
+
+def test_keyframe_leaves_unset_submessages_unset():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client)
+    store = RTI.EntityStore(receiver, deltas=True)
+    updates = []
+    store.on_entity = updates.append
+    position = RTI.proto.EntityPosition(id="a")
+    position.local.x = 42
+    deliver(receiver, RTI.channel.position, encode(position))
+    publisher.publish(RTI.proto.Entity(id="a", title="Bare"), now=0)
+    relay(publisher_client, receiver)
+    assert store["a"].position.local.x == 42
+    assert not store["a"].HasField("dimensions") and not store["a"].HasField("color")
+    assert len(updates) == 1  # the legacy copy on the entity channel matches the keyframe
+
+
+def test_late_joiner_requests_keyframes():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client, legacy_keyframes=False)
+    entity = full_entity("a")
+    publisher.publish(entity, now=0)
+    publisher_client._relayed = len(publisher_client.socket.ws.sent)
+
+    store = RTI.EntityStore(receiver, deltas=True, request_update=False)
+    entity.disabled = True
+    publisher.publish(entity, now=1)
+    relay(publisher_client, receiver)
+    assert "a" not in store and store.missing_keyframes == 1
+
+    relay(receiver, publisher_client, channels=[RTI.channel.entity_operation])
+    relay(publisher_client, receiver)
+    assert store["a"].disabled
+    assert publisher.keyframes_published == 2
+
+
+def test_keyframe_when_interval_passed_or_delta_too_large():
+    rti = make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(rti, keyframe_interval=10)
+    entity = full_entity("a")
+    publisher.publish(entity, now=0)
+    entity.disabled = True
+    publisher.publish(entity, now=1)
+    entity.disabled = False
+    publisher.publish(entity, now=11)
+    assert (publisher.keyframes_published, publisher.deltas_published) == (2, 1)
+    entity.type, entity.title, entity.symbol = "vehicle/car", "Car 1", "SFGPEVC-----"
+    entity.dimensions.length = 4
+    publisher.publish(entity, now=12)
+    assert (publisher.keyframes_published, publisher.deltas_published) == (3, 1)
+
+
+def test_deleted_entity_is_removed_through_delta_channel():
+    publisher_client, receiver = make_client(connected=True), make_client(connected=True)
+    publisher = RTI.EntityDeltaPublisher(publisher_client, legacy_keyframes=False)
+    store = RTI.EntityStore(receiver, deltas=True)
+    entity = full_entity("a")
+    publisher.publish(entity, now=0)
+    relay(publisher_client, receiver)
+    entity.deleted = True
+    publisher.publish(entity, now=1)
+    relay(publisher_client, receiver)
+    assert "a" not in store
@@ -0,0 +1,75 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import json
+import inhumate_rti as RTI
+
+from dispatch_test import make_client, deliver, encode, position
+
+
+def entity(entity_id, **fields):
+    return RTI.proto.Entity(id=entity_id, **fields)
+
+
+def publish_entity(rti, message):
+    deliver(rti, RTI.channel.entity, encode(message))
+
+
+def test_entities_are_indexed_and_found_by_fields():
+    rti = make_client()
+    store = RTI.EntityStore(rti)
+    publish_entity(rti, entity("f16", owner_client_id="sim", domain=RTI.proto.AIR, affiliation=RTI.proto.FRIENDLY))
+    publish_entity(rti, entity("mig", owner_client_id="sim", domain=RTI.proto.AIR, affiliation=RTI.proto.HOSTILE))
+    publish_entity(rti, entity("tank", owner_client_id="other", domain=RTI.proto.LAND, affiliation=RTI.proto.FRIENDLY))
+    publish_entity(rti, entity("turret", owner_client_id="other", part_of_entity_id="tank"))
+
+    assert len(store) == 4
+    assert [e.id for e in store.find(domain=RTI.proto.AIR, affiliation=RTI.proto.FRIENDLY)] == ["f16"]
+    assert store.find_ids(owner_client_id="sim") == {"f16", "mig"}
+    assert [e.id for e in store.parts_of("tank")] == ["turret"]
+    assert store.find_ids(domain=RTI.proto.SEA) == set()
+
+
+def test_updates_move_entity_between_indexes():
+    rti = make_client()
+    store = RTI.EntityStore(rti)
+    publish_entity(rti, entity("a", owner_client_id="one"))
+    publish_entity(rti, entity("a", owner_client_id="two"))
+    assert store.find_ids(owner_client_id="one") == set()
+    assert store.find_ids(owner_client_id="two") == {"a"}
+    assert "one" not in store._indexes["owner_client_id"]
+
+
+def test_deleted_entities_are_removed_and_disabled_are_skipped_by_default():
+    rti = make_client()
+    store = RTI.EntityStore(rti)
+    deleted = []
+    store.on_deleted = lambda entity: deleted.append(entity.id)
+    publish_entity(rti, entity("a", domain=RTI.proto.LAND))
+    publish_entity(rti, entity("b", domain=RTI.proto.LAND, disabled=True))
+    assert store.find_ids(domain=RTI.proto.LAND) == {"a"}
+    assert store.find_ids(domain=RTI.proto.LAND, include_disabled=True) == {"a", "b"}
+    publish_entity(rti, entity("a", deleted=True))
+    assert "a" not in store and deleted == ["a"]
+    assert store.find_ids(include_disabled=True) == {"b"}
+
+
+def test_positions_are_merged_into_entities():
+    rti = make_client()
+    store = RTI.EntityStore(rti)
+    deliver(rti, RTI.channel.position, encode(position("a", 1)))
+    publish_entity(rti, entity("a", title="Alpha"))
+    assert store["a"].position.local.x == 1
+    deliver(rti, RTI.channel.position, encode(position("a", 2)))
+    assert store["a"].position.local.x == 2
+    publish_entity(rti, entity("a", title="Renamed"))
+    assert (store["a"].title, store["a"].position.local.x) == ("Renamed", 2)
+
+
+def test_update_is_requested_when_connected():
+    rti = make_client(connected=True)
+    RTI.EntityStore(rti)
+    operations = [json.loads(frame)["data"] for frame in rti.socket.ws.sent if json.loads(frame).get("event") == "#publish"]
+    requests = [RTI.Client.parse(RTI.proto.EntityOperation, operation["data"]) for operation in operations
+                if operation["channel"] == RTI.channel.entity_operation]
+    assert [request.WhichOneof("which") for request in requests] == ["request_update"]
@@ -0,0 +1,135 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import json
+import pytest
+import inhumate_rti as RTI
+
+from dispatch_test import FakeWebSocket, make_client, deliver, encode
+
+
+class FakeRecorder(FakeWebSocket):
+    """Answers MessageBundle requests published by the client from a list of recorded
+    (channel, time, message) tuples, like the recorder would"""
+
+    def __init__(self, rti, recorded, answer=True):
+        super().__init__()
+        self.rti = rti
+        self.recorded = recorded
+        self.answer = answer
+        self.requests = []
+
+    def send(self, message, opcode=None):
+        super().send(message, opcode)
+        packet = json.loads(message)
+        if packet.get("event") != "#publish" or packet["data"]["channel"] != RTI.channel.message_bundle:
+            return
+        request = RTI.Client.parse(RTI.proto.MessageBundle, packet["data"]["data"]).request
+        self.requests.append(request)
+        if not self.answer:
+            return
+        matching = [(channel, time, message) for channel, time, message in self.recorded
+                    if channel in request.channels and (not request.ids or message.id in request.ids)]
+        page = matching[request.offset:request.offset + request.limit]
+        response = RTI.proto.MessageBundle()
+        response.response.total_count = len(matching)
+        by_channel = {}
+        for channel, time, message in page:
+            if channel not in by_channel:
+                by_channel[channel] = response.response.channels.add(name=channel)
+            by_channel[channel].messages.add(time=time, content=encode(message))
+        deliver(self.rti, request.response_channel, encode(response))
+
+
+def recorder_client(recorded, answer=True):
+    rti = make_client(connected=True)
+    rti.socket.ws = FakeRecorder(rti, recorded, answer)
+    return rti
+
+
+def recording(count):
+    recorded = []
+    for index in range(count):
+        channel = RTI.channel.position if index % 2 else RTI.channel.entity
+        message = RTI.proto.EntityPosition(id=f"entity{index % 3}") if index % 2 else RTI.proto.Entity(id=f"entity{index % 3}")
+        recorded.append((channel, float(index), message))
+    return recorded
+
+
+def test_fetch_messages_pages_through_recording_in_time_order():
+    recorded = recording(25)
+    rti = recorder_client(recorded)
+    classes = {RTI.channel.position: RTI.proto.EntityPosition, RTI.channel.entity: RTI.proto.Entity}
+    fetched = list(rti.fetch_messages([RTI.channel.entity, RTI.channel.position], 0, 100, classes, page_size=10))
+    assert fetched == recorded
+    assert [request.offset for request in rti.socket.ws.requests] == [0, 10, 20]
+    assert rti.subscriptions.keys().isdisjoint(request.response_channel for request in rti.socket.ws.requests)
+
+
+def test_fetch_messages_requests_next_page_before_current_is_consumed():
+    rti = recorder_client(recording(25))
+    messages = rti.fetch_messages([RTI.channel.entity, RTI.channel.position], page_size=10)
+    channel, time, content = next(messages)
+    assert (channel, time) == (RTI.channel.entity, 0.0)
+    assert RTI.Client.parse(RTI.proto.Entity, content).id == "entity0"
+    assert len(rti.socket.ws.requests) == 2
+    messages.close()
+    assert len(rti.subscriptions) == 3  # only the client's own subscriptions are left
+
+
+def test_fetch_messages_times_out_without_recorder():
+    rti = recorder_client([], answer=False)
+    with pytest.raises(TimeoutError):
+        list(rti.fetch_messages(RTI.channel.entity, timeout=0.05))
+    assert len(rti.subscriptions) == 3
+
+
+class FakeMeasurementRecorder(FakeWebSocket):
+    """Answers MeasurementBundle requests from a list of (measure id, entity id, time, value or window)"""
+
+    def __init__(self, rti, recorded):
+        super().__init__()
+        self.rti = rti
+        self.recorded = recorded
+        self.requests = []
+
+    def send(self, message, opcode=None):
+        super().send(message, opcode)
+        packet = json.loads(message)
+        if packet.get("event") != "#publish" or packet["data"]["channel"] != RTI.channel.measurement_bundle:
+            return
+        request = RTI.Client.parse(RTI.proto.MeasurementBundle, packet["data"]["data"]).request
+        self.requests.append(request)
+        matching = [item for item in self.recorded if not request.measures or item[0] in request.measures]
+        response = RTI.proto.MeasurementBundle()
+        response.response.total_count = len(matching)
+        for measure_id, entity_id, time, value in matching[request.offset:request.offset + request.limit]:
+            measure_measurements = response.response.measures.add(client_id="client", entity_id=entity_id)
+            measure_measurements.measure.id = measure_id
+            measurement = measure_measurements.measurements.add(time=time)
+            if isinstance(value, RTI.proto.Measurement.Window):
+                measurement.window.CopyFrom(value)
+            else:
+                measurement.value = value
+        deliver(self.rti, request.response_channel, encode(response))
+
+
+def test_fetch_measurement_arrays_collects_pages_per_measure_and_entity():
+    np = pytest.importorskip("numpy")
+    recorded = [("speed", f"entity{index % 2}", float(index), float(index * 10)) for index in range(7)]
+    recorded.append(("load", "", 7.0, RTI.proto.Measurement.Window(mean=2, min=1, max=3, duration=1, count=4)))
+    rti = make_client(connected=True)
+    rti.socket.ws = FakeMeasurementRecorder(rti, recorded)
+
+    arrays = rti.fetch_measurement_arrays(page_size=3)
+
+    assert [request.offset for request in rti.socket.ws.requests] == [0, 3, 6]
+    assert sorted(arrays) == [("load", "client", ""), ("speed", "client", "entity0"), ("speed", "client", "entity1")]
+    speed = arrays[("speed", "client", "entity0")]
+    assert speed.measure.id == "speed" and len(speed) == 4
+    assert speed.time.tolist() == [0, 2, 4, 6]
+    assert speed.value.tolist() == [0, 20, 40, 60]
+    assert np.isnan(speed.mean).all() and (speed.count == 0).all()
+    load = arrays[("load", "client", "")]
+    assert np.isnan(load.value[0])
+    assert (load.mean[0], load.min[0], load.max[0], load.count[0]) == (2, 1, 3, 4)
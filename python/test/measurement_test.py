@@ -0,0 +1,141 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import json
+import pytest
+import inhumate_rti as RTI
+from inhumate_rti import rticlient
+
+from dispatch_test import make_client
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rticlient.time, "time", clock)
+    return clock
+
+
+def measurement_client():
+    rti = make_client(connected=True)
+    rti._start_collect_measurements_thread = lambda: None  # the tests call _collect_measurements() instead
+    return rti
+
+
+def sent_measurements(rti):
+    measurements = []
+    for frame in rti.socket.ws.sent:
+        packets = json.loads(frame)
+        for packet in packets if isinstance(packets, list) else [packets]:
+            if packet.get("event") == "#publish" and packet["data"]["channel"] == RTI.channel.measurement:
+                measurements.append(RTI.Client.parse(RTI.proto.Measurement, packet["data"]["data"]))
+    return measurements
+
+
+def test_measurements_within_interval_are_published_as_window(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    for value in [3, 1, 2, 6]:
+        rti.measure("speed", value, "entity1")
+    rti._collect_measurements(100.5)
+    assert sent_measurements(rti) == []
+    rti._collect_measurements(101.5)
+    [measurement] = sent_measurements(rti)
+    assert (measurement.measure_id, measurement.entity_id) == ("speed", "entity1")
+    window = measurement.window
+    assert (window.count, window.mean, window.min, window.max, window.duration) == (4, 3, 1, 6, 1.5)
+
+
+def test_single_measurement_within_interval_is_published_as_value(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    rti.measure("speed", 5)
+    rti._collect_measurements(102)
+    rti._collect_measurements(104)
+    measurements = sent_measurements(rti)
+    assert len(measurements) == 1
+    assert measurements[0].WhichOneof("which") == "value" and measurements[0].value == 5
+
+
+def test_accumulating_measurements_does_not_store_values(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    for value in range(1000):
+        rti.measure("speed", value, "entity1")
+    [accumulator] = rti.collect_queue.values()
+    assert (accumulator.count, accumulator.total, accumulator.minimum, accumulator.maximum) == (1000, 499500, 0, 999)
+
+
+def test_short_intervals_are_collected_at_their_own_deadlines(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="fast", interval=0.02))
+    rti.register_measure(RTI.proto.Measure(id="slow", interval=1))
+    rti.measure("fast", 1)
+    rti.measure("slow", 1)
+    assert [entry[0] for entry in sorted(rti._collect_schedule)] == pytest.approx([100.02, 101])
+    rti._collect_measurements(100.03)
+    assert [measurement.measure_id for measurement in sent_measurements(rti)] == ["fast"]
+    assert [entry[0] for entry in sorted(rti._collect_schedule)] == pytest.approx([100.05, 101])
+
+
+def test_measurements_accumulate_while_disconnected(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    rti.measure("speed", 1)
+    rti.connected = False
+    rti._collect_measurements(101.5)
+    rti.measure("speed", 3)
+    rti.connected = True
+    rti._collect_measurements(103)
+    [measurement] = sent_measurements(rti)
+    assert (measurement.window.count, measurement.window.mean, measurement.window.duration) == (2, 2, 3)
+
+
+def test_collect_thread_publishes_at_deadline():
+    import time
+    rti = make_client(connected=True)
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=0.05))
+    rti.measure("speed", 7)
+    deadline = time.time() + 2
+    while not sent_measurements(rti) and time.time() < deadline:
+        time.sleep(0.01)
+    [measurement] = sent_measurements(rti)
+    assert measurement.value == 7
+
+
+def test_batched_measurements_due_together_are_sent_in_one_frame(clock):
+    rti = measurement_client()
+    rti.batch_measurements = True
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    for entity in range(3):
+        rti.measure("speed", entity, f"entity{entity}")
+    rti.measure("instant", 42)
+    assert sent_measurements(rti) == []
+    frames = len(rti.socket.ws.sent)
+    rti._collect_measurements(102)
+    assert len(rti.socket.ws.sent) == frames + 1
+    measurements = sent_measurements(rti)
+    assert [(measurement.measure_id, measurement.entity_id, measurement.value) for measurement in measurements] == \
+        [("instant", "", 42), ("speed", "entity0", 0), ("speed", "entity1", 1), ("speed", "entity2", 2)]
+
+
+def test_measurements_accumulated_while_time_is_stopped_are_collected_when_resumed(clock):
+    rti = measurement_client()
+    rti.register_measure(RTI.proto.Measure(id="speed", interval=1))
+    rti.measurement_interval_time_scale = 0
+    for value in [1, 2, 3]:
+        rti.measure("speed", value)
+    rti._collect_measurements(101.5)
+    assert sent_measurements(rti) == [] and rti._collect_schedule
+    rti.measurement_interval_time_scale = 1
+    rti._collect_measurements(103)
+    [measurement] = sent_measurements(rti)
+    assert (measurement.window.count, measurement.window.mean) == (3, 2)
@@ -0,0 +1,81 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import random
+import pytest
+import inhumate_rti as RTI
+from inhumate_rti.deadreckoning import extrapolate
+
+from dispatch_test import make_client, deliver, encode
+
+np = pytest.importorskip("numpy")
+
+
+def random_position(generator, entity_id):
+    position = RTI.proto.EntityPosition(id=entity_id)
+    position.local.x, position.local.y, position.local.z = (generator.uniform(-1000, 1000) for _ in range(3))
+    position.geodetic.latitude, position.geodetic.longitude = generator.uniform(-60, 60), generator.uniform(-180, 180)
+    position.euler_rotation.roll, position.euler_rotation.pitch, position.euler_rotation.yaw = (generator.uniform(-90, 90) for _ in range(3))
+    position.velocity.forward, position.velocity.right, position.velocity.up = (generator.uniform(-50, 50) for _ in range(3))
+    position.acceleration.forward, position.acceleration.right, position.acceleration.up = (generator.uniform(-5, 5) for _ in range(3))
+    position.angular_velocity.yaw = generator.uniform(-10, 10)
+    return position
+
+
+def test_positions_at_matches_scalar_extrapolation():
+    generator = random.Random(2)
+    tracker = RTI.PositionTracker()
+    positions = [random_position(generator, f"e{number}") for number in range(50)]
+    for number, position in enumerate(positions):
+        tracker.update(position, received=100 + number * 0.01)
+    sampled = tracker.positions_at(101.5)
+    assert len(sampled) == 50
+    for row, entity_id in enumerate(sampled.ids):
+        number = int(entity_id[1:])
+        expected = extrapolate(positions[number], 1.5 - number * 0.01)
+        assert sampled.local[row] == pytest.approx([expected.local.x, expected.local.y, expected.local.z], abs=1e-3)
+        assert sampled.geodetic[row] == pytest.approx([expected.geodetic.latitude, expected.geodetic.longitude, expected.geodetic.altitude], abs=1e-6)
+        assert sampled.euler[row, 2] == pytest.approx(expected.euler_rotation.yaw, abs=1e-3)
+
+
+def test_extrapolation_is_limited_and_missing_coordinates_are_nan():
+    tracker = RTI.PositionTracker(max_extrapolation=2)
+    position = RTI.proto.EntityPosition(id="a")
+    position.local.SetInParent()
+    position.velocity.forward = 10
+    tracker.update(position, received=0)
+    sampled = tracker.positions_at(10)
+    assert sampled.local[0].tolist() == [0, 0, 20]
+    assert np.isnan(sampled.geodetic).all() and np.isnan(sampled.euler).all()
+
+
+def test_earlier_times_are_interpolated_not_extrapolated_backwards():
+    tracker = RTI.PositionTracker()
+    for received, x, yaw in [(0, 0, 350), (1, 10, 10)]:
+        position = RTI.proto.EntityPosition(id="a")
+        position.local.x = x
+        position.euler_rotation.yaw = yaw
+        position.velocity.right = 10
+        tracker.update(position, received=received)
+    single = RTI.proto.EntityPosition(id="b")
+    single.local.x = 5
+    single.velocity.right = 10
+    tracker.update(single, received=1)
+    sampled = tracker.positions_at(0.5)
+    assert sampled.local[:, 0].tolist() == pytest.approx([5, 5])
+    assert sampled.euler[0, 2] == pytest.approx(0)  # the short way from 350 to 10
+    sampled = tracker.positions_at(-1)
+    assert sampled.local[:, 0].tolist() == pytest.approx([0, 5])
+    assert sampled.euler[0, 2] == pytest.approx(350)
+
+
+def test_tracker_follows_position_channel_and_deleted_entities():
+    rti = make_client()
+    tracker = RTI.PositionTracker(rti)
+    for entity_id in ["a", "b", "c"]:
+        position = RTI.proto.EntityPosition(id=entity_id)
+        position.local.x = ord(entity_id)
+        deliver(rti, RTI.channel.position, encode(position))
+    deliver(rti, RTI.channel.entity, encode(RTI.proto.Entity(id="a", deleted=True)))
+    sampled = tracker.positions_at()
+    assert sorted(zip(sampled.ids, sampled.local[:, 0].tolist())) == [("b", ord("b")), ("c", ord("c"))]
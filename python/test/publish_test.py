@@ -0,0 +1,126 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import base64
+import json
+import time
+import inhumate_rti as RTI
+
+from dispatch_test import FakeWebSocket, make_client, position, register_channel
+
+
+def sent_publishes(rti):
+    publishes = []
+    for frame in rti.socket.ws.sent:
+        packets = json.loads(frame)
+        for packet in packets if isinstance(packets, list) else [packets]:
+            if packet.get("event") == "#publish" and not packet["data"]["channel"].endswith(RTI.channel.channels):
+                publishes.append((packet["data"]["channel"], packet["data"]["data"]))
+    return publishes
+
+
+def decode_positions(publishes):
+    return [(channel, RTI.Client.parse(RTI.proto.EntityPosition, content)) for channel, content in publishes]
+
+
+def test_state_channel_publishes_coalesce_per_id():
+    rti = make_client(connected=True, publish_batch_delay=10)
+    rti.set_publish_coalescing(True)
+    register_channel(rti, RTI.channel.position, True)
+
+    rti.publish(RTI.channel.position, position("a", 1))
+    rti.publish(RTI.channel.position, position("b", 1))
+    rti.publish(RTI.channel.position, position("a", 2))
+    rti.publish(RTI.channel.position, position("a", 3))
+    rti.flush()
+
+    positions = decode_positions(sent_publishes(rti))
+    assert [(p.id, p.local.x) for _, p in positions] == [("a", 3), ("b", 1)]
+    assert rti.coalesced_publishes == 2
+
+
+def test_state_channel_without_first_field_id_coalesces_per_channel():
+    rti = make_client(connected=True, publish_batch_delay=10, coalesce_state_publishes=True)
+    register_channel(rti, "state-test", False)
+
+    rti.publish_text("state-test", "one")
+    rti.publish_text("state-test", "two")
+    rti.flush()
+
+    assert sent_publishes(rti) == [("state-test", "two")]
+
+
+def test_non_state_channel_publishes_are_not_coalesced():
+    rti = make_client(connected=True, publish_batch_delay=10, coalesce_state_publishes=True)
+
+    rti.publish_text("event-test", "one")
+    rti.publish_text("event-test", "two")
+    rti.flush()
+
+    assert sent_publishes(rti) == [("event-test", "one"), ("event-test", "two")]
+
+
+def test_coalescing_key_uses_unfederated_channel_registration():
+    rti = make_client(connected=True, federation="fed", publish_batch_delay=10, coalesce_state_publishes=True)
+    register_channel(rti, RTI.channel.position, True)
+
+    rti.publish(RTI.channel.position, position("a", 1))
+    rti.publish(RTI.channel.position, position("a", 2))
+    rti.flush()
+
+    positions = decode_positions(sent_publishes(rti))
+    assert [(channel, p.local.x) for channel, p in positions] == [("//fed/" + RTI.channel.position, 2)]
+
+
+class SlowWebSocket(FakeWebSocket):
+    def send(self, message, opcode=None):
+        time.sleep(0.05)
+        super().send(message, opcode)
+
+
+def test_coalescing_without_batch_delay_does_not_block_publisher():
+    rti = make_client(connected=True, coalesce_state_publishes=True)
+    rti.socket.ws = SlowWebSocket()
+    register_channel(rti, RTI.channel.position, True)
+
+    start = time.time()
+    for x in range(20):
+        rti.publish(RTI.channel.position, position("a", x))
+    assert time.time() - start < 0.5
+    rti.flush()
+
+    positions = decode_positions(sent_publishes(rti))
+    assert len(positions) < 20 and positions[-1][1].local.x == 19
+    assert rti.coalesced_publishes == 20 - len(positions)
+
+
+def test_prepared_publisher_sends_same_frames_as_publish():
+    rti = make_client(connected=True, federation="fed")
+    publisher = rti.publisher(RTI.channel.position, RTI.proto.EntityPosition)
+    text = rti.publisher("text")
+    rti.publish(RTI.channel.position, position("a", 1))
+    publisher.send(position("a", 1))
+    text.send('quoted "text"')
+    publishes = sent_publishes(rti)
+    assert publishes[0] == publishes[1] == ("//fed/" + RTI.channel.position, base64.b64encode(position("a", 1).SerializeToString()).decode("utf8"))
+    assert publishes[2] == ("//fed/text", 'quoted "text"')
+    assert "text" in rti.used_channels and rti.used_channels["text"].publish
+
+
+def test_prepared_publisher_coalesces_state_channel():
+    rti = make_client(connected=True)
+    register_channel(rti, "state", True)
+    rti.set_publish_batching(10)
+    rti.set_publish_coalescing(True)
+    publisher = rti.publisher("state", RTI.proto.EntityPosition)
+    for x in range(3):
+        publisher.send(position("a", x))
+    rti.flush()
+    assert [message.local.x for _, message in decode_positions(sent_publishes(rti))] == [2]
+
+
+def test_prepared_publisher_sends_binary_frames_when_negotiated():
+    rti = make_client(connected=True)
+    rti.socket.binary = True
+    rti.publisher("binary", RTI.proto.EntityPosition).send(position("a", 1))
+    assert rti.socket.ws.sent[-1] == b"\x01\x00\x06binary" + position("a", 1).SerializeToString()
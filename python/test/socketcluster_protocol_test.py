@@ -1,5 +1,7 @@
+import json
 import os
 import sys
+import time
 
 sys.path.insert(0, os.path.dirname(__file__) + "/..")
 
@@ -13,7 +15,7 @@ class FakeWebSocket:
         self.close_status = None
         self.close_reason = None
 
-    def send(self, message):
+    def send(self, message, opcode=None):
         self.sent.append(message)
 
     def close(self, status=None, reason=None):
@@ -50,3 +52,172 @@ def test_oversized_message_reports_error_and_closes_socket():
     assert errors
     assert ws.closed
     assert ws.close_status == 1009
+
+
+def test_binary_publish_frame_is_dispatched_to_channel():
+    client = RTISocketClusterClient("ws://example", None, 0.01)
+    ws = FakeWebSocket()
+    client.ws = ws
+    received = []
+    client.on_channel("test", lambda _channel, data: received.append(data))
+
+    client.on_message(ws, b"\x01\x00\x04test\x08\x01")
+
+    assert received == [b"\x08\x01"]
+
+
+def test_truncated_binary_frame_reports_protocol_error():
+    client = RTISocketClusterClient("ws://example", None, 0.01)
+    ws = FakeWebSocket()
+    client.ws = ws
+    errors = []
+    client.set_basic_listener(None, None, lambda _socket, error: errors.append(error))
+
+    client.on_message(ws, b"\x01\x00\x10te")
+
+    assert errors
+
+
+def connected_client(**kwargs):
+    client = RTISocketClusterClient("ws://example", None, 0.01, **kwargs)
+    client.ws = FakeWebSocket()
+    client.ever_connected = True
+    return client
+
+
+def test_batched_publishes_are_sent_as_one_json_array_on_flush():
+    client = connected_client()
+    client.set_batching(10)
+
+    client.publish("a", "one")
+    client.publish("b", "two")
+    assert client.ws.sent == []
+
+    client.flush()
+    assert len(client.ws.sent) == 1
+    batch = json.loads(client.ws.sent[0])
+    assert [(event["data"]["channel"], event["data"]["data"]) for event in batch] == [("a", "one"), ("b", "two")]
+
+
+def test_batch_is_flushed_when_max_bytes_reached():
+    client = connected_client()
+    client.set_batching(10, max_bytes=150)
+
+    client.publish("a", "x" * 50)
+    assert client.ws.sent == []
+    client.publish("a", "y" * 50)
+    assert len(client.ws.sent) == 1
+
+
+def test_batch_is_flushed_after_max_delay():
+    client = connected_client()
+    client.set_batching(0.05)
+
+    client.publish("a", "one")
+    count = 0
+    while count < 100 and not client.ws.sent: count += 1; time.sleep(0.01)
+    assert len(client.ws.sent) == 1
+
+
+def test_binary_batch_keeps_order_with_text_publishes():
+    client = connected_client(binary=True)
+    client.binary = True
+    client.set_batching(10)
+
+    client.publish_binary("a", b"1")
+    client.publish_binary("a", b"2")
+    client.publish("b", "three")
+    client.flush()
+
+    assert len(client.ws.sent) == 2
+    assert client.ws.sent[0][0] == 2
+    assert json.loads(client.ws.sent[1])["data"]["data"] == "three"
+
+    received = []
+    receiver = connected_client()
+    receiver.on_channel("a", lambda _channel, data: received.append(data))
+    receiver.on_message(receiver.ws, client.ws.sent[0])
+    assert received == [b"1", b"2"]
+
+
+def test_incoming_event_array_dispatches_each_event():
+    client = connected_client()
+    received = []
+    client.on_channel("test", lambda _channel, data: received.append(data))
+
+    client.on_message(client.ws, '[{"event":"#publish","data":{"channel":"test","data":"one"}},'
+                                 '{"event":"#publish","data":{"channel":"test","data":"two"}}]')
+
+    assert received == ["one", "two"]
+
+
+def test_coalescing_replaces_pending_publish_with_same_key():
+    client = connected_client()
+    client.set_batching(10)
+    client.coalesce = True
+
+    client.publish("state", "old", coalesce_key="state")
+    client.publish("other", "kept")
+    client.publish("state", "new", coalesce_key="state")
+    client.flush()
+
+    batch = json.loads(client.ws.sent[0])
+    assert [event["data"]["data"] for event in batch] == ["new", "kept"]
+    assert client.coalesced_count == 1
+
+
+def test_coalescing_without_batching_sends_individual_frames_from_sender_thread():
+    client = connected_client()
+    client.set_coalescing(True)
+
+    client.publish("a", "one")
+    client.publish("a", "two")
+    count = 0
+    while count < 100 and len(client.ws.sent) < 2: count += 1; time.sleep(0.01)
+    assert [json.loads(frame)["data"]["data"] for frame in client.ws.sent] == ["one", "two"]
+
+
+def test_publish_frames_are_valid_json_with_both_codecs():
+    from inhumate_rti.jsoncodec import JSONCodec, OrjsonCodec, orjson
+    codecs = [JSONCodec()] + ([OrjsonCodec()] if orjson is not None else [])
+    for codec in codecs:
+        client = connected_client(codec=codec)
+        acks = []
+        client.publish('chan"nel/ø', 'te"xt\n')
+        client.publish('chan"nel/ø', "again", ack=lambda *args: acks.append(args))
+        frames = [json.loads(frame) for frame in client.ws.sent]
+        assert frames[0] == {"event": "#publish", "data": {"channel": 'chan"nel/ø', "data": 'te"xt\n'}, "cid": 1}
+        assert frames[1]["cid"] == 2 and frames[1]["data"]["data"] == "again"
+        client.on_message(client.ws, '{"rid":2,"data":"done"}')
+        assert acks == [('chan"nel/ø', None, "done")]
+
+
+def test_message_size_check_counts_utf8_bytes_without_encoding_ascii():
+    client = connected_client(max_message_size_bytes=40)
+    errors = []
+    client.set_basic_listener(None, None, lambda _socket, error: errors.append(error))
+    received = []
+    client.on_channel("t", lambda _channel, data: received.append(data))
+
+    client.on_message(client.ws, '{"event":"#publish","data":{"channel":"t","data":"a"}}')
+    assert errors and not received
+    errors.clear()
+    client.max_message_size_bytes = 60
+    client.on_message(client.ws, '{"event":"#publish","data":{"channel":"t","data":"ø"}}')
+    assert not errors and received == ["ø"]
+    client.on_message(client.ws, '{"event":"#publish","data":{"channel":"t","data":"øøøøøø"}}')
+    assert errors and received == ["ø"]
+
+
+def test_raw_text_frames_from_websocket_layer_are_parsed_as_bytes():
+    import websocket
+    client = connected_client()
+    received = []
+    client.on_channel("t", lambda _channel, data: received.append(data))
+
+    client.on_data(client.ws, '{"event":"#publish","data":{"channel":"t","data":"ø"}}'.encode("utf8"), websocket.ABNF.OPCODE_TEXT, True)
+    client.on_data(client.ws, b"#1", websocket.ABNF.OPCODE_TEXT, True)
+    client.on_data(client.ws, b"\x01\x00\x01t\x08\x01", websocket.ABNF.OPCODE_BINARY, True)
+
+    assert received == ["ø", b"\x08\x01"]
+    assert client.ws.sent == ["#2"]
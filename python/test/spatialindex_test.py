@@ -0,0 +1,90 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__) + "/..")
+
+import random
+import pytest
+import inhumate_rti as RTI
+
+from dispatch_test import make_client, deliver, encode
+
+np = pytest.importorskip("numpy")
+
+
+def local_position(entity_id, x, z):
+    message = RTI.proto.EntityPosition(id=entity_id)
+    message.local.x = x
+    message.local.z = z
+    return message
+
+
+def brute_force(points, x, z, radius):
+    return sorted(entity_id for entity_id, (px, pz) in points.items() if (px - x) ** 2 + (pz - z) ** 2 <= radius ** 2)
+
+
+def test_radius_and_box_queries_match_brute_force():
+    index = RTI.SpatialIndex(cell_size=100)
+    generator = random.Random(1)
+    points = {}
+    for number in range(500):
+        points[f"e{number}"] = (generator.uniform(-2000, 2000), generator.uniform(-2000, 2000))
+        index.set(f"e{number}", *points[f"e{number}"])
+    for number in range(0, 500, 3):
+        del points[f"e{number}"]
+        index.remove(f"e{number}")
+    for number in range(1, 500, 3):
+        points[f"e{number}"] = (generator.uniform(-2000, 2000), generator.uniform(-2000, 2000))
+        index.set(f"e{number}", *points[f"e{number}"])
+    assert len(index) == len(points)
+    for x, z, radius in [(0, 0, 250), (1500, -300, 600), (-1999, 1999, 50), (0, 0, 5000)]:
+        assert sorted(index.within_radius((x, z), radius)) == brute_force(points, x, z, radius)
+    expected = sorted(entity_id for entity_id, (x, z) in points.items() if -100 <= x <= 300 and 0 <= z <= 900)
+    assert sorted(index.within_box(-100, 0, 300, 900)) == expected
+
+
+def test_nearest_excludes_center_entity_and_orders_by_distance():
+    index = RTI.SpatialIndex(cell_size=10)
+    for entity_id, x in [("a", 0), ("b", 5), ("c", -12), ("d", 400), ("e", 3000)]:
+        index.set(entity_id, x, 0)
+    assert index.nearest("a", 3) == ["b", "c", "d"]
+    assert index.nearest((2900, 0), 2) == ["e", "d"]
+    assert index.nearest((0, 0), 10, max_distance=20) == ["a", "b", "c"]
+
+
+def test_positions_are_indexed_from_channel_and_deleted_entities_removed():
+    rti = make_client()
+    index = RTI.SpatialIndex(rti, cell_size=50)
+    deliver(rti, RTI.channel.position, encode(local_position("a", 10, 20)))
+    deliver(rti, RTI.channel.position, encode(local_position("b", 1000, 20)))
+    deliver(rti, RTI.channel.position, encode(local_position("a", 990, 20)))
+    assert sorted(index.within_radius("b", 20)) == ["a", "b"]
+    deliver(rti, RTI.channel.entity, encode(RTI.proto.Entity(id="b", deleted=True)))
+    assert "b" not in index and index.within_radius((1000, 20), 20) == ["a"]
+
+
+def test_geodetic_positions_are_projected_around_origin():
+    index = RTI.SpatialIndex(geodetic=True, origin=(59.0, 18.0))
+    position = RTI.proto.EntityPosition(id="north")
+    position.geodetic.latitude = 59.01
+    position.geodetic.longitude = 18.0
+    index.update(position)
+    x, z = index.coordinates("north")
+    assert x == pytest.approx(0) and z == pytest.approx(1113.2, abs=1)
+    assert index.within_radius((0, 0), 1100) == []
+    assert index.within_radius((0, 0), 1200) == ["north"]
+
+
+def test_area_of_interest_only_gets_updates_inside_moving_region():
+    rti = make_client()
+    index = RTI.SpatialIndex(rti, cell_size=100)
+    received = []
+    area = index.subscribe_area((0, 0), 100, lambda position: received.append(position.id))
+    deliver(rti, RTI.channel.position, encode(local_position("inside", 50, 0)))
+    deliver(rti, RTI.channel.position, encode(local_position("outside", 500, 0)))
+    area.move((500, 0))
+    deliver(rti, RTI.channel.position, encode(local_position("inside", 50, 0)))
+    deliver(rti, RTI.channel.position, encode(local_position("outside", 500, 10)))
+    assert received == ["inside", "outside"]
+    assert area.entity_ids() == ["outside"]
+    index.unsubscribe_area(area)
+    deliver(rti, RTI.channel.position, encode(local_position("outside", 500, 0)))
+    assert received == ["inside", "outside"]
@@ -0,0 +1,137 @@
+# Minimal in-process stand-in for the RTI broker, speaking just enough of the
+# SocketCluster protocol (handshake, auth, subscribe, publish, ack) for client tests
+# that should run without a real broker. With binary=True it also accepts the binary
+# publish transport when a client asks for it in the handshake.
+
+import asyncio
+import base64
+import json
+import struct
+import threading
+from uuid import uuid4
+
+from websockets.asyncio.server import serve
+
+
+class StandinBroker:
+    def __init__(self, host="127.0.0.1", binary=False):
+        self.host = host
+        self.binary = binary
+        self.binary_connections = set()
+        self.port = None
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.subscribers = {}
+        self.received = []
+        self._started = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        if not self._started.wait(5):
+            raise Exception("Stand-in broker failed to start")
+        return self
+
+    def stop(self):
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+        if self.thread:
+            self.thread.join(5)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._serve())
+
+    async def _serve(self):
+        async with serve(self._handle, self.host, 0, max_size=None) as server:
+            self.server = server
+            self.port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await server.wait_closed()
+
+    async def _handle(self, connection):
+        try:
+            async for message in connection:
+                await self._receive(connection, message)
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(connection)
+            self.binary_connections.discard(connection)
+
+    async def _receive(self, connection, message):
+        if isinstance(message, bytes):
+            await self._receive_binary(message)
+            return
+        if message == "#2" or message == "":
+            return
+        packet = json.loads(message)
+        if isinstance(packet, list):
+            for item in packet:
+                await self._receive_packet(connection, item)
+        else:
+            await self._receive_packet(connection, packet)
+
+    async def _receive_packet(self, connection, packet):
+        self.received.append(packet)
+        event = packet.get("event")
+        data = packet.get("data")
+        cid = packet.get("cid")
+        if event == "#handshake":
+            handshake = {"id": str(uuid4()), "isAuthenticated": False, "pingTimeout": 20000}
+            if self.binary and data.get("binary"):
+                self.binary_connections.add(connection)
+                handshake["binary"] = True
+            await self._reply(connection, cid, handshake)
+        elif event == "auth":
+            await connection.send(json.dumps({"event": "#setAuthToken", "data": {"token": json.dumps(data)}}))
+        elif event == "#subscribe":
+            self.subscribers.setdefault(data["channel"], set()).add(connection)
+            await self._reply(connection, cid)
+        elif event == "#unsubscribe":
+            self.subscribers.get(data, set()).discard(connection)
+            await self._reply(connection, cid)
+        elif event == "#publish":
+            frame = json.dumps({"event": "#publish", "data": {"channel": data["channel"], "data": data["data"]}})
+            for subscriber in list(self.subscribers.get(data["channel"], ())):
+                await subscriber.send(frame)
+            await self._reply(connection, cid)
+        elif cid:
+            await self._reply(connection, cid, error=f"Unknown event {event}")
+
+    async def _receive_binary(self, message):
+        frame_type, channel_length = struct.unpack_from(">BH", message)
+        if frame_type == 2:
+            position = 3
+            while position < len(message):
+                length, = struct.unpack_from(">I", message, position)
+                await self._receive_binary(message[position + 4:position + 4 + length])
+                position += 4 + length
+            return
+        channel = message[3:3 + channel_length].decode("utf8")
+        payload = message[3 + channel_length:]
+        self.received.append({"binary": True, "channel": channel, "data": payload})
+        json_frame = None
+        for subscriber in list(self.subscribers.get(channel, ())):
+            if subscriber in self.binary_connections:
+                await subscriber.send(message)
+            else:
+                if json_frame is None:
+                    content = base64.b64encode(payload).decode("utf8")
+                    json_frame = json.dumps({"event": "#publish", "data": {"channel": channel, "data": content}})
+                await subscriber.send(json_frame)
+
+    async def _reply(self, connection, cid, data=None, error=None):
+        if not cid:
+            return
+        reply = {"rid": cid}
+        if data is not None:
+            reply["data"] = data
+        if error is not None:
+            reply["error"] = error
+        await connection.send(json.dumps(reply))